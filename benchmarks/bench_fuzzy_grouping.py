@@ -0,0 +1,79 @@
+# bench_fuzzy_grouping.py
+"""
+Measures fuzzy series grouping (title extraction + n-gram clustering) on
+synthetic episode names and reports time per name, so near-linear scaling can
+be checked up to 500k names:
+
+    python -m benchmarks.bench_fuzzy_grouping --sizes 10000,50000,100000,500000
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from typing import List
+
+from fuzzy_grouping import FuzzyTitleGrouper
+from title_parser import TitleParser
+
+_CONSONANTS = "bcdfghjklmnprstvwxz"
+_VOWELS = "aeiouy"
+_TAGS = ["720p", "1080p", "WEBRip", "x264", "x265-GalaxyTV", "HDTV", "[YIFY]", "(2019)", "BluRay", "AAC"]
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(rng.randint(2, 4)))
+
+
+def make_names(count: int, seed: int = 42) -> List[str]:
+    """Deterministic episode names; roughly one series per 5 names, with spelling variants."""
+    rng = random.Random(seed)
+    series = [" ".join(_word(rng) for _ in range(rng.randint(1, 4))) for _ in range(max(1, count // 5))]
+    names = []
+    for _ in range(count):
+        title = rng.choice(series)
+        roll = rng.random()
+        if roll < 0.1:
+            title += "s"
+        elif roll < 0.2:
+            title = "The " + title
+        sep = rng.choice([".", " ", "_"])
+        parts = title.split() + [f"S{rng.randint(1, 12):02d}E{rng.randint(1, 24):02d}"]
+        parts += rng.sample(_TAGS, rng.randint(0, 3))
+        names.append(sep.join(parts) + rng.choice([".mkv", ".mp4", ".avi"]))
+    return names
+
+
+def run(size: int, threshold: float) -> dict:
+    names = make_names(size)
+    parser = TitleParser()
+    t0 = time.perf_counter()
+    titles = parser.extract_many(names)
+    t1 = time.perf_counter()
+    counts = Counter(titles.values())
+    mapping = FuzzyTitleGrouper(threshold).cluster(counts)
+    t2 = time.perf_counter()
+    return {
+        "names": size,
+        "distinct_titles": len(counts),
+        "clusters": len(set(mapping.values())),
+        "extract_s": t1 - t0,
+        "cluster_s": t2 - t1,
+        "us_per_name": (t2 - t0) / size * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy series grouping.")
+    parser.add_argument("--sizes", default="10000,50000,100000,500000", help="Comma-separated name counts.")
+    parser.add_argument("--threshold", type=float, default=0.75, help="Jaccard similarity threshold.")
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'titles':>8} {'clusters':>8} {'extract s':>10} {'cluster s':>10} {'us/name':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        r = run(size, args.threshold)
+        print(f"{r['names']:>8} {r['distinct_titles']:>8} {r['clusters']:>8} "
+              f"{r['extract_s']:>10.2f} {r['cluster_s']:>10.2f} {r['us_per_name']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
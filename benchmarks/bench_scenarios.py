@@ -0,0 +1,205 @@
+# bench_scenarios.py
+"""
+End-to-end benchmarks of the sorter and renamer on generated trees (see
+tree_gen.py), with machine-readable results that can be compared between
+commits (see compare.py):
+
+    python -m benchmarks.bench_scenarios --sizes 1000,100000 --dirs /dev/shm,/var/tmp \\
+        --output results-$(git rev-parse --short HEAD).json
+
+Scenarios: "sort" (category sort into a destination), "group" (series-mode
+sort), "rename" (recursive mass rename), "keyword" (recursive keyword
+rename) and "undo" (undo of a sort). Each run gets a fresh tree and a fresh
+state directory (journal, caches, index) in its own subprocess, so no run
+benefits from an earlier one and the peak memory is that run's own. Only
+the operation itself is timed, not generating the tree or preparing the
+undo. Per-file logging is off, as in summary mode.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+from typing import Callable, List, Optional
+
+import psutil
+
+from benchmarks.tree_gen import TreeSpec, generate_tree
+
+SCENARIOS = ("sort", "group", "rename", "keyword", "undo")
+RESULTS_VERSION = 1
+_PROJECT = Path(__file__).resolve().parent.parent
+
+
+def _fs_type(path: Path) -> str:
+    """File system of 'path' ("tmpfs", "ext4", ...), from the longest matching mount point."""
+    path_str = str(path.resolve())
+    best, fs = "", "unknown"
+    for part in psutil.disk_partitions(all=True):
+        mount = part.mountpoint
+        if (path_str == mount or path_str.startswith(mount.rstrip(os.sep) + os.sep)) and len(mount) > len(best):
+            best, fs = mount, part.fstype
+    return fs
+
+
+def _git_commit() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_PROJECT, capture_output=True,
+                                text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=_PROJECT,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return result.stdout.strip() + ("-dirty" if dirty else "") if result.returncode == 0 else "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return psutil.Process().memory_info().peak_wset / 1048576  # type: ignore  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / 1048576
+
+
+# ----------------------------------------------------------------------
+# One run (in a subprocess)
+# ----------------------------------------------------------------------
+def _scenario(name: str, tree: Path) -> Callable[[], None]:
+    """Prepares scenario 'name' on 'tree' and returns the part to time."""
+    # Imported here: the state directory must be set before the modules open their stores.
+    from renamer import Renamer
+    from sorter import FileSorter
+
+    config = str(_PROJECT / "config.json")
+    dest = str(tree.parent / "sorted")
+    if name == "sort":
+        sorter = FileSorter(config)
+        return lambda: sorter.sort_directory(str(tree), dest)
+    if name == "group":
+        sorter = FileSorter(config)
+        return lambda: sorter.sort_directory(str(tree), dest, series_mode=True)
+    if name == "rename":
+        renamer = Renamer()
+        return lambda: renamer.mass_rename(str(tree), "", prefix="bench_", zero_padding=7, recursive=True)
+    if name == "keyword":
+        renamer = Renamer()
+        return lambda: renamer.rename_by_keyword(str(tree), "", replacements={"1080p": "720p", "_": " "},
+                                                 recursive=True)
+    if name == "undo":
+        sorter = FileSorter(config)
+        sorter.sort_directory(str(tree), dest)
+        return sorter.undo
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_one(scenario: str, entries: int, base_dir: Path, seed: int) -> dict:
+    """Runs one scenario in this process, on a tree generated under 'base_dir', and removes it again."""
+    import logging
+    logging.disable(logging.INFO)
+    work = Path(tempfile.mkdtemp(prefix="kp-bench-", dir=base_dir))
+    try:
+        os.environ["KP_FILE_MANAGER_HOME"] = str(work / "state")
+        tree = work / "tree"
+        t0 = time.perf_counter()
+        counts = generate_tree(tree, TreeSpec(entries, seed))
+        generate_s = time.perf_counter() - t0
+        timed = _scenario(scenario, tree)
+        t0 = time.perf_counter()
+        timed()
+        seconds = time.perf_counter() - t0
+        return {"scenario": scenario, "entries": entries, "fs": _fs_type(base_dir), "dir": str(base_dir),
+                "seconds": seconds, "entries_per_s": entries / seconds if seconds else None,
+                "peak_rss_mb": _peak_rss_mb(), "generate_s": generate_s, **counts}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _run_isolated(scenario: str, entries: int, base_dir: Path, seed: int) -> dict:
+    command = [sys.executable, "-m", "benchmarks.bench_scenarios", "--one", scenario, "--sizes", str(entries),
+               "--dirs", str(base_dir), "--seed", str(seed)]
+    result = subprocess.run(command, cwd=_PROJECT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{scenario} at {entries} entries in {base_dir} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# ----------------------------------------------------------------------
+# Suite
+# ----------------------------------------------------------------------
+def run_suite(scenarios: List[str], sizes: List[int], dirs: List[Path], repeat: int, seed: int) -> dict:
+    results = []
+    for base_dir in dirs:
+        for entries in sizes:
+            for scenario in scenarios:
+                runs = [_run_isolated(scenario, entries, base_dir, seed) for _ in range(repeat)]
+                times = [run["seconds"] for run in runs]
+                result = dict(runs[0])
+                result.update(seconds=median(times), min_seconds=min(times), max_seconds=max(times),
+                              repeat=repeat, entries_per_s=entries / median(times) if median(times) else None,
+                              peak_rss_mb=max(run["peak_rss_mb"] or 0 for run in runs) or None)
+                results.append(result)
+                print(f"{scenario:<8} {entries:>9} {result['fs']:<8} {result['seconds']:>9.2f} s "
+                      f"{result['entries_per_s'] or 0:>11.0f}/s {result['peak_rss_mb'] or 0:>8.0f} MiB",
+                      file=sys.stderr)
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def _default_dirs() -> List[str]:
+    dirs = []
+    if os.path.isdir("/dev/shm"):
+        dirs.append("/dev/shm")  # tmpfs
+    dirs.append("/var/tmp" if os.path.isdir("/var/tmp") else tempfile.gettempdir())  # Usually on disk.
+    return dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sort, rename and undo on generated trees.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios.")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma-separated entry counts.")
+    parser.add_argument("--dirs", default=",".join(_default_dirs()),
+                        help="Comma-separated folders to generate the trees in (e.g. a tmpfs and a disk).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement; the median is reported.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the tree generator.")
+    parser.add_argument("--output", help="Write the results as JSON to this file (default: stdout).")
+    parser.add_argument("--one", choices=SCENARIOS, help=argparse.SUPPRESS)  # A single run, used internally.
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    dirs = [Path(folder) for folder in args.dirs.split(",")]
+    if args.one:
+        print(json.dumps(run_one(args.one, sizes[0], dirs[0], args.seed)))
+        return
+    scenarios = [name.strip() for name in args.scenarios.split(",")]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    report = run_suite(scenarios, sizes, dirs, args.repeat, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
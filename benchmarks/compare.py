@@ -0,0 +1,77 @@
+# compare.py
+"""
+Compares two result files of bench_scenarios.py, e.g. before and after a
+change, and flags the measurements that got slower by more than a
+threshold. The exit status is 1 if any did, so it can gate a CI job:
+
+    python -m benchmarks.compare results-base.json results-head.json --threshold 0.10
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+Key = Tuple[str, int, str]  # (scenario, entries, file system)
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("version") != 1:
+        raise ValueError(f"{path}: unsupported results version {report.get('version')}")
+    return report
+
+
+def _by_key(report: dict) -> Dict[Key, dict]:
+    return {(r["scenario"], r["entries"], r["fs"]): r for r in report["results"]}
+
+
+def compare(base: dict, head: dict, threshold: float) -> Tuple[List[dict], List[Key]]:
+    """
+    Returns one row per measurement present in both reports (base and head
+    seconds, their ratio, peak memory) and the keys of those that are more
+    than 'threshold' (0.10 = 10%) slower in 'head'.
+    """
+    old, new = _by_key(base), _by_key(head)
+    rows, regressions = [], []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]["seconds"], new[key]["seconds"]
+        ratio = after / before if before else float("inf")
+        rows.append({"scenario": key[0], "entries": key[1], "fs": key[2], "base_s": before, "head_s": after,
+                     "ratio": ratio, "base_rss_mb": old[key].get("peak_rss_mb"),
+                     "head_rss_mb": new[key].get("peak_rss_mb")})
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base", help="Results of the reference commit.")
+    parser.add_argument("head", help="Results of the commit under test.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Slowdown (0.10 = 10%%) above which a measurement counts as a regression.")
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    for label, report in (("base", base), ("head", head)):
+        meta = report["meta"]
+        print(f"{label}: {meta['commit']}  {meta['timestamp']}  Python {meta['python']}  {meta['cpu_count']} CPU(s)")
+    if base["meta"].get("platform") != head["meta"].get("platform"):
+        print("warning: the results come from different platforms.")
+
+    rows, regressions = compare(base, head, args.threshold)
+    print(f"{'scenario':<8} {'entries':>9} {'fs':<8} {'base s':>9} {'head s':>9} {'change':>8} {'MiB':>13}")
+    for row in rows:
+        flag = "  <-- slower" if (row["scenario"], row["entries"], row["fs"]) in regressions else ""
+        memory = f"{row['base_rss_mb'] or 0:.0f}->{row['head_rss_mb'] or 0:.0f}"
+        print(f"{row['scenario']:<8} {row['entries']:>9} {row['fs']:<8} {row['base_s']:>9.2f} {row['head_s']:>9.2f} "
+              f"{(row['ratio'] - 1) * 100:>+7.1f}% {memory:>13}{flag}")
+    missing = set(_by_key(base)) ^ set(_by_key(head))
+    if missing:
+        print(f"{len(missing)} measurement(s) only in one of the files were skipped.")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# tree_gen.py
+"""
+Deterministic generator of realistic directory trees for the benchmarks:
+TV episodes and movies next to photos, music, documents and archives, some
+names repeated in several folders, nested folders, and file sizes from 1 KB
+to 1 GB. Files are sparse (truncated, never written), so a tree of a million
+entries with terabytes of apparent size fits on tmpfs. The same seed always
+gives the same tree:
+
+    python -m benchmarks.tree_gen /dev/shm/tree --entries 100000 --seed 42
+"""
+import argparse
+import math
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.bench_fuzzy_grouping import make_names
+
+# (weight, extensions) per kind of file; episode names are used for videos.
+_KINDS = [
+    (30, ["mkv", "mp4", "avi"]),
+    (25, ["jpg", "png", "jpeg", "gif"]),
+    (20, ["mp3", "flac", "ogg", "wav"]),
+    (15, ["pdf", "docx", "txt", "xlsx"]),
+    (5, ["zip", "7z", "tar.gz"]),
+    (5, ["dat", "iso", "bin"]),  # Unknown to the default rules: "Others".
+]
+# Typical size range (bytes, log-uniform) per kind, within 1 KB .. 1 GB.
+_SIZES = [(50 << 20, 1 << 30), (100 << 10, 8 << 20), (2 << 20, 60 << 20), (1 << 10, 5 << 20),
+          (1 << 20, 1 << 30), (1 << 10, 1 << 30)]
+_WORDS = ["holiday", "report", "final", "scan", "invoice", "draft", "track", "mix", "backup", "photo", "notes",
+          "summary", "budget", "live", "demo", "copy", "img", "doc", "clip", "session"]
+
+
+class TreeSpec:
+    """
+    Parameters of a generated tree. 'entries' counts files and folders.
+    'nested_share' of the files go into folders up to 'max_depth' levels
+    deep; 'duplicate_share' of the names are reused from an earlier file
+    (in another folder, as in real collections).
+    """
+
+    def __init__(self, entries: int, seed: int = 42, max_depth: int = 3, nested_share: float = 0.2,
+                 duplicate_share: float = 0.1, files_per_folder: int = 50):
+        self.entries = entries
+        self.seed = seed
+        self.max_depth = max_depth
+        self.nested_share = nested_share
+        self.duplicate_share = duplicate_share
+        self.files_per_folder = files_per_folder
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _size(rng: random.Random, kind: int) -> int:
+    low, high = _SIZES[kind]
+    return int(math.exp(rng.uniform(math.log(low), math.log(high))))
+
+
+def _name(rng: random.Random, kind: int, episodes: List[str], i: int) -> str:
+    ext = rng.choice(_KINDS[kind][1])
+    if kind == 0:
+        stem = os.path.splitext(episodes[i % len(episodes)])[0]
+    else:
+        stem = "_".join(rng.sample(_WORDS, rng.randint(1, 3))) + f"_{rng.randint(1, 9999):04d}"
+    return f"{stem}.{ext}"
+
+
+def generate_tree(root: Path, spec: TreeSpec) -> Dict[str, int]:
+    """
+    Creates the tree described by 'spec' in 'root' (which must not exist
+    yet) and returns its counts: files, folders, apparent bytes.
+    """
+    rng = random.Random(spec.seed)
+    root.mkdir(parents=True)
+    weights = [weight for weight, _ in _KINDS]
+    folder_count = max(0, int(spec.entries * spec.nested_share / max(1, spec.files_per_folder)))
+    file_count = spec.entries - folder_count
+    episodes = make_names(max(1, file_count // 3), seed=spec.seed)
+
+    # Folders first: nested chains under the root, named like series or albums.
+    folders: List[Path] = []
+    for i in range(folder_count):
+        parent = root
+        if folders and rng.random() < 0.5:
+            candidate = rng.choice(folders)
+            if len(candidate.relative_to(root).parts) < spec.max_depth:
+                parent = candidate
+        title = os.path.splitext(episodes[rng.randrange(len(episodes))])[0].split("S")[0].strip(" ._")
+        folder = parent / f"{title or 'folder'} {i}"
+        folder.mkdir()
+        folders.append(folder)
+
+    used: List[str] = []
+    taken: Dict[Path, set] = {}
+    apparent = 0
+    for i in range(file_count):
+        folder = rng.choice(folders) if folders and rng.random() < spec.nested_share else root
+        kind = rng.choices(range(len(_KINDS)), weights)[0]
+        if used and rng.random() < spec.duplicate_share:
+            name = rng.choice(used)
+        else:
+            name = _name(rng, kind, episodes, i)
+            used.append(name)
+        names = taken.setdefault(folder, set())
+        if name in names:
+            ext = "tar.gz" if name.endswith(".tar.gz") else name.rsplit(".", 1)[1]
+            name = f"{name[:-len(ext) - 1]} ({i}).{ext}"
+        names.add(name)
+        size = _size(rng, kind)
+        with open(folder / name, "wb") as f:
+            f.truncate(size)  # Sparse: no data blocks are written.
+        apparent += size
+    return {"files": file_count, "folders": folder_count, "apparent_bytes": apparent}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic directory tree.")
+    parser.add_argument("root", help="Folder to create (must not exist).")
+    parser.add_argument("--entries", type=int, default=1000, help="Files plus folders.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-depth", type=int, default=3)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    counts = generate_tree(Path(args.root), TreeSpec(args.entries, args.seed, args.max_depth))
+    print(f"{counts['files']} files, {counts['folders']} folders, "
+          f"{counts['apparent_bytes'] / (1 << 30):.1f} GiB apparent, in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
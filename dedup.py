@@ -0,0 +1,172 @@
+# dedup.py
+import hashlib
+import logging
+import mmap
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from scanner import ScanEntry
+
+POLICIES = ("skip", "hardlink", "quarantine")
+_MiB = 1024 * 1024
+
+
+def partial_digest(path: str, size: int, span: int) -> bytes:
+    """Hashes the first and last 'span' bytes of a file (the whole file if it is shorter than 2 * 'span')."""
+    digest = hashlib.blake2b(digest_size=16)
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if size <= 2 * span:
+            digest.update(_read_at(fd, 0, size))
+        else:
+            digest.update(_read_at(fd, 0, span))
+            digest.update(_read_at(fd, size - span, span))
+    finally:
+        os.close(fd)
+    return digest.digest()
+
+
+def full_digest(path: str) -> bytes:
+    """Hashes a whole file through a read-only memory map. Runs in worker processes."""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), 8 * _MiB):
+                    digest.update(view[offset:offset + 8 * _MiB])
+            finally:
+                view.release()
+    return digest.digest()
+
+
+def _read_at(fd: int, offset: int, count: int) -> bytes:
+    if hasattr(os, "pread"):
+        chunks = []
+        while count > 0:
+            chunk = os.pread(fd, count, offset)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+            count -= len(chunk)
+        return b"".join(chunks)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+class DuplicateFinder:
+    """
+    Finds files with identical content in three stages, each one only
+    looking at what the previous one could not rule out:
+
+    1. Size: files are bucketed by the size already known from the scan. A
+       file with a unique size has no duplicate and is never opened.
+    2. Head and tail: the first and last 'span' bytes of files with colliding
+       sizes are hashed (on threads). For files up to 2 * 'span' bytes this
+       covers the whole file and settles the question.
+    3. Full hash: the remaining candidates are hashed completely through
+       mmap, in a process pool so that several large files hash in parallel.
+
+    Hard links to one inode are read once and reported together with the
+    copies they match, not as duplicates of each other. Empty files are
+    ignored. 'bytes_hashed' tells how many of the 'bytes_total' bytes were
+    hashed; a file hashed in full counts with its size once, although its
+    head and tail were also read in stage 2.
+    """
+
+    def __init__(self, span: int = 64 * 1024, threads: int = 8, processes: Optional[int] = None):
+        self.span = span
+        self.threads = threads
+        self.processes = processes
+        self.bytes_total = 0
+        self.bytes_hashed = 0
+
+    def groups(self, files: List[ScanEntry]) -> List[List[ScanEntry]]:
+        """Returns groups of two or more entries with identical content, each in the order given."""
+        by_inode: Dict[Tuple[int, int], List[ScanEntry]] = {}
+        for entry in files:
+            if entry.is_file and entry.size > 0:
+                by_inode.setdefault((entry.dev, entry.inode), []).append(entry)
+        self.bytes_total = sum(links[0].size for links in by_inode.values())
+
+        by_size: Dict[int, List[List[ScanEntry]]] = {}
+        for links in by_inode.values():
+            by_size.setdefault(links[0].size, []).append(links)
+        candidates = [links for bucket in by_size.values() if len(bucket) > 1 for links in bucket]
+
+        order = {entry.path: i for i, entry in enumerate(files)}
+        groups = []
+        for same in self._refine(candidates):
+            group = [entry for links in same for entry in links]
+            groups.append(sorted(group, key=lambda e: order[e.path]))
+        return groups
+
+    def _refine(self, candidates: List[List[ScanEntry]]) -> List[List[List[ScanEntry]]]:
+        if not candidates:
+            return []
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            partial = list(pool.map(self._partial, candidates))
+        self.bytes_hashed += sum(min(links[0].size, 2 * self.span)
+                                 for links, digest in zip(candidates, partial) if digest is not None)
+        buckets: Dict[Tuple[int, bytes], List[List[ScanEntry]]] = {}
+        for links, digest in zip(candidates, partial):
+            if digest is not None:
+                buckets.setdefault((links[0].size, digest), []).append(links)
+
+        confirmed: List[List[List[ScanEntry]]] = []
+        survivors: List[List[ScanEntry]] = []
+        for (size, _), bucket in buckets.items():
+            if len(bucket) < 2:
+                continue
+            if size <= 2 * self.span:
+                confirmed.append(bucket)  # The partial hash already covered every byte.
+            else:
+                survivors.extend(bucket)
+        if not survivors:
+            return confirmed
+
+        full: Dict[Tuple[int, bytes], List[List[ScanEntry]]] = {}
+        paths = [str(links[0].path) for links in survivors]
+        for links, digest in zip(survivors, self._full_digests(paths)):
+            if digest is not None:
+                # Head and tail were counted in stage 2; only the rest of the file is new.
+                self.bytes_hashed += links[0].size - 2 * self.span
+                full.setdefault((links[0].size, digest), []).append(links)
+        confirmed.extend(bucket for bucket in full.values() if len(bucket) > 1)
+        return confirmed
+
+    def _partial(self, links: List[ScanEntry]) -> Optional[bytes]:
+        size = links[0].size
+        try:
+            digest = partial_digest(str(links[0].path), size, self.span)
+        except OSError as e:
+            logging.warning(f"Could not read {links[0].path} for duplicate detection: {e}")
+            return None
+        return digest
+
+    def _full_digests(self, paths: List[str]) -> List[Optional[bytes]]:
+        workers = min(len(paths), self.processes or os.cpu_count() or 1)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return self._map(pool, paths)
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            # Some environments cannot start processes; hashlib releases the GIL, so threads still help.
+            logging.info(f"Hashing on threads instead of processes: {e}")
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                return self._map(pool, paths)
+
+    def _map(self, pool: Executor, paths: List[str]) -> List[Optional[bytes]]:
+        futures = [pool.submit(full_digest, path) for path in paths]
+        results: List[Optional[bytes]] = []
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result())
+            except OSError as e:
+                logging.warning(f"Could not read {path} for duplicate detection: {e}")
+                results.append(None)
+        return results
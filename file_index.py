@@ -0,0 +1,225 @@
+# file_index.py
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from journal import JournalOp
+from scanner import ScanEntry
+from utils import get_state_dir
+
+INDEX_FILE = "file_index.sqlite"
+_COLUMNS = "path, parent, name, dev, inode, size, mtime, is_dir, category, title, rules, seen"
+_SQL_VARIABLES = 500  # Stays well below SQLite's limit on bound parameters.
+
+
+class IndexRow(NamedTuple):
+    path: str
+    parent: str
+    name: str
+    dev: int
+    inode: int
+    size: int
+    mtime: float
+    is_dir: bool
+    category: Optional[str]
+    title: str
+    rules: str      # Fingerprint of the rules that produced 'category' and 'title'.
+    seen: float     # When the item was first indexed.
+
+    def matches(self, entry: ScanEntry, rules: str) -> bool:
+        """True if 'entry' is the item indexed here, unchanged, and classified under the same rules."""
+        return (self.inode == entry.inode and self.size == entry.size and self.mtime == entry.mtime
+                and self.rules == rules)
+
+    def to_entry(self) -> ScanEntry:
+        return ScanEntry(Path(self.path), self.name, self.is_dir, self.size, self.mtime, self.dev, self.inode)
+
+
+def _subtree(root: str) -> Tuple[str, str]:
+    # Everything strictly below 'root' sorts between "root/" and "root0" ('0' follows the separator),
+    # which the primary key answers as a range scan without LIKE and its escaping problems.
+    root = root.rstrip(os.sep)
+    return root + os.sep, root + chr(ord(os.sep) + 1)
+
+
+class FileIndex:
+    """
+    SQLite catalog of everything sort_directory has placed: path, inode,
+    size, mtime, category and parsed title of each sorted item.
+
+    A later sort looks up the source folder once and reuses the category and
+    title of every entry that is unchanged (same inode, size and mtime, and
+    the same rules), so only new or modified entries are classified and
+    parsed. Grouping also finds earlier singletons of a title here instead of
+    walking the destination. Updates are queued and written in batched
+    transactions. Paths are absolute, so one index serves every folder.
+    """
+
+    def __init__(self, db_path: Path, batch_size: int = 10000, max_pending: int = 100000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, dev INTEGER, inode INTEGER,"
+                " size INTEGER, mtime REAL, is_dir INTEGER, category TEXT, title TEXT, rules TEXT, seen REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_title ON entries (title)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_seen ON entries (seen)")
+
+    # ------------------------------------------------------------------
+    # Updates (queued, written by flush())
+    # ------------------------------------------------------------------
+    def record(self, path: Path, st: os.stat_result, category: Optional[str], title: str, rules: str):
+        """Indexes the item now at 'path', keeping its first-seen time if it was already indexed."""
+        path_str = os.path.abspath(path)
+        row = (path_str, os.path.dirname(path_str), os.path.basename(path_str), st.st_dev, st.st_ino, st.st_size,
+               st.st_mtime, int(stat.S_ISDIR(st.st_mode)), category, title, rules, time.time())
+        self._queue("record", row)
+
+    def record_entry(self, entry: ScanEntry, category: Optional[str], title: str, rules: str):
+        """Like record(), for an entry that was just scanned."""
+        path_str = os.path.abspath(entry.path)
+        row = (path_str, os.path.dirname(path_str), entry.name, entry.dev, entry.inode, entry.size, entry.mtime,
+               int(entry.is_dir), category, title, rules, time.time())
+        self._queue("record", row)
+
+    def forget(self, path: Path):
+        self._queue("forget", (os.path.abspath(path),))
+
+    def move(self, old: Path, new: Path):
+        """Follows a move or rename of 'old', and of everything indexed below it, to 'new'."""
+        self._queue("move", (os.path.abspath(old), os.path.abspath(new)))
+
+    def record_undo(self, ops: Iterable[JournalOp]):
+        """Moves the rows of undone sort operations back to their original paths."""
+        for op in ops:
+            if op.op == "move":
+                self.move(op.dst, op.src)
+
+    def _queue(self, kind: str, args: tuple):
+        with self._lock:
+            self._pending.append((kind, args))
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes queued updates in order, one transaction per 'batch_size' updates."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            for offset in range(0, len(pending), self.batch_size):
+                batch = pending[offset:offset + self.batch_size]
+                try:
+                    with self._conn:
+                        start = 0
+                        # Consecutive updates of one kind go to SQLite together.
+                        while start < len(batch):
+                            kind = batch[start][0]
+                            end = start
+                            while end < len(batch) and batch[end][0] == kind:
+                                end += 1
+                            self._write(kind, [args for _, args in batch[start:end]])
+                            start = end
+                except (sqlite3.Error, UnicodeEncodeError) as e:
+                    logging.warning(f"Could not update file index {self.db_path}: {e}")
+
+    def _write(self, kind: str, rows: List[tuple]):
+        if kind == "record":
+            # An item indexed again keeps its first-seen time.
+            self._conn.executemany(
+                f"INSERT INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET dev = excluded.dev, inode = excluded.inode, size = excluded.size,"
+                " mtime = excluded.mtime, is_dir = excluded.is_dir, category = excluded.category,"
+                " title = excluded.title, rules = excluded.rules",
+                rows,
+            )
+        elif kind == "forget":
+            self._conn.executemany("DELETE FROM entries WHERE path = ?", rows)
+        else:
+            for old, new in rows:
+                low, high = _subtree(old)
+                self._conn.execute("DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)",
+                                   (new,) + _subtree(new))
+                self._conn.execute(
+                    "UPDATE entries SET path = ?, parent = ?, name = ? WHERE path = ?",
+                    (new, os.path.dirname(new), os.path.basename(new), old),
+                )
+                self._conn.execute(
+                    "UPDATE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?)"
+                    " WHERE path >= ? AND path < ?",
+                    (new, len(old) + 1, new, len(old) + 1, low, high),
+                )
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Queries (see queued updates only after flush())
+    # ------------------------------------------------------------------
+    def _rows(self, sql: str, params: tuple = ()) -> List[IndexRow]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM entries {sql}", params).fetchall()
+        return [IndexRow(path, parent, name, dev, inode, size, mtime, bool(is_dir), category, title, rules, seen)
+                for path, parent, name, dev, inode, size, mtime, is_dir, category, title, rules, seen in rows]
+
+    def folder(self, folder: Path) -> Dict[str, IndexRow]:
+        """Returns {name: row} for the items indexed directly inside 'folder'."""
+        return {row.name: row for row in self._rows("WHERE parent = ?", (os.path.abspath(folder),))}
+
+    def with_titles(self, root: Path, titles: Iterable[str]) -> Dict[str, List[IndexRow]]:
+        """Returns {title: rows} for the items below 'root' that were indexed with one of 'titles'."""
+        low, high = _subtree(os.path.abspath(root))
+        titles = list(titles)
+        result: Dict[str, List[IndexRow]] = {}
+        for i in range(0, len(titles), _SQL_VARIABLES):
+            chunk = titles[i:i + _SQL_VARIABLES]
+            marks = ", ".join("?" * len(chunk))
+            for row in self._rows(f"WHERE title IN ({marks}) AND path >= ? AND path < ?", (*chunk, low, high)):
+                result.setdefault(row.title, []).append(row)
+        return result
+
+    def category_counts(self, root: Optional[Path] = None) -> List[Tuple[str, int, int]]:
+        """Returns (category, items, total bytes) for the whole index or the items below 'root'."""
+        sql = "SELECT COALESCE(category, '(unsorted)'), COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        params: tuple = ()
+        if root is not None:
+            sql += " WHERE path >= ? AND path < ?"
+            params = _subtree(os.path.abspath(root))
+        with self._lock:
+            return self._conn.execute(sql + " GROUP BY 1 ORDER BY 2 DESC", params).fetchall()
+
+    def newest(self, limit: int = 20, root: Optional[Path] = None) -> List[IndexRow]:
+        """Returns the 'limit' most recently indexed items, newest first."""
+        if root is None:
+            return self._rows("ORDER BY seen DESC LIMIT ?", (limit,))
+        return self._rows("WHERE path >= ? AND path < ? ORDER BY seen DESC LIMIT ?",
+                          _subtree(os.path.abspath(root)) + (limit,))
+
+
+_indexes: Dict[Path, FileIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_file_index(path: Optional[Path] = None) -> FileIndex:
+    """Returns the process-wide FileIndex for 'path' (default: the state directory's index)."""
+    path = Path(path) if path else get_state_dir() / INDEX_FILE
+    key = path.resolve()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = FileIndex(path)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,78 @@
+# folder_cache.py
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from scanner import ScanEntry
+
+
+class FolderCache:
+    """
+    On-disk cache of folder classifications.
+
+    Rows are keyed by (device, inode), so a folder that was moved or renamed
+    keeps its entry. A row is only trusted while the folder's mtime is
+    unchanged. The extension histogram is stored next to the category, so a
+    cache hit can be re-classified under the current rules without reading
+    the folder again.
+
+    Note: a directory's mtime changes only when its direct children change.
+    Edits deeper in the tree keep the cached result until the folder itself
+    is touched.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, int], tuple] = {}
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS folders ("
+            " dev INTEGER NOT NULL, inode INTEGER NOT NULL, path TEXT, mtime REAL NOT NULL,"
+            " category TEXT, histogram TEXT NOT NULL, PRIMARY KEY (dev, inode))"
+        )
+        self._conn.commit()
+
+    def lookup(self, entry: ScanEntry) -> Optional[Dict[str, int]]:
+        """Returns the cached extension histogram if the folder is unchanged, else None."""
+        key = (entry.dev, entry.inode)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                row = (pending[1], pending[3])
+            else:
+                row = self._conn.execute(
+                    "SELECT mtime, histogram FROM folders WHERE dev = ? AND inode = ?", key
+                ).fetchone()
+        if row is None or row[0] != entry.mtime:
+            return None
+        return json.loads(row[1])
+
+    def store(self, entry: ScanEntry, category: Optional[str], histogram: Dict[str, int]):
+        with self._lock:
+            self._pending[(entry.dev, entry.inode)] = (str(entry.path), entry.mtime, category, json.dumps(histogram))
+
+    def flush(self):
+        """Writes pending rows in a single transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(dev, inode, *values) for (dev, inode), values in self._pending.items()]
+            self._pending.clear()
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO folders (dev, inode, path, mtime, category, histogram)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Could not update folder cache {self.db_path}: {e}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
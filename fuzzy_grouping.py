@@ -0,0 +1,129 @@
+# fuzzy_grouping.py
+import random
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+# Letters and digits of any script count; "Офис" and "東京" must not normalize to "".
+_NON_ALNUM_RE = re.compile(r"[\W_]+")
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def _normalize(title: str) -> str:
+    return _NON_ALNUM_RE.sub(" ", title.casefold()).strip()
+
+
+def _ngrams(text: str, n: int) -> frozenset:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return frozenset((padded,))
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+class FuzzyTitleGrouper:
+    """
+    Clusters near-duplicate titles ("The Office Us" / "The Office") by the
+    Jaccard similarity of their character n-grams.
+
+    Candidate pairs come from MinHash/LSH buckets: each title gets a MinHash
+    signature over its n-grams, split into bands, and only titles sharing a
+    band bucket are compared exactly. Dissimilar titles almost never share a
+    bucket, so the cost grows roughly linearly with the number of titles.
+    """
+
+    def __init__(self, threshold: float = 0.75, ngram: int = 3, num_perm: int = 64):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.ngram = ngram
+        self.num_perm = num_perm
+        rng = random.Random(num_perm)
+        self._hash_params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(_MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._vector_cache: Dict[str, Tuple[int, ...]] = {}
+
+    def cluster(self, title_counts: Dict[str, int]) -> Dict[str, str]:
+        """
+        Takes {title: number_of_items} and returns {title: representative_title}.
+        The representative of a cluster is its most common title (shortest on ties).
+        """
+        titles = list(title_counts)
+        parent = list(range(len(titles)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(a: int, b: int):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[rb] = ra
+
+        # Titles that normalize identically are merged without any set work. A title with
+        # nothing left after normalizing (only punctuation) stays on its own.
+        by_norm: Dict[str, int] = {}
+        gram_sets: List[frozenset] = []
+        records: List[int] = []
+        for i, title in enumerate(titles):
+            norm = _normalize(title)
+            gram_sets.append(_ngrams(norm, self.ngram))
+            if not norm:
+                continue
+            if norm in by_norm:
+                union(by_norm[norm], i)
+            else:
+                by_norm[norm] = i
+                records.append(i)
+
+        if self.threshold < 1.0:
+            self._join(records, gram_sets, union, find)
+
+        clusters: Dict[int, List[str]] = {}
+        for i, title in enumerate(titles):
+            clusters.setdefault(find(i), []).append(title)
+        mapping: Dict[str, str] = {}
+        for members in clusters.values():
+            rep = min(members, key=lambda t: (-title_counts[t], len(t), t))
+            for title in members:
+                mapping[title] = rep
+        return mapping
+
+    def _join(self, records: List[int], gram_sets: List[frozenset], union, find):
+        rows, bands = self._band_shape()
+        vectors = self._gram_vectors
+        buckets: Dict[tuple, List[int]] = {}
+        t = self.threshold
+        for x in records:
+            xs = gram_sets[x]
+            signature = list(map(min, zip(*[vectors(g) for g in xs])))
+            for band in range(bands):
+                key = (band, *signature[band * rows:(band + 1) * rows])
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [x]
+                    continue
+                for y in bucket:
+                    if find(y) == find(x):
+                        continue
+                    ys = gram_sets[y]
+                    inter = len(xs & ys)
+                    if inter >= t * (len(xs) + len(ys) - inter):
+                        union(y, x)
+                bucket.append(x)
+
+    def _band_shape(self) -> Tuple[int, int]:
+        # Widest bands that still catch a pair at the threshold with >= 99% probability.
+        for rows in range(8, 0, -1):
+            bands = self.num_perm // rows
+            if 1.0 - (1.0 - self.threshold ** rows) ** bands >= 0.99:
+                return rows, bands
+        return 1, self.num_perm
+
+    def _gram_vectors(self, gram: str) -> Tuple[int, ...]:
+        vector = self._vector_cache.get(gram)
+        if vector is None:
+            base = zlib.crc32(gram.encode("utf-8"))
+            vector = tuple((a * base + b) % _MERSENNE_PRIME for a, b in self._hash_params)
+            self._vector_cache[gram] = vector
+        return vector
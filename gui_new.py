@@ -1,16 +1,23 @@
 import sys
-import os
 import logging
-from pathlib import Path
+import time
+from typing import Callable, List, Optional
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QRadioButton, QButtonGroup,
-    QFileDialog, QMessageBox, QCheckBox, QSpinBox, QStackedWidget
+    QFileDialog, QMessageBox, QCheckBox, QSpinBox, QStackedWidget, QInputDialog, QProgressBar,
+    QTableView, QHeaderView, QAbstractItemView
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
 
 from sorter import FileSorter
 from renamer import Renamer
+from journal import open_journal
+from log_sink import LOG_FORMAT, LogSink, set_summary_mode
+from plan import Plan
+from plan_view import COLUMNS, PlanView
+from utils import CancelToken, Progress
 
 LOG_FILE = "operation_logs.txt"
 
@@ -44,6 +51,12 @@ class FileManagerWindow(QMainWindow):
         self.setWindowTitle("File Manager - Dark Mode")
         self.sorter = FileSorter()
         self.renamer = Renamer()
+        # (settings, plan) of the last preview, so that Run can execute it without scanning again.
+        self._preview = None
+        self._worker: Optional["OperationWorker"] = None
+        self._worker_cancelled = False
+        # Each operation starts a fresh log file; the previous ones are kept as operation_logs.txt.1, .2, ...
+        self.log_sink = LogSink(LOG_FILE, level=logging.INFO)
         self._init_ui()
         self._connect_signals()
 
@@ -63,6 +76,9 @@ class FileManagerWindow(QMainWindow):
         for i, btn in enumerate([self.radio_sort, self.radio_mass, self.radio_music, self.radio_keyword]):
             self.op_group.addButton(btn, i)
             op_layout.addWidget(btn)
+        op_layout.addStretch()
+        self.summary_log_check = QCheckBox("Summary Log (counts only)")
+        op_layout.addWidget(self.summary_log_check)
         main_layout.addLayout(op_layout)
 
         # Source folder input
@@ -94,6 +110,9 @@ class FileManagerWindow(QMainWindow):
         sort_layout = QHBoxLayout(sort_widget)
         self.series_mode_check = QCheckBox("Series Mode (Group by Title)")
         sort_layout.addWidget(self.series_mode_check)
+        self.fuzzy_check = QCheckBox("Fuzzy Title Matching")
+        self.fuzzy_check.setChecked(self.sorter.fuzzy_grouping)
+        sort_layout.addWidget(self.fuzzy_check)
         sort_layout.addStretch()
         self.stacked.addWidget(sort_widget)
 
@@ -155,18 +174,61 @@ class FileManagerWindow(QMainWindow):
         self.btn_preview = QPushButton("Preview")
         self.btn_run = QPushButton("Run")
         self.btn_undo = QPushButton("Undo")
+        self.btn_history = QPushButton("Undo History...")
         self.btn_quit = QPushButton("Quit")
         btn_layout.addWidget(self.btn_preview)
         btn_layout.addWidget(self.btn_run)
         btn_layout.addWidget(self.btn_undo)
+        btn_layout.addWidget(self.btn_history)
         btn_layout.addWidget(self.btn_quit)
         main_layout.addLayout(btn_layout)
 
+        # Preview of the planned operations
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Filter:"))
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Part of a source or target path")
+        filter_layout.addWidget(self.filter_edit)
+        self.conflicts_check = QCheckBox("Conflicts only")
+        filter_layout.addWidget(self.conflicts_check)
+        main_layout.addLayout(filter_layout)
+        self.preview_model = PlanTableModel(self)
+        self.preview_table = QTableView()
+        self.preview_table.setModel(self.preview_model)
+        # Fixed row heights and no resizing to contents: the view then only asks for the visible rows.
+        self.preview_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.preview_table.verticalHeader().setDefaultSectionSize(self.fontMetrics().height() + 6)
+        self.preview_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.preview_table.horizontalHeader().setStretchLastSection(True)
+        self.preview_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.preview_table.setSortingEnabled(True)
+        self.preview_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.preview_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.preview_table.setWordWrap(False)
+        main_layout.addWidget(self.preview_table, 1)
+
+        # Progress of the running operation
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.btn_cancel)
+        main_layout.addLayout(progress_layout)
+        self.status_label = QLabel("")
+        main_layout.addWidget(self.status_label)
+
     def _connect_signals(self):
         self.op_group.buttonClicked[int].connect(self._switch_operation)
         self.btn_preview.clicked.connect(self._on_preview)
         self.btn_run.clicked.connect(self._on_run)
         self.btn_undo.clicked.connect(self._on_undo)
+        self.btn_history.clicked.connect(self._on_undo_history)
+        self.btn_cancel.clicked.connect(self._on_cancel)
+        self.filter_edit.textChanged.connect(self._apply_filter)
+        self.conflicts_check.toggled.connect(self._apply_filter)
         self.btn_quit.clicked.connect(self.close) # type: ignore
         self.scramble_check.toggled.connect(self.scramble_mult_spin.setEnabled)
 
@@ -184,26 +246,47 @@ class FileManagerWindow(QMainWindow):
         self.stacked.setCurrentIndex(index)
 
     def _setup_logger(self):
-        if os.path.exists(LOG_FILE):
-            os.remove(LOG_FILE)
-        handler = logging.FileHandler(LOG_FILE, mode='w', encoding='utf-8')
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-        handler.setFormatter(formatter)
-        root = logging.getLogger()
-        root.handlers.clear()
-        root.addHandler(handler)
-        root.setLevel(logging.INFO)
-        return handler
-
-    def _cleanup_logger(self, handler):
-        root = logging.getLogger()
-        root.removeHandler(handler)
-        handler.close()
+        set_summary_mode(self.summary_log_check.isChecked())
+        return self.log_sink.start(new_file=True)
+
+    def _cleanup_logger(self, sink):
+        sink.stop()
 
     def _get_dest_path(self, source, dest):
         return dest if dest else source
 
+    def _plan_key(self):
+        return (
+            self.op_group.checkedId(), self.source_edit.text().strip(), self.dest_edit.text().strip(),
+            self.series_mode_check.isChecked(), self.fuzzy_check.isChecked(),
+            self.mass_ext_edit.text().strip(), self.mass_prefix_edit.text().strip(), self.mass_start_spin.value(),
+            self.mass_pad_spin.value(), self.scramble_check.isChecked(), self.scramble_mult_spin.value(),
+            self.key_ext_edit.text().strip(), self.keyword_edit.text().strip(), self.new_keyword_edit.text().strip(),
+        )
+
+    def _apply_filter(self):
+        self.preview_model.set_filter(self.filter_edit.text().strip(), self.conflicts_check.isChecked())
+
+    def _show_plan(self, plan: Optional[Plan]):
+        header = self.preview_table.horizontalHeader()
+        self.preview_model.set_plan(plan, header.sortIndicatorSection(),
+                                    header.sortIndicatorOrder() == Qt.DescendingOrder,
+                                    self.filter_edit.text().strip(), self.conflicts_check.isChecked())
+        view = self.preview_model.view
+        if view is not None:
+            self.preview_table.setColumnWidth(0, 260)
+            self.preview_table.setColumnWidth(1, 260)
+            self.preview_table.setColumnWidth(2, 120)
+            self.status_label.setText(f"{len(plan)} planned operation(s), {view.conflict_count()} conflict(s).")
+
+    def _take_preview_plan(self):
+        """Returns the last preview's plan if nothing was changed since, and forgets it."""
+        self._show_plan(None)
+        preview, self._preview = self._preview, None
+        if preview is not None and preview[0] == self._plan_key():
+            return preview[1]
+        return None
+
     def _on_preview(self):
         source = self.source_edit.text().strip()
         if not source:
@@ -212,41 +295,46 @@ class FileManagerWindow(QMainWindow):
         dest = self._get_dest_path(source, self.dest_edit.text().strip())
 
         op = self.op_group.checkedId()
-        handler = self._setup_logger()
-        logging.info("=== PREVIEW OPERATION ===")
-        try:
-            if op == 0:  # Sort
-                series_mode = self.series_mode_check.isChecked()
-                self.sorter.sort_directory(source, dest, dry_run=True, series_mode=series_mode)
-            elif op == 1:  # Mass Rename
-                self.renamer.mass_rename(
-                    folder=source,
-                    file_extension=self.mass_ext_edit.text().strip(),
-                    prefix=self.mass_prefix_edit.text().strip(),
-                    start_index=self.mass_start_spin.value(),
-                    zero_padding=self.mass_pad_spin.value(),
-                    dry_run=True,
-                    scramble=self.scramble_check.isChecked(),
-                    scramble_multiplier=self.scramble_mult_spin.value(),
-                )
-            elif op == 2:  # Music Rename
-                self.renamer.rename_music(folder=source, extensions=["mp3"], dry_run=True)
-            elif op == 3:  # Keyword Rename
-                keyword = self.keyword_edit.text().strip()
-                if not keyword:
-                    QMessageBox.warning(self, "Warning", "Please enter a keyword to search for.")
-                    self._cleanup_logger(handler)
-                    return
-                self.renamer.rename_by_keyword(
-                    folder=source,
-                    file_extension=self.key_ext_edit.text().strip(),
-                    keyword=keyword,
-                    new_keyword=self.new_keyword_edit.text().strip(),
-                    dry_run=True,
-                )
-        finally:
-            self._cleanup_logger(handler)
-        QMessageBox.information(self, "Preview Complete", f"Logs written to '{LOG_FILE}'.")
+        if op == 0:  # Sort
+            series_mode = self.series_mode_check.isChecked()
+            fuzzy = self.fuzzy_check.isChecked()
+            task = lambda: self.sorter.sort_directory(source, dest, dry_run=True, series_mode=series_mode,
+                                                      fuzzy=fuzzy)
+        elif op == 1:  # Mass Rename
+            kwargs = dict(
+                folder=source,
+                file_extension=self.mass_ext_edit.text().strip(),
+                prefix=self.mass_prefix_edit.text().strip(),
+                start_index=self.mass_start_spin.value(),
+                zero_padding=self.mass_pad_spin.value(),
+                dry_run=True,
+                scramble=self.scramble_check.isChecked(),
+                scramble_multiplier=self.scramble_mult_spin.value(),
+            )
+            task = lambda: self.renamer.mass_rename(**kwargs)
+        elif op == 2:  # Music Rename
+            task = lambda: self.renamer.rename_music(folder=source, dry_run=True)
+        else:  # Keyword Rename
+            keyword = self.keyword_edit.text().strip()
+            if not keyword:
+                QMessageBox.warning(self, "Warning", "Please enter a keyword to search for.")
+                return
+            kwargs = dict(
+                folder=source,
+                file_extension=self.key_ext_edit.text().strip(),
+                keyword=keyword,
+                new_keyword=self.new_keyword_edit.text().strip(),
+                dry_run=True,
+            )
+            task = lambda: self.renamer.rename_by_keyword(**kwargs)
+
+        key = self._plan_key()
+
+        def done(plan):
+            self._preview = (key, plan) if plan is not None else None
+            self._show_plan(plan)
+
+        self._start_worker("=== PREVIEW OPERATION ===", task, done)
 
     def _on_run(self):
         source = self.source_edit.text().strip()
@@ -256,84 +344,273 @@ class FileManagerWindow(QMainWindow):
         dest = self._get_dest_path(source, self.dest_edit.text().strip())
 
         op = self.op_group.checkedId()
-        handler = self._setup_logger()
-        logging.info("=== RUN OPERATION ===")
-        try:
+        if op == 3 and not self.keyword_edit.text().strip():
+            QMessageBox.warning(self, "Warning", "Please enter a keyword to search for.")
+            return
+        plan = self._take_preview_plan()
+        if plan is not None:
+            # Nothing changed since the preview: run its plan instead of scanning again.
             if op == 0:
-                series_mode = self.series_mode_check.isChecked()
-                self.sorter.sort_directory(source, dest, dry_run=False, series_mode=series_mode)
-            elif op == 1:
-                self.renamer.mass_rename(
-                    folder=source,
-                    file_extension=self.mass_ext_edit.text().strip(),
-                    prefix=self.mass_prefix_edit.text().strip(),
-                    start_index=self.mass_start_spin.value(),
-                    zero_padding=self.mass_pad_spin.value(),
-                    preserve_timestamps=True,
-                    dry_run=False,
-                    scramble=self.scramble_check.isChecked(),
-                    scramble_multiplier=self.scramble_mult_spin.value(),
-                )
-            elif op == 2:
-                self.renamer.rename_music(folder=source, extensions=["mp3"], preserve_timestamps=True, dry_run=False)
-            elif op == 3:
-                keyword = self.keyword_edit.text().strip()
-                if not keyword:
-                    QMessageBox.warning(self, "Warning", "Please enter a keyword to search for.")
-                    self._cleanup_logger(handler)
-                    return
-                self.renamer.rename_by_keyword(
-                    folder=source,
-                    file_extension=self.key_ext_edit.text().strip(),
-                    keyword=keyword,
-                    new_keyword=self.new_keyword_edit.text().strip(),
-                    preserve_timestamps=True,
-                    dry_run=False,
-                )
-        finally:
-            self._cleanup_logger(handler)
-        QMessageBox.information(self, "Operation Complete", f"Logs written to '{LOG_FILE}'.")
+                task = lambda: self.sorter.apply(plan)
+            else:
+                task = lambda: self.renamer.apply(plan, preserve_timestamps=True)
+        elif op == 0:
+            series_mode = self.series_mode_check.isChecked()
+            fuzzy = self.fuzzy_check.isChecked()
+            task = lambda: self.sorter.sort_directory(source, dest, dry_run=False, series_mode=series_mode,
+                                                      fuzzy=fuzzy)
+        elif op == 1:
+            kwargs = dict(
+                folder=source,
+                file_extension=self.mass_ext_edit.text().strip(),
+                prefix=self.mass_prefix_edit.text().strip(),
+                start_index=self.mass_start_spin.value(),
+                zero_padding=self.mass_pad_spin.value(),
+                preserve_timestamps=True,
+                dry_run=False,
+                scramble=self.scramble_check.isChecked(),
+                scramble_multiplier=self.scramble_mult_spin.value(),
+            )
+            task = lambda: self.renamer.mass_rename(**kwargs)
+        elif op == 2:
+            task = lambda: self.renamer.rename_music(folder=source, preserve_timestamps=True, dry_run=False)
+        else:
+            kwargs = dict(
+                folder=source,
+                file_extension=self.key_ext_edit.text().strip(),
+                keyword=self.keyword_edit.text().strip(),
+                new_keyword=self.new_keyword_edit.text().strip(),
+                preserve_timestamps=True,
+                dry_run=False,
+            )
+            task = lambda: self.renamer.rename_by_keyword(**kwargs)
+
+        def done(result):
+            title = "Operation Cancelled" if self._worker_cancelled else "Operation Complete"
+            QMessageBox.information(self, title, f"Logs written to '{LOG_FILE}'.")
+
+        self._start_worker("=== RUN OPERATION ===", task, done)
 
     def _on_undo(self):
         op = self.op_group.checkedId()
+        # Folders created by the sort are removed by the undo itself.
+        target = self.sorter if op == 0 else self.renamer
+
+        def failed(message):
+            logging.error(f"Undo failed: {message}")
+            QMessageBox.critical(self, "Undo Failed", "Some operations failed. Check logs.")
+
+        self._start_worker("=== UNDO OPERATION ===", target.undo, self._undo_done, failed, cancellable=False)
+
+    def _on_undo_history(self):
+        # Sessions come from the on-disk journal, so runs from before a restart can be undone too.
+        sessions = [s for s in open_journal().sessions() if s.pending]
+        if not sessions:
+            QMessageBox.information(self, "Undo History", "There is nothing left to undo.")
+            return
+        labels = [
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s.started))}  {s.kind}  "
+            f"({s.pending} undoable)  {s.description}"
+            for s in sessions
+        ]
+        label, ok = QInputDialog.getItem(self, "Undo History", "Session to undo:", labels, 0, False)
+        if not ok:
+            return
+        session = sessions[labels.index(label)]
+        count, ok = QInputDialog.getInt(self, "Undo History", "Number of most recent operations to undo:",
+                                        session.pending, 1, session.pending)
+        if not ok:
+            return
+
+        target = self.sorter if session.kind == "sort" else self.renamer
+        task = lambda: target.undo(last=count if count < session.pending else None, session=session.id)
+        self._start_worker(f"=== UNDO SESSION {session.id} ===", task, self._undo_done, cancellable=False)
+
+    def _undo_done(self, result):
+        # undo() returns (reverted, tried); operations it skipped stay pending in the journal.
+        reverted, total = result
+        if not total:
+            QMessageBox.information(self, "Undo", "There is nothing left to undo.")
+        elif reverted < total:
+            QMessageBox.warning(self, "Undo Incomplete",
+                                f"{reverted} of {total} operation(s) reverted; the others are still pending.\n"
+                                f"Logs written to '{LOG_FILE}'.")
+        else:
+            QMessageBox.information(self, "Undo Complete", f"{reverted} of {total} operation(s) reverted.")
+
+    # ------------------------------------------------------------------
+    # Background operations
+    # ------------------------------------------------------------------
+    def _start_worker(self, banner: str, task: Callable[[], object], on_done: Callable[[object], None],
+                      on_failed: Optional[Callable[[str], None]] = None, cancellable: bool = True):
+        """Runs 'task' on an OperationWorker; the window stays responsive and shows its progress."""
         handler = self._setup_logger()
-        logging.info("=== UNDO OPERATION ===")
-        success = True
-        try:
-            if op == 0:
-                self.sorter.undo()
-                dest_path = self._get_dest_path(self.source_edit.text().strip(), self.dest_edit.text().strip())
-                if dest_path:
-                    self._remove_empty_dirs(Path(dest_path))
-            else:
-                self.renamer.undo()
-        except Exception as e:
-            success = False
-            logging.error(f"Undo failed: {e}")
-        finally:
+        logging.info(banner)
+        self._worker_cancelled = False
+        worker = OperationWorker(task, [self.sorter, self.renamer], self)
+        worker.progress.connect(self._show_progress)
+
+        def finish():
             self._cleanup_logger(handler)
-        if success:
-            QMessageBox.information(self, "Undo Complete", "All operations undone successfully.")
-        else:
-            QMessageBox.critical(self, "Undo Failed", "Some operations failed. Check logs.")
+            self._worker = None
+            self._set_busy(False)
+
+        def done(result):
+            finish()
+            on_done(result)
+
+        def failed(message):
+            finish()
+            if on_failed is not None:
+                on_failed(message)
+            else:
+                QMessageBox.critical(self, "Operation Failed", f"{message}\nLogs written to '{LOG_FILE}'.")
+
+        worker.succeeded.connect(done)
+        worker.failed.connect(failed)
+        self._worker = worker
+        self._set_busy(True, cancellable)
+        worker.start()
+
+    def _on_cancel(self):
+        if self._worker is not None:
+            self._worker_cancelled = True
+            self._worker.cancel()
+            self.btn_cancel.setEnabled(False)
+            self.status_label.setText("Cancelling after the items in progress...")
+
+    def _set_busy(self, busy: bool, cancellable: bool = False):
+        for button in (self.btn_preview, self.btn_run, self.btn_undo, self.btn_history):
+            button.setEnabled(not busy)
+        self.btn_cancel.setEnabled(busy and cancellable)
+        self.progress_bar.setRange(0, 0 if busy else 1)  # Busy indicator until the first total is known.
+        self.progress_bar.setValue(0)
+        self.status_label.setText("Working..." if busy else "")
+
+    def _show_progress(self, snap: dict):
+        if snap["total"]:
+            self.progress_bar.setRange(0, snap["total"])
+            self.progress_bar.setValue(min(snap["done"], snap["total"]))
+        text = f"{snap['phase'].capitalize()}: {snap['scanned']} scanned, {snap['done']}"
+        if snap["total"]:
+            text += f"/{snap['total']}"
+        text += " done"
+        if snap["bytes"]:
+            text += f", {snap['bytes'] / 1048576:.1f} MiB"
+        if snap["eta"] is not None:
+            text += f", about {int(snap['eta'])} s left"
+        if not self._worker_cancelled:
+            self.status_label.setText(text)
+
+    def closeEvent(self, event):
+        if self._worker is not None:
+            # Let the items in flight finish so the journal matches what is on disk.
+            self._worker.cancel()
+            self._worker.wait()
+        self.log_sink.close()
+        super().closeEvent(event)
+
+class PlanTableModel(QAbstractTableModel):
+    """
+    Table model over a PlanView. Cells are formatted when the view asks for
+    them, i.e. only for the rows on screen; sorting and filtering reorder the
+    view's index array instead of any widgets.
+    """
+    CONFLICT_COLOR = QColor("#ffb347")
 
-    def _remove_empty_dirs(self, parent_dir: Path):
-        if not parent_dir.exists() or not parent_dir.is_dir():
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.view: Optional[PlanView] = None
+
+    def set_plan(self, plan: Optional[Plan], sort_column: int = -1, descending: bool = False, text: str = "",
+                 conflicts_only: bool = False):
+        self.beginResetModel()
+        self.view = PlanView(plan) if plan is not None else None
+        if self.view is not None and (sort_column >= 0 or descending or text or conflicts_only):
+            self.view.arrange(sort_column, descending, text, conflicts_only)
+        self.endResetModel()
+
+    def set_filter(self, text: str, conflicts_only: bool):
+        if self.view is None:
+            return
+        self.beginResetModel()
+        self.view.set_filter(text, conflicts_only)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.view is None else len(self.view)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self.view is None:
+            return None
+        if role == Qt.DisplayRole:
+            return self.view.cell(index.row(), index.column())
+        if role == Qt.ToolTipRole:
+            return self.view.full_path(index.row(), index.column())
+        if role == Qt.ForegroundRole and self.view.is_conflict(index.row()):
+            return self.CONFLICT_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self.view is None:
             return
-        for root, dirs, files in os.walk(parent_dir, topdown=False):
-            if not files and not dirs:
-                try:
-                    os.rmdir(root)
-                    logging.info(f"Removed empty folder: {root}")
-                except Exception as e:
-                    logging.warning(f"Could not remove {root}: {e}")
+        self.beginResetModel()
+        self.view.sort(column, order == Qt.DescendingOrder)
+        self.endResetModel()
+
+class OperationWorker(QThread):
+    """
+    Runs one sorter or renamer call off the UI thread. The call's progress is
+    sent through 'progress' at most ten times a second, and cancel() sets the
+    CancelToken that FileSorter and Renamer check between items. 'succeeded'
+    carries the call's result; 'failed' the message of an unexpected error.
+    """
+    progress = pyqtSignal(dict)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, task: Callable[[], object], targets: List[object], parent=None):
+        super().__init__(parent)
+        self.task = task
+        self.targets = targets
+        self.token = CancelToken()
+
+    def cancel(self):
+        self.token.cancel()
+
+    def run(self):
+        tracker = Progress(self.progress.emit, interval=0.1)
+        for target in self.targets:
+            target.cancel_token = self.token  # type: ignore
+            target.progress = tracker  # type: ignore
+        try:
+            result = self.task()
+        except Exception as e:
+            logging.exception("Operation failed")
+            self.failed.emit(str(e))
+            return
+        finally:
+            for target in self.targets:
+                target.cancel_token = None  # type: ignore
+                target.progress = None  # type: ignore
+        self.succeeded.emit(result)
 
 def main():
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
     app = QApplication(sys.argv)
     app.setStyleSheet(DARK_STYLE)
     window = FileManagerWindow()
-    window.resize(700, 300)
+    window.resize(900, 600)
     window.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,181 @@
+# io_scheduler.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Tuple
+
+DeviceKey = Tuple[int, int]
+
+
+class _Lane:
+    """One queue plus worker threads for a (source device, destination device) pair."""
+
+    def __init__(self, key: DeviceKey, initial: int, minimum: int, maximum: int, latency_tolerance: float):
+        self.key = key
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.cond = threading.Condition()
+        self.queue: Deque[tuple] = deque()
+        self.threads: List[threading.Thread] = []
+        self.active = 0
+        self.closed = False
+
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.first_start = 0.0
+        self.last_finish = 0.0
+
+        self._window_count = 0
+        self._window_latency = 0.0
+        self._baseline_latency = float("inf")
+
+    def submit(self, fn: Callable, args: tuple, nbytes: int) -> Future:
+        future: Future = Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("cannot submit to a scheduler that was shut down")
+            self.queue.append((future, fn, args, nbytes))
+            if len(self.threads) < self.limit and self.active + len(self.queue) > len(self.threads):
+                thread = threading.Thread(target=self._work, name=f"io-lane-{self.key[0]}-{self.key[1]}", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.cond.notify()
+        return future
+
+    def close(self, wait: bool):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if wait:
+            for thread in list(self.threads):
+                thread.join()
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not (self.queue and self.active < self.limit):
+                    if self.closed and not self.queue:
+                        return
+                    self.cond.wait()
+                future, fn, args, nbytes = self.queue.popleft()
+                self.active += 1
+                if not self.first_start:
+                    self.first_start = time.perf_counter()
+            if not future.set_running_or_notify_cancel():
+                with self.cond:
+                    self.active -= 1
+                    self.cond.notify()
+                continue
+            started = time.perf_counter()
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                ok = False
+                future.set_exception(e)
+            else:
+                ok = True
+                future.set_result(result)
+            finished = time.perf_counter()
+            with self.cond:
+                self.active -= 1
+                self.last_finish = finished
+                if ok:
+                    self.completed += 1
+                    self.bytes += nbytes
+                else:
+                    self.failed += 1
+                self.latency_total += finished - started
+                self._observe(finished - started)
+                # One slot was freed; waking a single waiter avoids a thundering herd.
+                self.cond.notify()
+
+    def _observe(self, latency: float):
+        # Latency-driven AIMD, evaluated once per window of completions: back
+        # off multiplicatively when latency climbs well above the best seen so
+        # far (the device is saturated), otherwise grow by one while work is queued.
+        self._window_count += 1
+        self._window_latency += latency
+        if self._window_count < max(4, self.limit):
+            return
+        average = self._window_latency / self._window_count
+        self._window_count = 0
+        self._window_latency = 0.0
+        self._baseline_latency = min(self._baseline_latency, average)
+        if average > self._baseline_latency * self.latency_tolerance and self.limit > self.minimum:
+            self.limit = max(self.minimum, int(self.limit * 0.75))
+        elif self.queue and self.limit < self.maximum:
+            self.limit += 1
+            if len(self.threads) < self.limit:
+                thread = threading.Thread(target=self._work, name=f"io-lane-{self.key[0]}-{self.key[1]}", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.cond:
+            elapsed = (self.last_finish - self.first_start) if self.first_start and self.last_finish else 0.0
+            done = self.completed + self.failed
+            return {
+                "source_device": self.key[0],
+                "destination_device": self.key[1],
+                "completed": self.completed,
+                "failed": self.failed,
+                "bytes": self.bytes,
+                "ops_per_sec": self.completed / elapsed if elapsed > 0 else 0.0,
+                "bytes_per_sec": self.bytes / elapsed if elapsed > 0 else 0.0,
+                "avg_latency_ms": self.latency_total / done * 1000 if done else 0.0,
+                "concurrency": self.limit,
+                "queued": len(self.queue),
+            }
+
+
+class IOScheduler:
+    """
+    Runs file moves on per-device-pair lanes instead of one fixed pool.
+
+    Tasks are keyed by (source st_dev, destination st_dev). Same-device moves
+    are metadata-only renames and start with a wide worker budget; cross-device
+    moves copy data and start narrow so spinning disks do not thrash. Each
+    lane then adjusts its own concurrency from the latency it observes.
+    """
+
+    def __init__(self, same_device: Tuple[int, int] = (16, 64), cross_device: Tuple[int, int] = (2, 8),
+                 latency_tolerance: float = 2.0):
+        self.same_device = same_device
+        self.cross_device = cross_device
+        self.latency_tolerance = latency_tolerance
+        self._lanes: Dict[DeviceKey, _Lane] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: DeviceKey, fn: Callable, *args, nbytes: int = 0) -> Future:
+        lane = self._lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(key)
+                if lane is None:
+                    initial, maximum = self.same_device if key[0] == key[1] else self.cross_device
+                    lane = _Lane(key, min(initial, maximum), 1, maximum, self.latency_tolerance)
+                    self._lanes[key] = lane
+        return lane.submit(fn, args, nbytes)
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return [lane.stats() for lane in lanes]
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.close(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
@@ -0,0 +1,346 @@
+# journal.py
+import atexit
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from utils import get_state_dir
+
+JOURNAL_FILE = "journal.jsonl"
+# A journal opened above this size is compacted first (see Journal.compact()).
+COMPACT_BYTES = 8 * 1024 * 1024
+MAX_SESSIONS = 500
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+class JournalOp(NamedTuple):
+    session: str
+    seq: int
+    op: str                                 # "move", "rename", "mkdir" or "hardlink"
+    src: Path                               # where the item was before the operation
+    dst: Path                               # where the operation put it
+    ts: float
+    times: Optional[Tuple[float, float]]    # (atime, mtime) to restore on undo, if preserved
+
+
+class SessionInfo(NamedTuple):
+    id: str
+    kind: str
+    started: float
+    info: dict
+    operations: int
+    undone: int
+
+    @property
+    def pending(self) -> int:
+        return self.operations - self.undone
+
+    @property
+    def description(self) -> str:
+        return ", ".join(f"{key}={value}" for key, value in self.info.items())
+
+
+class Journal:
+    """
+    Append-only JSON-lines log of every move and rename, kept in the state
+    directory so that undo still works after a restart or a crash.
+
+    Callers never wait for the disk: records are queued in memory and a
+    background thread writes them in batches, with a single fsync per batch
+    (group commit). flush() blocks until everything queued so far is
+    durable. A crash loses at most the last 'commit_interval' seconds of
+    records, and a torn last line is skipped when the journal is read.
+
+    If a batch cannot be written, the error is kept: every later append()
+    and flush() raises it, since undo cannot be trusted once records are
+    missing.
+    """
+
+    def __init__(self, path: Path, commit_interval: float = 0.05):
+        self.path = path
+        self.commit_interval = commit_interval
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        self._cond = threading.Condition()
+        self._buffer: List[dict] = []
+        self._queued = 0
+        self._durable = 0
+        self._failed = 0
+        self._error: Optional[OSError] = None
+        self._io_lock = threading.Lock()  # Held while writing, so compact() can swap the file.
+        self._flush_requested = False
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def append(self, record: dict):
+        # Serializing happens on the writer thread, off the callers' path.
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"journal {self.path} is closed")
+            self._raise_error()
+            self._buffer.append(record)
+            self._queued += 1
+            if len(self._buffer) == 1:
+                self._cond.notify_all()
+
+    def flush(self):
+        """Waits until every record appended so far has been written and fsync'ed."""
+        with self._cond:
+            target = self._queued
+            if self._durable + self._failed < target:
+                self._flush_requested = True
+                self._cond.notify_all()
+                while self._durable + self._failed < target and self._writer.is_alive():
+                    self._cond.wait()
+            self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise OSError(self._error.errno, f"Journal {self.path} could not be written, "
+                                             f"undo history is incomplete: {self._error.strerror}")
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        os.close(self._fd)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                # Give concurrent writers a moment to join this batch.
+                if not (self._flush_requested or self._closed):
+                    self._cond.wait(self.commit_interval)
+                batch, self._buffer = self._buffer, []
+                self._flush_requested = False
+            error = None
+            try:
+                data = "".join([_encoder.encode(record) + "\n" for record in batch]).encode("utf-8", "surrogateescape")
+                with self._io_lock:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(self._fd, view):]
+                    os.fsync(self._fd)
+            except OSError as e:
+                logging.error(f"Could not write {len(batch)} record(s) to journal {self.path}: {e}")
+                error = e
+            with self._cond:
+                if error is None:
+                    self._durable += len(batch)
+                else:
+                    self._failed += len(batch)
+                    self._error = self._error or error
+                self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def _load(self) -> Tuple[Dict[str, dict], List[dict], Set[Tuple[str, int]]]:
+        # Operations stay raw records here: building Paths for a long journal
+        # costs far more than parsing it, so only the selected ones get converted.
+        self.flush()
+        return self._read()
+
+    def _read(self) -> Tuple[Dict[str, dict], List[dict], Set[Tuple[str, int]]]:
+        sessions: Dict[str, dict] = {}
+        ops: List[dict] = []
+        undone: Set[Tuple[str, int]] = set()
+        try:
+            f = open(self.path, "r", encoding="utf-8", errors="surrogateescape")
+        except FileNotFoundError:
+            return sessions, ops, undone
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    kind = record["t"]
+                    if kind == "op":
+                        ops.append(record)
+                    elif kind == "session":
+                        sessions[record["id"]] = record
+                    elif kind == "undone":
+                        undone.update((record["s"], n) for n in record["n"])
+                except (ValueError, KeyError, TypeError):
+                    continue  # Torn or foreign line.
+        return sessions, ops, undone
+
+    def sessions(self) -> List[SessionInfo]:
+        """Lists journaled sessions, newest first."""
+        sessions, ops, undone = self._load()
+        counts: Dict[str, List[int]] = {sid: [0, 0] for sid in sessions}
+        for record in ops:
+            count = counts.setdefault(record["s"], [0, 0])
+            count[0] += 1
+            if (record["s"], record["n"]) in undone:
+                count[1] += 1
+        result = []
+        for sid, (total, done) in counts.items():
+            header = sessions.get(sid, {})
+            result.append(SessionInfo(sid, header.get("kind", "?"), header.get("ts", 0.0), header.get("info", {}),
+                                      total, done))
+        result.sort(key=lambda s: s.started, reverse=True)
+        return result
+
+    def pending(self, kind: Optional[str] = None, sessions: Optional[Iterable[str]] = None,
+                last: Optional[int] = None) -> List[JournalOp]:
+        """
+        Returns operations that have not been undone yet, oldest first.
+
+        Only operations from sessions of 'kind' and from the given 'sessions'
+        are considered. 'last' keeps the N most recent of those; without it,
+        and without explicit sessions, only the most recent session is used.
+        """
+        headers, ops, undone = self._load()
+        wanted = set(sessions) if sessions is not None else None
+        result = [
+            record for record in ops
+            if (record["s"], record["n"]) not in undone
+            and (wanted is None or record["s"] in wanted)
+            and (kind is None or headers.get(record["s"], {}).get("kind") == kind)
+        ]
+        if last is not None:
+            result = result[-last:] if last > 0 else []
+        elif wanted is None and result:
+            latest = result[-1]["s"]
+            result = [record for record in result if record["s"] == latest]
+        return [_to_op(record) for record in result]
+
+    def compact(self, max_sessions: int = MAX_SESSIONS) -> int:
+        """
+        Rewrites the journal without the sessions that were undone completely,
+        and without all but the 'max_sessions' most recent ones, so reading it
+        stays fast. Returns how many sessions were dropped. The new file
+        replaces the old one atomically; records appended meanwhile go to it.
+        """
+        self.flush()
+        with self._io_lock:
+            headers, ops, undone = self._read()
+            pending: Dict[str, int] = {}
+            for record in ops:
+                if (record["s"], record["n"]) not in undone:
+                    pending[record["s"]] = pending.get(record["s"], 0) + 1
+            sessions = set(headers) | {record["s"] for record in ops}
+            keep = sorted(pending, key=lambda sid: headers.get(sid, {}).get("ts", 0.0), reverse=True)[:max_sessions]
+            dropped = len(sessions) - len(keep)
+            if not dropped:
+                return 0
+            kept = set(keep)
+            records: List[dict] = [header for sid, header in headers.items() if sid in kept]
+            records += [record for record in ops if record["s"] in kept]
+            done: Dict[str, List[int]] = {}
+            for sid, seq in undone:
+                if sid in kept:
+                    done.setdefault(sid, []).append(seq)
+            now = time.time()
+            records += [{"t": "undone", "s": sid, "n": sorted(seqs), "ts": now} for sid, seqs in done.items()]
+
+            temp = self.path.with_name(f".{self.path.name}.{secrets.token_hex(4)}.tmp")
+            data = "".join([_encoder.encode(record) + "\n" for record in records]).encode("utf-8", "surrogateescape")
+            try:
+                with open(temp, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp, self.path)
+            except OSError:
+                try:
+                    os.unlink(temp)
+                except OSError:
+                    pass
+                raise
+            old, self._fd = self._fd, os.open(self.path, os.O_WRONLY | os.O_APPEND | getattr(os, "O_BINARY", 0))
+            os.close(old)
+        logging.info(f"Compacted journal {self.path}: dropped {dropped} session(s), kept {len(keep)}.")
+        return dropped
+
+    def mark_undone(self, ops: Iterable[JournalOp]):
+        by_session: Dict[str, List[int]] = {}
+        for op in ops:
+            by_session.setdefault(op.session, []).append(op.seq)
+        now = time.time()
+        for sid, seqs in by_session.items():
+            self.append({"t": "undone", "s": sid, "n": seqs, "ts": now})
+
+
+def _to_op(record: dict) -> JournalOp:
+    times = record.get("times")
+    return JournalOp(record["s"], record["n"], record["op"], Path(record["src"]), Path(record["dst"]), record["ts"],
+                     tuple(times) if times else None)
+
+
+class JournalSession:
+    """
+    Hands out sequence numbers for one sort or rename run and writes its
+    operations to 'journal'. The session header is only written with the
+    first operation, so runs that change nothing leave no trace. With no
+    journal, operations are still returned for in-memory undo.
+    """
+
+    def __init__(self, journal: Optional[Journal], kind: str, **info):
+        self.journal = journal
+        self.kind = kind
+        self.info = {key: str(value) for key, value in info.items()}
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def record(self, op: str, src: Path, dst: Path, times: Optional[Tuple[float, float]] = None) -> JournalOp:
+        now = time.time()
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+        entry = JournalOp(self.id, seq, op, src, dst, now, times)
+        if self.journal is not None:
+            if seq == 0:
+                self.journal.append({"t": "session", "id": self.id, "kind": self.kind, "ts": now, "info": self.info})
+            record = {"t": "op", "s": self.id, "n": seq, "op": op, "src": str(src), "dst": str(dst), "ts": now}
+            if times is not None:
+                record["times"] = list(times)
+            self.journal.append(record)
+        return entry
+
+
+_journals: Dict[Path, Journal] = {}
+_journals_lock = threading.Lock()
+
+
+def open_journal(path: Optional[Path] = None) -> Journal:
+    """Returns the process-wide Journal for 'path' (default: the state directory's journal)."""
+    path = Path(path) if path else get_state_dir() / JOURNAL_FILE
+    key = path.resolve()
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = Journal(path)
+            _journals[key] = journal
+            try:
+                if os.path.getsize(path) > COMPACT_BYTES:
+                    journal.compact()
+            except OSError as e:
+                logging.warning(f"Could not compact journal {path}: {e}")
+        return journal
+
+
+@atexit.register
+def _close_journals():
+    with _journals_lock:
+        journals = list(_journals.values())
+        _journals.clear()
+    for journal in journals:
+        journal.close()
+
@@ -0,0 +1,175 @@
+# log_sink.py
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import List, Optional
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Per-file lines ("Renamed: a -> b", "Undo move: ...") go to this child of the
+# root logger, so that summary mode can drop them before they are formatted.
+item_log = logging.getLogger("kp_file_manager.items")
+
+
+def set_summary_mode(enabled: bool):
+    """
+    In summary mode operations only log their aggregated counts: the
+    per-file lines of item_log are discarded by a level check, before their
+    message is even built.
+    """
+    item_log.setLevel(logging.WARNING if enabled else logging.NOTSET)
+
+
+def summary_mode() -> bool:
+    return item_log.level >= logging.WARNING
+
+
+class _BatchedWrites:
+    """
+    Handler mixin that keeps formatted lines in memory and writes them with a
+    single write() and flush() per batch: when 'batch_size' lines are
+    waiting, on errors, and whenever the queue feeding the handler runs dry.
+    """
+    batch_size = 1000
+    terminator = "\n"
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self._buffer.append(self.format(record) + self.terminator)  # type: ignore
+        except Exception:
+            self.handleError(record)  # type: ignore
+            return
+        if len(self._buffer) >= self.batch_size or record.levelno >= logging.ERROR:
+            self.flush()
+
+    def flush(self):
+        self.acquire()  # type: ignore
+        try:
+            if self._buffer:
+                text = "".join(self._buffer)
+                self._buffer = []
+                self._write(text)
+            if self.stream is not None:  # type: ignore
+                self.stream.flush()  # type: ignore
+        finally:
+            self.release()  # type: ignore
+
+    def _write(self, text: str):
+        self.stream.write(text)  # type: ignore
+
+
+class BatchedStreamHandler(_BatchedWrites, logging.StreamHandler):
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self._buffer: List[str] = []
+
+
+class BatchedRotatingFileHandler(_BatchedWrites, logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler with batched writes; the size limit is checked once per batch."""
+
+    def __init__(self, filename: str, max_bytes: int = 0, backup_count: int = 0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self._buffer: List[str] = []
+
+    def _write(self, text: str):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and 0 < self.stream.tell() and self.stream.tell() + len(text) >= self.maxBytes:
+            self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+        self.stream.write(text)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message in the logging thread so the
+    # record can be pickled. The queue stays in this process, so the record is
+    # passed as-is and its message is built on the listener thread instead.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block: bool):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            # Everything logged so far has been handled: write the batch out.
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block)
+
+
+class LogSink:
+    """
+    Asynchronous logging for one operation or for the whole program.
+
+    start() puts a QueueHandler in front of the root logger, so a worker
+    thread that logs only appends the record to a queue and never waits on a
+    file lock. A listener thread formats the records and writes them in
+    batches to a rotating log file (kept below 'max_bytes', with
+    'backup_count' older files) and/or the console. With start(new_file=True)
+    the previous log is rotated away instead of deleted, so each run starts
+    a fresh file and the last few runs stay available. stop() writes what is
+    left and restores the previous handlers.
+    """
+
+    def __init__(self, path: Optional[str] = None, console: bool = False, level: int = logging.INFO,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        self.level = level
+        self.handlers: List[logging.Handler] = []
+        self._file: Optional[BatchedRotatingFileHandler] = None
+        if path:
+            self._file = BatchedRotatingFileHandler(path, max_bytes, backup_count)
+            self.handlers.append(self._file)
+        if console:
+            self.handlers.append(BatchedStreamHandler(sys.stderr))
+        formatter = logging.Formatter(LOG_FORMAT)
+        for handler in self.handlers:
+            handler.setFormatter(formatter)
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self._listener: Optional[_BatchingQueueListener] = None
+        self._queue_handler: Optional[_DeferredQueueHandler] = None
+        self._saved: List[logging.Handler] = []
+        self._saved_level = logging.WARNING
+
+    def start(self, new_file: bool = False) -> "LogSink":
+        if self._listener is not None:
+            return self
+        if new_file and self._file is not None and os.path.exists(self._file.baseFilename) \
+                and os.path.getsize(self._file.baseFilename) > 0:
+            self._file.doRollover()
+        root = logging.getLogger()
+        self._saved, self._saved_level = root.handlers[:], root.level
+        self._queue_handler = _DeferredQueueHandler(self._queue)  # type: ignore
+        root.handlers = [self._queue_handler]
+        root.setLevel(self.level)
+        self._listener = _BatchingQueueListener(self._queue, *self.handlers,  # type: ignore
+                                                respect_handler_level=True)
+        self._listener.start()
+        return self
+
+    def stop(self):
+        if self._listener is None:
+            return
+        root = logging.getLogger()
+        root.handlers = self._saved
+        root.setLevel(self._saved_level)
+        self._listener.stop()  # Handles everything still queued first.
+        self._listener = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        self.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def __enter__(self) -> "LogSink":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,15 +1,23 @@
 # main.py
 import argparse
+import atexit
+import json
 import logging
 import sys
+import time
 
 from sorter import FileSorter
 from renamer import Renamer
+from journal import open_journal
+from log_sink import LogSink, set_summary_mode
+from file_index import open_file_index
+from undo import undo_operations
+from plan import Plan
+from stats import write_prometheus
+from watch import watch_directory
 # from gui import main as run_gui  # If you want to launch the GUI from CLI
 
 def main():
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
-
     parser = argparse.ArgumentParser(description="File Manager - Sort and Rename.")
     parser.add_argument("--sort", action="store_true", help="Sort files and folders.")
     parser.add_argument("--mass-rename", action="store_true", help="Mass rename files.")
@@ -17,47 +25,156 @@ def main():
     parser.add_argument("--source", type=str, default=".", help="Source directory.")
     parser.add_argument("--dest", type=str, default="sorted", help="Destination directory (for sorting).")
     parser.add_argument("--dry-run", action="store_true", help="Perform a dry run (no changes).")
-    parser.add_argument("--undo", action="store_true", help="Undo previous operations.")
+    parser.add_argument("--dedup", choices=["skip", "hardlink", "quarantine"],
+                        help="When sorting, skip, hard-link or quarantine files whose content already exists.")
+    parser.add_argument("--watch", action="store_true",
+                        help="With --sort: keep running and sort new files as they arrive (Ctrl+C to stop).")
+    parser.add_argument("--recursive", action="store_true",
+                        help="With --mass-rename/--music-rename: also rename files in every folder below --source.")
+    parser.add_argument("--numbering", choices=["per_directory", "global"], default="per_directory",
+                        help="With --mass-rename --recursive: restart numbers in each folder, or number the whole tree.")
+    parser.add_argument("--template", type=str,
+                        help="With --mass-rename: build names from a template, e.g. '{mtime:%%Y-%%m-%%d}_{n:04}{ext}'.")
+    parser.add_argument("--fuzzy", action="store_true", help="Group near-identical series titles together when sorting.")
+    parser.add_argument("--save-plan", type=str, metavar="FILE",
+                        help="With --dry-run: save the planned operations to FILE for --apply-plan.")
+    parser.add_argument("--apply-plan", type=str, metavar="FILE",
+                        help="Execute a plan saved by --save-plan without scanning again.")
+    parser.add_argument("--undo", action="store_true",
+                        help="Undo the most recent sort or rename session, even from an earlier run.")
+    parser.add_argument("--undo-last", type=int, metavar="N",
+                        help="With --undo: undo only the N most recent operations (across sessions unless --session is given).")
+    parser.add_argument("--session", type=str, help="With --undo: undo this session (see --list-sessions).")
+    parser.add_argument("--list-sessions", action="store_true", help="List journaled sessions that can be undone.")
+    parser.add_argument("--index-stats", action="store_true",
+                        help="Show how many sorted items the file index holds per category, without reading the disk.")
+    parser.add_argument("--index-newest", type=int, metavar="N", help="List the N most recently indexed items.")
+    parser.add_argument("--index-root", type=str, metavar="DIR",
+                        help="With --index-stats/--index-newest: only count items below DIR.")
+    parser.add_argument("--log-file", type=str, metavar="FILE",
+                        help="Also write the log to FILE (rotated at 10 MiB, 5 old files kept).")
+    parser.add_argument("--summary-log", action="store_true",
+                        help="Log per-operation counts instead of one line per file.")
+    parser.add_argument("--stats", choices=["json", "text"],
+                        help="Print per-phase timings, counters and move latencies of each operation to stdout.")
+    parser.add_argument("--prometheus-file", type=str, metavar="FILE",
+                        help="Write the same statistics to FILE in the Prometheus text format "
+                             "(e.g. into node_exporter's textfile collector folder).")
     # Add more CLI args as needed (prefix, extension, etc.)
 
     args = parser.parse_args()
 
+    # Log records are formatted and written in batches on a listener thread.
+    sink = LogSink(args.log_file, console=True).start(new_file=True)
+    atexit.register(sink.close)
+    set_summary_mode(args.summary_log)
+
+    if args.list_sessions:
+        for session in open_journal().sessions():
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(session.started))
+            print(f"{session.id}  {started}  {session.kind:<6}  {session.pending}/{session.operations} undoable  "
+                  f"{session.description}")
+        sys.exit(0)
+
+    if args.index_stats or args.index_newest:
+        index = open_file_index()
+        if args.index_stats:
+            for category, count, size in index.category_counts(args.index_root):
+                print(f"{category:<16} {count:>9} item(s)  {size / 1048576:>12.1f} MiB")
+        if args.index_newest:
+            for row in index.newest(args.index_newest, args.index_root):
+                seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row.seen))
+                print(f"{seen}  {row.category or '-':<12}  {row.path}")
+        sys.exit(0)
+
     sorter = FileSorter()
     renamer = Renamer()
 
-    # Handle UNDO first if requested
+    # Handle UNDO first if requested. Operations come from the journal, so this
+    # also reverts sorts and renames made by earlier runs or by the GUIs.
     if args.undo:
-        # Undo sorting
-        sorter.undo()
-        # Undo renaming
-        renamer.undo()
+        journal = open_journal()
+        ops = journal.pending(sessions=[args.session] if args.session else None, last=args.undo_last)
+        if not ops:
+            logging.info("Nothing to undo.")
+        else:
+            logging.info(f"Undoing {len(ops)} operation(s)...")
+            undone = undo_operations(ops, journal)
+            # Sorts and renames may be mixed here: update both the file index and the tag cache.
+            sorter.record_undo(undone)
+            renamer.record_undo(undone)
+            logging.info(f"Undo finished: {len(undone)} of {len(ops)} operation(s) reverted.")
         sys.exit(0)
 
+    plans = []
+    run_stats = []
+
+    if args.apply_plan:
+        plan = Plan.load(args.apply_plan)
+        if plan.kind == "sort":
+            sorter.apply(plan)
+            run_stats.append(sorter.last_stats)
+        else:
+            renamer.apply(plan, preserve_timestamps=True)
+            run_stats.append(renamer.last_stats)
+
     # Sorting
-    if args.sort:
-        sorter.sort_directory(args.source, args.dest, dry_run=args.dry_run)
+    if args.sort and args.watch:
+        # The watcher does the initial sort itself, then only handles arrivals.
+        if args.dedup:
+            sorter.dedup_policy = args.dedup
+        if args.fuzzy:
+            sorter.fuzzy_grouping = True
+        watch_directory(sorter, args.source, args.dest, dry_run=args.dry_run)
+    elif args.sort:
+        plans.append(sorter.sort_directory(args.source, args.dest, dry_run=args.dry_run, fuzzy=args.fuzzy or None,
+                                           dedup=args.dedup))
+        run_stats.append(sorter.last_stats)
 
     # Mass rename example
     if args.mass_rename:
         # For demonstration, we’ll rename .jpg files with prefix "CLI_"
-        renamer.mass_rename(
+        plans.append(renamer.mass_rename(
             folder=args.source,
             file_extension="jpg",
             prefix="CLI_",
             start_index=1,
             zero_padding=3,
             preserve_timestamps=True,
-            dry_run=args.dry_run
-        )
+            dry_run=args.dry_run,
+            recursive=args.recursive,
+            numbering=args.numbering,
+            template=args.template
+        ))
+        run_stats.append(renamer.last_stats)
 
     # Music rename example
     if args.music_rename:
-        renamer.rename_music(
+        plans.append(renamer.rename_music(
             folder=args.source,
-            extensions=["mp3"],
             dry_run=args.dry_run,
-            preserve_timestamps=True
-        )
+            preserve_timestamps=True,
+            recursive=args.recursive
+        ))
+        run_stats.append(renamer.last_stats)
+
+    if args.save_plan:
+        plans = [p for p in plans if p is not None]
+        if len(plans) == 1:
+            plans[0].save(args.save_plan)
+            logging.info(f"Plan with {len(plans[0])} operation(s) saved to {args.save_plan}")
+        else:
+            logging.error("--save-plan needs exactly one operation (--sort, --mass-rename or --music-rename).")
+
+    # An operation that stopped early (e.g. a missing folder) leaves the previous stats, or none.
+    run_stats = [s for i, s in enumerate(run_stats) if s is not None and s not in run_stats[:i]]
+    if args.stats == "json":
+        print(json.dumps([s.to_dict() for s in run_stats], indent=2))
+    elif args.stats == "text":
+        for s in run_stats:
+            print(s.summary())
+    if args.prometheus_file and run_stats:
+        write_prometheus(args.prometheus_file, run_stats)
 
     logging.info("All requested operations completed.")
 
@@ -0,0 +1,238 @@
+# move_engine.py
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Set
+
+_MiB = 1024 * 1024
+# Errors meaning "this kernel/file system cannot do zero-copy here"; fall back to the next method.
+_ZERO_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+
+class CrossDeviceMover:
+    """
+    Moves files and folders between file systems, where a rename is impossible.
+
+    Data is copied with os.copy_file_range (the kernel copies, or the file
+    system clones, without going through Python), then os.sendfile, then a
+    plain pread/pwrite loop, whichever works first. Files larger than
+    'parallel_threshold' are split into chunks copied by several threads.
+    Destinations are opened with O_EXCL, so an existing file is never
+    overwritten. Permissions, ownership (when allowed) and timestamps are
+    copied, and every file is fsync'ed.
+
+    Sources are not deleted right away. They are queued and removed in
+    batches by flush(), after the destination folders have been fsync'ed too,
+    so a crash leaves an extra copy rather than a lost file.
+    """
+
+    def __init__(self, verify: bool = False, parallel_threshold: int = 256 * _MiB, chunk_size: int = 64 * _MiB,
+                 chunk_workers: int = 4, delete_batch: int = 256):
+        self.verify = verify
+        self.parallel_threshold = parallel_threshold
+        self.chunk_size = chunk_size
+        self.chunk_workers = chunk_workers
+        self.delete_batch = delete_batch
+        self.bytes_copied = 0
+        self._lock = threading.Lock()
+        self._pending_sources: List[Path] = []
+        self._pending_dirs: Set[Path] = set()
+        self._use_copy_file_range = hasattr(os, "copy_file_range")
+        self._use_sendfile = hasattr(os, "sendfile") and os.name != "nt"
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def move(self, src: Path, dst: Path) -> int:
+        """Copies 'src' to 'dst' (which must not exist) and queues 'src' for deletion."""
+        st = os.lstat(src)
+        if stat.S_ISDIR(st.st_mode):
+            copied = self._copy_tree(src, dst, st)
+        elif stat.S_ISLNK(st.st_mode):
+            os.symlink(os.readlink(src), dst)
+            copied = 0
+        else:
+            copied = self._copy_file(src, dst, st)
+        with self._lock:
+            self.bytes_copied += copied
+            self._pending_sources.append(src)
+            self._pending_dirs.add(dst.parent)
+            batch_full = len(self._pending_sources) >= self.delete_batch
+        if batch_full:
+            self.flush()
+        return copied
+
+    def flush(self):
+        """Makes queued copies durable, then deletes their sources."""
+        with self._lock:
+            sources, self._pending_sources = self._pending_sources, []
+            dirs, self._pending_dirs = self._pending_dirs, set()
+        if not sources:
+            return
+        for folder in dirs:
+            _fsync_dir(folder)
+        for src in sources:
+            try:
+                if src.is_dir() and not src.is_symlink():
+                    shutil.rmtree(src)
+                else:
+                    os.unlink(src)
+            except OSError as e:
+                logging.warning(f"Copied but could not remove source {src}: {e}")
+
+    # ------------------------------------------------------------------
+    # Copying
+    # ------------------------------------------------------------------
+    def _copy_tree(self, src: Path, dst: Path, st: os.stat_result) -> int:
+        os.mkdir(dst)
+        copied = 0
+        try:
+            with os.scandir(src) as it:
+                for dirent in it:
+                    child_src = Path(dirent.path)
+                    child_dst = dst / dirent.name
+                    child_st = dirent.stat(follow_symlinks=False)
+                    if stat.S_ISDIR(child_st.st_mode):
+                        copied += self._copy_tree(child_src, child_dst, child_st)
+                    elif stat.S_ISLNK(child_st.st_mode):
+                        os.symlink(os.readlink(child_src), child_dst)
+                    else:
+                        copied += self._copy_file(child_src, child_dst, child_st)
+            _fsync_dir(dst)
+            shutil.copystat(src, dst, follow_symlinks=False)
+        except BaseException:
+            shutil.rmtree(dst, ignore_errors=True)
+            raise
+        return copied
+
+    def _copy_file(self, src: Path, dst: Path, st: os.stat_result) -> int:
+        size = st.st_size
+        fd_in = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+        except BaseException:
+            os.close(fd_in)
+            raise
+        try:
+            try:
+                if size >= self.parallel_threshold and self.chunk_workers > 1:
+                    os.ftruncate(fd_out, size)
+                    self._copy_chunks(src, dst, size)
+                else:
+                    self._copy_range(fd_in, fd_out, 0, size)
+                _copy_metadata_fd(fd_out, st)
+                os.fsync(fd_out)
+            finally:
+                os.close(fd_out)
+                os.close(fd_in)
+            if not _copy_metadata_fd_supported:
+                shutil.copystat(src, dst)
+            if self.verify and _file_digest(src) != _file_digest(dst):
+                raise OSError(errno.EIO, "Checksum mismatch after copy", str(dst))
+        except BaseException:
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+            raise
+        return size
+
+    def _copy_chunks(self, src: Path, dst: Path, size: int):
+        def copy_chunk(offset: int):
+            # Each chunk gets its own descriptors so file positions are never shared.
+            fd_in = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                fd_out = os.open(dst, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+                try:
+                    self._copy_range(fd_in, fd_out, offset, min(self.chunk_size, size - offset))
+                finally:
+                    os.close(fd_out)
+            finally:
+                os.close(fd_in)
+
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as pool:
+            for future in [pool.submit(copy_chunk, off) for off in range(0, size, self.chunk_size)]:
+                future.result()
+
+    def _copy_range(self, fd_in: int, fd_out: int, offset: int, count: int):
+        pos, end = offset, offset + count
+        if self._use_copy_file_range:
+            try:
+                while pos < end:
+                    n = os.copy_file_range(fd_in, fd_out, min(end - pos, 1 << 30), pos, pos)
+                    if n == 0:
+                        break
+                    pos += n
+                return
+            except OSError as e:
+                if e.errno not in _ZERO_COPY_UNSUPPORTED:
+                    raise
+                self._use_copy_file_range = False
+        if self._use_sendfile:
+            try:
+                os.lseek(fd_out, pos, os.SEEK_SET)
+                while pos < end:
+                    n = os.sendfile(fd_out, fd_in, pos, min(end - pos, 1 << 30))
+                    if n == 0:
+                        break
+                    pos += n
+                return
+            except OSError as e:
+                if e.errno not in _ZERO_COPY_UNSUPPORTED:
+                    raise
+                self._use_sendfile = False
+        os.lseek(fd_in, pos, os.SEEK_SET)
+        os.lseek(fd_out, pos, os.SEEK_SET)
+        while pos < end:
+            buf = os.read(fd_in, min(end - pos, _MiB))
+            if not buf:
+                break
+            view = memoryview(buf)
+            while view:
+                written = os.write(fd_out, view)
+                view = view[written:]
+            pos += len(buf)
+
+
+_copy_metadata_fd_supported = os.utime in os.supports_fd and hasattr(os, "fchmod")
+
+
+def _copy_metadata_fd(fd: int, st: os.stat_result):
+    if not _copy_metadata_fd_supported:
+        return
+    if hasattr(os, "fchown"):
+        try:
+            os.fchown(fd, st.st_uid, st.st_gid)
+        except PermissionError:
+            pass
+    os.fchmod(fd, stat.S_IMODE(st.st_mode))
+    os.utime(fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def _fsync_dir(folder: Path):
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _file_digest(path: Path) -> bytes:
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_MiB), b""):
+            digest.update(block)
+    return digest.digest()
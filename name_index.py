@@ -0,0 +1,81 @@
+# name_index.py
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Set, Tuple
+
+# Default file systems on Windows and macOS treat "IMG.jpg" and "img.JPG" as the same name.
+CASE_INSENSITIVE = os.name == "nt" or sys.platform == "darwin"
+
+
+def _split_name(name: str) -> Tuple[str, str]:
+    path = Path(name)
+    return path.stem, path.suffix
+
+
+class NameIndex:
+    """
+    In-memory index of the names taken in each destination folder.
+
+    A folder is listed once with scandir the first time it is used; after
+    that, every placement is answered from memory. Clashes get the usual
+    "_1", "_2", ... suffix, and the next suffix to try is remembered per
+    name, so 5,000 files called IMG_0001.jpg cost O(1) each instead of a
+    growing chain of exists() probes. Safe to share between worker threads.
+    """
+
+    def __init__(self, split_name: Callable[[str], Tuple[str, str]] = _split_name):
+        self.split_name = split_name
+        self._folders: Dict[Path, Set[str]] = {}
+        self._next_suffix: Dict[Tuple[Path, str], int] = {}
+        self._lock = threading.Lock()
+        self._fold: Callable[[str], str] = str.casefold if CASE_INSENSITIVE else str
+
+    def _names(self, folder: Path) -> Set[str]:
+        names = self._folders.get(folder)
+        if names is None:
+            try:
+                with os.scandir(folder) as it:
+                    names = {self._fold(e.name) for e in it}
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            self._folders[folder] = names
+        return names
+
+    def reserve(self, folder: Path, name: str) -> Path:
+        """Returns a free path for 'name' inside 'folder' and marks it as taken."""
+        fold = self._fold
+        with self._lock:
+            names = self._names(folder)
+            key = fold(name)
+            if key not in names:
+                names.add(key)
+                return folder / name
+            stem, suffix = self.split_name(name)
+            counter = self._next_suffix.get((folder, key), 1)
+            while True:
+                candidate = f"{stem}_{counter}{suffix}"
+                counter += 1
+                if fold(candidate) not in names:
+                    break
+            self._next_suffix[(folder, key)] = counter
+            names.add(fold(candidate))
+            return folder / candidate
+
+    def mark_taken(self, path: Path):
+        """Records a name that appeared on disk without going through reserve()."""
+        with self._lock:
+            self._names(path.parent).add(self._fold(path.name))
+
+    def release(self, path: Path):
+        """Gives back a reserved name whose placement failed."""
+        with self._lock:
+            names = self._folders.get(path.parent)
+            if names is not None:
+                names.discard(self._fold(path.name))
+
+    def clear(self):
+        with self._lock:
+            self._folders.clear()
+            self._next_suffix.clear()
@@ -0,0 +1,124 @@
+# placement.py
+import ctypes
+import ctypes.util
+import errno
+import os
+import stat
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+from name_index import NameIndex
+
+_AT_FDCWD = -100
+_RENAME_NOREPLACE = 1   # linux/fs.h
+_RENAME_EXCL = 0x4      # macOS sys/stdio.h
+
+# errno values meaning "this file system cannot do that", not "the operation failed".
+_NOREPLACE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP}
+_LINK_UNSUPPORTED = {errno.EPERM, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def _load_native_noreplace():
+    """Returns a callable(src_bytes, dst_bytes) -> int wrapping renameat2 or renamex_np, or None."""
+    if not (sys.platform.startswith("linux") or sys.platform == "darwin"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if sys.platform == "darwin":
+            fn = libc.renamex_np
+            fn.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint]
+            fn.restype = ctypes.c_int
+            return lambda src, dst: fn(src, dst, _RENAME_EXCL)
+        fn = libc.renameat2
+        fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        fn.restype = ctypes.c_int
+        return lambda src, dst: fn(_AT_FDCWD, src, _AT_FDCWD, dst, _RENAME_NOREPLACE)
+    except (OSError, AttributeError):
+        # No libc found, or a libc too old to export the call (glibc < 2.28).
+        return None
+
+
+_native_noreplace = _load_native_noreplace()
+
+
+def rename_noreplace(src: Path, dst: Path):
+    """
+    Atomically renames 'src' to 'dst', failing with FileExistsError instead of
+    overwriting when 'dst' already exists. Across devices it raises
+    OSError(EXDEV) like os.rename does.
+
+    Uses renameat2(RENAME_NOREPLACE) on Linux and renamex_np(RENAME_EXCL) on
+    macOS. Windows' os.rename never replaces. Where none of these is available
+    (old libc, or a file system that rejects the flag), files fall back to
+    link()+unlink() and directories to reserving 'dst' with mkdir() and
+    renaming over that empty placeholder.
+    """
+    if os.name == "nt":
+        os.rename(src, dst)
+        return
+    if _native_noreplace is not None:
+        if _native_noreplace(os.fsencode(src), os.fsencode(dst)) == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in _NOREPLACE_UNSUPPORTED:
+            raise OSError(err, os.strerror(err), str(src), None, str(dst))
+    _fallback_noreplace(src, dst)
+
+
+def _fallback_noreplace(src: Path, dst: Path):
+    if stat.S_ISDIR(os.lstat(src).st_mode):
+        os.mkdir(dst)  # Raises FileExistsError when the name is taken.
+        try:
+            os.rename(src, dst)  # Replacing an empty directory is allowed.
+        except OSError:
+            os.rmdir(dst)
+            raise
+        return
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        # No hard links on this file system (e.g. FAT): best effort.
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dst))
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def place(src: Path, folder: Path, name: str, index: NameIndex,
+          cross_device: Optional[Callable[[Path, Path], object]] = None,
+          on_collision: Optional[Callable[[Path], object]] = None) -> Path:
+    """
+    Moves 'src' into 'folder' under 'name', or under the next free "_N" name
+    from 'index' if that name is taken, and returns the final path. A name
+    that turns out to exist on disk (created by another process since the
+    folder was indexed) stays marked as taken and the next suffix is tried,
+    so no lock is needed between workers.
+
+    If the rename fails with EXDEV and 'cross_device' is given, it is called
+    as cross_device(src, target) instead; it must also refuse to overwrite
+    by raising FileExistsError. 'on_collision' is called with each target
+    that turned out to exist on disk.
+    """
+    mover: Callable[[Path, Path], object] = rename_noreplace
+    target = index.reserve(folder, name)
+    while True:
+        try:
+            mover(src, target)
+            return target
+        except FileExistsError:
+            if on_collision is not None:
+                on_collision(target)
+            target = index.reserve(folder, name)
+        except OSError as e:
+            if e.errno == errno.EXDEV and cross_device is not None and mover is rename_noreplace:
+                mover = cross_device
+                continue
+            index.release(target)
+            raise
+        except BaseException:
+            index.release(target)
+            raise
@@ -0,0 +1,125 @@
+# plan.py
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+PLAN_VERSION = 1
+
+# Conflict annotations.
+RENAMED = "renamed"        # The target name was taken (on disk or by another entry), a "_N" suffix was planned instead.
+ESTIMATED = "estimated"    # The source does not exist yet; the target is re-derived on apply.
+IDENTICAL = "identical"    # Same content as another file; placed according to the dedup policy.
+
+_COLUMNS = ("src", "dst", "mtime", "size", "dev", "is_dir", "phase", "note")
+
+
+class PlanEntry(NamedTuple):
+    index: int
+    src: Path
+    dst: Path
+    mtime: Optional[float]
+    size: int
+    dev: int
+    is_dir: bool
+    phase: int
+    note: str
+
+
+class Plan:
+    """
+    What a sort or rename would do, computed by a dry run and executable
+    as-is by the matching apply().
+
+    Entries are stored column by column (one list per field) rather than as
+    one object per file, which keeps plans for hundreds of thousands of
+    files small in memory and in their JSON form. 'mtime' and 'size' are
+    the source's at planning time; apply() uses them to revalidate only the
+    entries that changed since. Entries run in 'phase' order, so moves that
+    depend on earlier ones (e.g. a series folder that is filled first, then
+    sorted) come later. 'note' holds a conflict annotation, or "".
+    """
+
+    def __init__(self, kind: str, source: str, dest: str = "", options: Optional[dict] = None):
+        self.kind = kind
+        self.source = source
+        self.dest = dest
+        self.options: dict = dict(options or {})
+        self.src: List[str] = []
+        self.dst: List[str] = []
+        self.mtime: List[Optional[float]] = []
+        self.size: List[int] = []
+        self.dev: List[int] = []
+        self.is_dir: List[bool] = []
+        self.phase: List[int] = []
+        self.note: List[str] = []
+
+    def add(self, src: Path, dst: Path, mtime: Optional[float] = None, size: int = 0, dev: int = -1,
+            is_dir: bool = False, phase: int = 0, note: str = ""):
+        self.src.append(str(src))
+        self.dst.append(str(dst))
+        self.mtime.append(mtime)
+        self.size.append(size)
+        self.dev.append(dev)
+        self.is_dir.append(is_dir)
+        self.phase.append(phase)
+        self.note.append(note)
+
+    def extend(self, other: "Plan"):
+        """Appends the entries of 'other'."""
+        for column in _COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+
+    def drop(self, indices: Iterable[int]):
+        """Removes the entries at 'indices'."""
+        dropped = set(indices)
+        keep = [i for i in range(len(self.src)) if i not in dropped]
+        for column in _COLUMNS:
+            values = getattr(self, column)
+            setattr(self, column, [values[i] for i in keep])
+
+    def __len__(self) -> int:
+        return len(self.src)
+
+    def entry(self, i: int) -> PlanEntry:
+        return PlanEntry(i, Path(self.src[i]), Path(self.dst[i]), self.mtime[i], self.size[i], self.dev[i],
+                         self.is_dir[i], self.phase[i], self.note[i])
+
+    def entries(self, phase: Optional[int] = None) -> Iterator[PlanEntry]:
+        for i in range(len(self.src)):
+            if phase is None or self.phase[i] == phase:
+                yield self.entry(i)
+
+    def phases(self) -> List[int]:
+        return sorted(set(self.phase))
+
+    def conflicts(self) -> List[PlanEntry]:
+        return [self.entry(i) for i, note in enumerate(self.note) if note]
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+    def to_dict(self) -> dict:
+        data = {"version": PLAN_VERSION, "kind": self.kind, "source": self.source, "dest": self.dest,
+                "options": self.options}
+        data.update((column, getattr(self, column)) for column in _COLUMNS)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Plan":
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {data.get('version')}")
+        plan = cls(data["kind"], data["source"], data.get("dest", ""), data.get("options"))
+        for column in _COLUMNS:
+            setattr(plan, column, list(data[column]))
+        if len({len(getattr(plan, column)) for column in _COLUMNS}) != 1:
+            raise ValueError("Corrupt plan: columns have different lengths")
+        return plan
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "Plan":
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,125 @@
+# plan_view.py
+import os
+from array import array
+from typing import Callable, Iterable, Optional, Tuple
+
+from plan import Plan
+
+# Columns shown by the preview table.
+SOURCE, TARGET, CATEGORY, CONFLICT = range(4)
+COLUMNS: Tuple[str, ...] = ("Source", "Target", "Category", "Conflict")
+
+
+class PlanView:
+    """
+    A sorted and filtered view of a Plan for the preview table.
+
+    The plan's columns are the data; the view only holds the order of the
+    visible rows, as an array of plan indices (a few bytes per row), and
+    builds cell text on demand, so a table over 500k planned operations only
+    formats the rows on screen. Sources are shown relative to the plan's
+    source folder and targets relative to its destination. The category is
+    the top folder of the target under the destination for a sort, and the
+    file's folder for a rename.
+    """
+
+    def __init__(self, plan: Plan):
+        self.plan = plan
+        self._src_root = self._root(plan.source)
+        self._dst_root = self._root(plan.dest or plan.source)
+        self.rows = array("q", range(len(plan)))
+        self.sort_column = -1
+        self.descending = False
+        self.filter_text = ""
+        self.conflicts_only = False
+
+    @staticmethod
+    def _root(folder: str) -> str:
+        return os.path.join(folder, "") if folder else ""
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def index(self, row: int) -> int:
+        """The plan index shown at 'row'."""
+        return self.rows[row]
+
+    def cell(self, row: int, column: int) -> str:
+        return self.value(self.rows[row], column)
+
+    def value(self, i: int, column: int) -> str:
+        if column == SOURCE:
+            return self._relative(self.plan.src[i], self._src_root)
+        if column == TARGET:
+            return self._relative(self.plan.dst[i], self._dst_root)
+        if column == CATEGORY:
+            return self.category(i)
+        return self.plan.note[i]
+
+    def full_path(self, row: int, column: int) -> Optional[str]:
+        i = self.rows[row]
+        if column == SOURCE:
+            return self.plan.src[i]
+        if column == TARGET:
+            return self.plan.dst[i]
+        return None
+
+    def category(self, i: int) -> str:
+        target = self._relative(self.plan.dst[i], self._dst_root)
+        if self.plan.kind == "sort":
+            top, sep, _ = target.partition(os.sep)
+            return top if sep else ""
+        return os.path.dirname(target)
+
+    def is_conflict(self, row: int) -> bool:
+        return bool(self.plan.note[self.rows[row]])
+
+    @staticmethod
+    def _relative(path: str, root: str) -> str:
+        return path[len(root):] if root and path.startswith(root) else path
+
+    def conflict_count(self) -> int:
+        return sum(1 for note in self.plan.note if note)
+
+    # ------------------------------------------------------------------
+    # Sorting and filtering
+    # ------------------------------------------------------------------
+    def sort(self, column: int, descending: bool = False):
+        """Orders the rows by 'column' (-1: plan order). Keeps the current filter."""
+        self.arrange(column, descending, self.filter_text, self.conflicts_only)
+
+    def set_filter(self, text: str = "", conflicts_only: bool = False):
+        """Shows only rows whose source or target contains 'text' (any case), or only conflicts."""
+        self.arrange(self.sort_column, self.descending, text, conflicts_only)
+
+    def arrange(self, column: int, descending: bool, text: str, conflicts_only: bool):
+        """Sets order and filter at once, computing the rows a single time."""
+        self.sort_column = column
+        self.descending = descending
+        self.filter_text = text
+        self.conflicts_only = conflicts_only
+        plan = self.plan
+        rows: Iterable[int] = range(len(plan))
+        if self.conflicts_only:
+            rows = [i for i in rows if plan.note[i]]
+        needle = self.filter_text.casefold()
+        if needle:
+            src_cut, dst_cut = len(self._src_root), len(self._dst_root)
+            src, dst = plan.src, plan.dst
+            # The roots are cut off unchecked: a needle that only matched in them would match every row.
+            rows = [i for i in rows if needle in src[i][src_cut:].casefold() or needle in dst[i][dst_cut:].casefold()]
+        if 0 <= self.sort_column < len(COLUMNS):
+            rows = sorted(rows, key=self._sort_key(self.sort_column), reverse=self.descending)
+        elif self.descending:
+            rows = list(rows)[::-1]
+        self.rows = array("q", rows)
+
+    def _sort_key(self, column: int) -> Callable[[int], str]:
+        plan = self.plan
+        if column == SOURCE:
+            return plan.src.__getitem__
+        if column == TARGET:
+            return plan.dst.__getitem__
+        if column == CATEGORY:
+            return self.category
+        return plan.note.__getitem__
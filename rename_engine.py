@@ -0,0 +1,250 @@
+# rename_engine.py
+import logging
+import os
+import secrets
+import time
+from concurrent.futures import Future, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from io_scheduler import IOScheduler
+from journal import JournalOp, JournalSession
+from name_index import CASE_INSENSITIVE
+from placement import rename_noreplace
+from scanner import device_of
+from stats import RunStats
+from utils import CancelToken, OperationCancelled, Progress
+
+PathLike = Union[str, Path]
+Times = Optional[Tuple[float, float]]
+
+
+def _rename(src: str, dst: str, cancel: Optional[CancelToken], progress: Optional[Progress],
+            stats: Optional[RunStats]):
+    if cancel is not None and cancel.cancelled:
+        raise OperationCancelled()
+    if stats is not None:
+        t0 = time.perf_counter()
+        rename_noreplace(src, dst)  # type: ignore
+        stats.observe("rename_seconds", time.perf_counter() - t0)
+    else:
+        rename_noreplace(src, dst)  # type: ignore
+    if progress is not None:
+        progress.add(done=1)
+
+
+class BatchRename:
+    """
+    Renames many items as one batch without ever overwriting anything.
+
+    The whole mapping is resolved before the first rename, against one
+    listing of each folder involved:
+
+    - A target taken by a file that is not part of the batch, or claimed by
+      an earlier item of the batch, gets the usual "_1", "_2", ... suffix
+      ('suffixed' is set for it).
+    - A target that is still the current name of another item of the batch
+      (re-numbering 1..N to 2..N+1, swaps, longer permutation cycles, and
+      case-only renames on case-insensitive file systems) only becomes free
+      once that item has moved. Such items are 'blocked'.
+
+    run() then needs two passes, each one fully parallel: free targets are
+    renamed directly and blocked items go to a temporary name next to their
+    target; the second pass moves the temporary names to their targets. Every
+    step is recorded in one journal session, in an order that is a valid
+    sequence of renames, so undo puts everything back.
+    """
+
+    def __init__(self, pairs: Sequence[Tuple[PathLike, PathLike]]):
+        # Paths are kept as absolute strings: batches run into the hundreds of
+        # thousands, and Path objects would cost more than the renames.
+        self._absolute: Dict[str, str] = {}
+        self.sources: List[str] = [self._abspath(src) for src, _ in pairs]
+        self.targets: List[Optional[str]] = [None] * len(pairs)  # None: nothing to do for this item
+        self.final: List[Optional[str]] = [None] * len(pairs)    # where each item is after run()
+        self.suffixed: List[bool] = [False] * len(pairs)
+        self.blocked: List[bool] = [False] * len(pairs)
+        self.cycles = 0
+        self.folders_listed = 0
+        self._occupant: Dict[int, int] = {}   # blocked item -> item whose current name it wants
+        self._resolve([self._abspath(dst) for _, dst in pairs])
+
+    def _abspath(self, path: PathLike) -> str:
+        # One abspath() per folder instead of one per item.
+        folder, name = os.path.split(os.fspath(path))
+        absolute = self._absolute.get(folder)
+        if absolute is None:
+            absolute = self._absolute[folder] = os.path.abspath(folder)
+        return os.path.join(absolute, name)
+
+    # ------------------------------------------------------------------
+    # Resolution (no changes on disk)
+    # ------------------------------------------------------------------
+    def _resolve(self, wanted: List[str]):
+        fold = str.casefold if CASE_INSENSITIVE else str
+        moving: Dict[str, int] = {}
+        freed: Dict[str, Set[str]] = {}
+        for i, (src, dst) in enumerate(zip(self.sources, wanted)):
+            if src == dst:
+                continue
+            key = fold(src)
+            if key in moving:
+                logging.warning(f"Skipping {src}: it is already renamed by this batch.")
+                continue
+            moving[key] = i
+            folder, name = os.path.split(key)
+            freed.setdefault(folder, set()).add(name)
+
+        renaming = set(moving.values())
+        taken: Dict[str, Set[str]] = {}
+        for i, dst in enumerate(wanted):
+            if i not in renaming:
+                continue
+            folder, name = os.path.split(dst)
+            folder_key = fold(folder)
+            names = taken.get(folder_key)
+            if names is None:
+                self.folders_listed += 1
+                try:
+                    names = {fold(n) for n in os.listdir(folder)}
+                except OSError:
+                    names = set()
+                names -= freed.get(folder_key, set())  # Names the batch itself moves away.
+                taken[folder_key] = names
+            if fold(name) in names:
+                stem, suffix = os.path.splitext(name)
+                counter = 1
+                while fold(f"{stem}_{counter}{suffix}") in names:
+                    counter += 1
+                name = f"{stem}_{counter}{suffix}"
+                self.suffixed[i] = True
+                dst = os.path.join(folder, name)
+            names.add(fold(name))
+            self.targets[i] = dst
+            occupant = moving.get(fold(dst))
+            if occupant is not None:
+                self.blocked[i] = True
+                self._occupant[i] = occupant
+        self.cycles = self._count_cycles()
+
+    def _count_cycles(self) -> int:
+        # Every item has at most one occupant and is the occupant of at most one
+        # item, so the blocked items form simple chains and cycles.
+        cycles = 0
+        state: Dict[int, int] = {}  # 1: on the current walk, 2: done
+        for start in self._occupant:
+            walk = []
+            i: Optional[int] = start
+            while i is not None and i in self._occupant and i not in state:
+                state[i] = 1
+                walk.append(i)
+                i = self._occupant[i]
+            if i is not None and state.get(i) == 1:
+                cycles += 1
+            for j in walk:
+                state[j] = 2
+        return cycles
+
+    def __len__(self) -> int:
+        return sum(target is not None for target in self.targets)
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    def run(self, session: JournalSession, times: Optional[Sequence[Times]] = None,
+            scheduler: Optional[IOScheduler] = None, cancel: Optional[CancelToken] = None,
+            progress: Optional[Progress] = None, stats: Optional[RunStats] = None) -> List[JournalOp]:
+        """
+        Performs the renames and returns the journal operations, in the order
+        they were recorded. 'times' holds (atime, mtime) per item to restore
+        once it reached its target. Failures are logged and leave the item
+        (and anything waiting for its name) where it was. Once 'cancel' is
+        set, items not started yet are left alone like failed ones; the second
+        pass always runs, so nothing stays at a temporary name. 'stats' gets
+        the latency of every rename.
+        """
+        todo = [i for i, target in enumerate(self.targets) if target is not None]
+        if not todo:
+            return []
+        if self.cycles or any(self.blocked):
+            logging.info(f"{sum(self.blocked)} rename(s) go through a temporary name first "
+                         f"({self.cycles} cycle(s) in the batch).")
+        own_scheduler = scheduler is None
+        scheduler = scheduler or IOScheduler()
+        token = secrets.token_hex(4)
+        temps: Dict[int, str] = {}
+        ops: List[JournalOp] = []
+        try:
+            # Pass 1: free targets directly, blocked items out of the way.
+            first: Dict[int, str] = {}
+            for i in todo:
+                target: str = self.targets[i]  # type: ignore
+                if self.blocked[i]:
+                    target = os.path.join(os.path.dirname(target), f".kp-rename-{token}-{i}.tmp")
+                first[i] = target
+            origins = {i: self.sources[i] for i in todo}
+            passed = self._run_pass(scheduler, first, origins, ops, session, times, cancel, progress, stats)
+            failed = set(todo) - set(passed)
+            for i in todo:
+                if i in failed:
+                    continue
+                if self.blocked[i]:
+                    temps[i] = first[i]
+                else:
+                    self.final[i] = first[i]
+
+            # An item cannot land while the item whose name it wants is still there.
+            waiting = {occupant: i for i, occupant in self._occupant.items()}
+            stuck: Set[int] = set()
+            queue = list(failed)
+            while queue:
+                i = waiting.get(queue.pop())
+                if i is not None and i in temps and i not in stuck:
+                    stuck.add(i)
+                    queue.append(i)
+
+            # Pass 2: temporary names to their targets, or back where they came from.
+            second: Dict[int, str] = {i: (self.sources[i] if i in stuck else self.targets[i])  # type: ignore
+                                      for i in temps}
+            landed = self._run_pass(scheduler, second, temps, ops, session, times, None, progress, stats)
+            for i in landed:
+                self.final[i] = second[i] if i not in stuck else None
+            for i in set(temps) - set(landed):
+                logging.error(f"{os.path.basename(self.sources[i])} was left at {temps[i]}.")
+        finally:
+            if own_scheduler:
+                scheduler.shutdown(wait=True)
+        return ops
+
+    def _run_pass(self, scheduler: IOScheduler, moves: Dict[int, str], origins: Dict[int, str], ops: List[JournalOp],
+                  session: JournalSession, times: Optional[Sequence[Times]], cancel: Optional[CancelToken],
+                  progress: Optional[Progress], stats: Optional[RunStats]) -> List[int]:
+        devices: Dict[str, int] = {}
+        futures: Dict[int, Future] = {}
+        for i, dst in moves.items():
+            folder = os.path.dirname(dst)
+            dev = devices.get(folder)
+            if dev is None:
+                dev = devices[folder] = device_of(Path(folder))
+            # Only landings on the target count as progress, not moves to temporary names.
+            futures[i] = scheduler.submit((dev, dev), _rename, origins[i], dst, cancel,
+                                          progress if dst == self.targets[i] else None, stats)
+        wait(list(futures.values()))
+        done = []
+        for i, future in futures.items():
+            src, dst = origins[i], moves[i]
+            error = future.exception()
+            if isinstance(error, OperationCancelled):
+                continue
+            if error is not None:
+                logging.error(f"Error renaming {os.path.basename(src)} to {os.path.basename(dst)}: {error}")
+                continue
+            restore = times[i] if times is not None and dst == self.targets[i] else None
+            if restore is not None:
+                try:
+                    os.utime(dst, restore)
+                except OSError as e:
+                    logging.warning(f"Could not restore timestamps of {dst}: {e}")
+            ops.append(session.record("rename", Path(src), Path(dst), restore))
+            done.append(i)
+        return done
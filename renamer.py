@@ -2,26 +2,70 @@
 import os
 import logging
 import random
+import re
+import sqlite3
+from collections import Counter
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Iterable, Iterator, List, Mapping, Optional, Tuple
 import time
 
-try:
-    from mutagen.easyid3 import EasyID3
-except ImportError:
-    EasyID3 = None
+from io_scheduler import IOScheduler
+from journal import Journal, JournalOp, JournalSession, open_journal
+from log_sink import item_log
+from undo import undo_operations
+from plan import RENAMED, Plan
+from rename_engine import BatchRename
+from stats import RunStats
+from replacements import KeywordReplacer
+from tags import NO_TAGS, SUPPORTED_EXTENSIONS, TagCache, TagReader, TrackTags, open_tag_cache
+from templates import NameTemplate
+from tree_walk import RandomPermutation, walk_files
+from utils import CancelToken, Progress
+
+NUMBERING = ("per_directory", "global")
+
+
+def _any_file(name: str) -> bool:
+    return True
+
+
+def _extension_filter(extensions: List[str]) -> Callable[[str], bool]:
+    # Same matches as glob("*.ext"): case-sensitive where the OS is, and no hidden files.
+    suffixes = tuple(f".{ext.lstrip('.').lower()}" for ext in extensions)
+    return lambda name: not name.startswith(".") and os.path.normcase(name).endswith(suffixes)
+
 
 class Renamer:
     """
     Provides:
       1) Mass file renaming (sequential or scramble).
-      2) Music name simplification using ID3 tags.
-      3) Keyword-based renaming (replace a substring in filenames).
-      4) Undo functionality to revert renames.
+      2) Music name simplification using ID3, FLAC, Ogg Vorbis and MP4 tags.
+      3) Keyword-based renaming (replace one or many substrings or patterns in filenames).
+      4) Undo functionality to revert renames, backed by the operation journal
+         so that it also works after a restart.
     """
 
-    def __init__(self):
-        self._history: List[Tuple[Path, Path, Tuple[float, float]]] = []
+    def __init__(self, use_journal: bool = True, use_tag_cache: bool = True):
+        self._history: List[JournalOp] = []
+        self.journal: Optional[Journal] = None
+        if use_journal:
+            try:
+                self.journal = open_journal()
+            except OSError as e:
+                logging.warning(f"Operation journal disabled, undo will not survive a restart: {e}")
+        self.tag_cache: Optional[TagCache] = None
+        if use_tag_cache:
+            try:
+                self.tag_cache = open_tag_cache()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Tag cache disabled: {e}")
+        self.tags = TagReader(self.tag_cache)
+        # Set by the GUI's worker thread for the duration of one operation.
+        self.cancel_token: Optional[CancelToken] = None
+        self.progress: Optional[Progress] = None
+        # Phase timers, counters and rename latencies of the last operation (see stats.py).
+        self.last_stats: Optional[RunStats] = None
+        self._stats = RunStats("rename")
         logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
     # --------------------------------------------------------------------------
@@ -38,12 +82,15 @@ class Renamer:
         dry_run: bool = False,
         scramble: bool = False,
         scramble_multiplier: int = 1,
-    ):
+        recursive: bool = False,
+        numbering: str = "per_directory",
+        template: Optional[str] = None,
+    ) -> Optional[Plan]:
         """
         Renames files in 'folder'. If a specific file_extension is provided (e.g. "mp4"),
         only files with that extension will be renamed. If file_extension is an empty string
         or "*", then all files in the folder will be renamed, preserving their original extensions
-        in the new names.
+        in the new names. Files are numbered in name order.
 
         Args:
             folder (str): Target folder with files to rename.
@@ -52,75 +99,295 @@ class Renamer:
             start_index (int): Starting number for sequential renaming (ignored if scramble=True).
             zero_padding (int): Number of digits to pad (e.g. 3 -> "007").
             preserve_timestamps (bool): If True, restore original a/mtime after rename.
-            dry_run (bool): If True, log only without making changes.
+            dry_run (bool): If True, make no changes; log and return the plan for apply().
             scramble (bool): If True, use random numbers instead of sequential.
             scramble_multiplier (int): 1..10, determines the max random range as (file_count * multiplier).
+            recursive (bool): If True, also rename the files in every folder below 'folder' (see _rename_tree).
+            numbering (str): With recursive, "per_directory" restarts the numbers in each folder,
+                "global" numbers the whole tree in one sequence.
+            template (str): Builds each name from a template instead of prefix and number, e.g.
+                "{mtime:%Y-%m-%d}_{n:04}_{parent}{ext}" (see templates.py for the fields). prefix
+                and zero_padding are ignored; the number is {n}.
         """
+        if numbering not in NUMBERING:
+            raise ValueError(f"Unknown numbering '{numbering}', expected one of {', '.join(NUMBERING)}")
         target_folder = Path(folder)
         if not target_folder.is_dir():
             logging.error(f"Folder does not exist or is not a directory: {folder}")
             return
+        name_template = None
+        if template:
+            try:
+                name_template = NameTemplate(template)
+            except ValueError as e:
+                logging.error(str(e))
+                return
 
-        # Determine the list of files based on the provided extension.
+        # Determine which files to rename based on the provided extension.
         if not file_extension or file_extension.strip() == "*" or file_extension.strip() == "":
-            files_to_rename = [f for f in target_folder.iterdir() if f.is_file()]
+            select = _any_file
             use_original_ext = True
         else:
             file_extension = file_extension.lstrip('.').lower()
-            files_to_rename = list(target_folder.glob(f"*.{file_extension}"))
+            select = _extension_filter([file_extension])
             use_original_ext = False
 
-        file_count = len(files_to_rename)
-        if file_count == 0:
-            logging.info("No matching files found in the folder.")
-            return
-
         logging.info(
             f"Mass rename in '{folder}', "
             f"{'all files' if use_original_ext else 'extension=.' + file_extension}, prefix='{prefix}', "
             f"start_index={start_index}, zero_padding={zero_padding}, preserve_timestamps={preserve_timestamps}, "
-            f"scramble={scramble}, scramble_multiplier={scramble_multiplier}, dry_run={dry_run}"
+            f"scramble={scramble}, scramble_multiplier={scramble_multiplier}, recursive={recursive}, "
+            f"numbering={numbering}, template={template!r}, dry_run={dry_run}"
         )
 
-        # Generate the numbering list:
-        if scramble:
-            upper_limit = file_count * scramble_multiplier
-            if file_count > upper_limit:
-                logging.warning("Scramble range is smaller than file count. Some duplicates may occur.")
-                effective_limit = file_count
-            else:
-                effective_limit = upper_limit
-            number_list = random.sample(range(1, effective_limit + 1), file_count)
+        per_directory = numbering == "per_directory" or not recursive
+        permutation = None
+        if scramble and not per_directory:
+            # Global scrambling needs the total count first: one extra walk, counting only.
+            total = sum(len(names) for _, names in walk_files(target_folder, select, recursive))
+            if total:
+                permutation = RandomPermutation(max(total * scramble_multiplier, total))
+        seen = 0
+
+        def batches() -> Iterator[List[Tuple[Path, str]]]:
+            nonlocal seen
+            for directory, names in walk_files(target_folder, select, recursive):
+                count = len(names)
+                if per_directory:
+                    numbers: Iterable[int] = self._numbers(count, start_index, scramble, scramble_multiplier)
+                elif permutation is not None:
+                    numbers = [permutation(seen + k) + 1 for k in range(count)]
+                else:
+                    numbers = range(start_index + seen, start_index + seen + count)
+                seen += count
+                batch = []
+                if name_template is not None:
+                    paths = [directory / name for name in names]
+                    with self._stats.phase("template"):
+                        new_names = name_template.render_batch(paths, list(numbers), self.tags)
+                    for old_path, new_name in zip(paths, new_names):
+                        if new_name:
+                            batch.append((old_path, new_name))
+                        else:
+                            logging.warning(f"Skipping {old_path.name}: it lacks the metadata the template uses.")
+                    yield batch
+                    continue
+                for name, num in zip(names, numbers):
+                    old_path = directory / name
+                    num_str = str(num).zfill(zero_padding) if zero_padding > 0 else str(num)
+                    # Use provided file_extension if specified; otherwise, preserve the original extension.
+                    if use_original_ext:
+                        new_name = f"{prefix}{num_str}{old_path.suffix}"
+                    else:
+                        new_name = f"{prefix}{num_str}.{file_extension}"
+                    batch.append((old_path, new_name))
+                yield batch
+
+        plan = Plan("rename", str(target_folder), options={"operation": "mass_rename"})
+        self._rename_tree(plan, batches(), dry_run, preserve_timestamps, recursive)
+        if seen == 0:
+            logging.info("No matching files found in the folder.")
+            return
+        logging.info("Mass rename complete.")
+        return plan
+
+    def _numbers(self, count: int, start_index: int, scramble: bool, scramble_multiplier: int) -> List[int]:
+        if not scramble:
+            return list(range(start_index, start_index + count))
+        upper_limit = count * scramble_multiplier
+        if count > upper_limit:
+            logging.warning("Scramble range is smaller than file count. Some duplicates may occur.")
+            effective_limit = count
         else:
-            number_list = list(range(start_index, start_index + file_count))
-
-        for old_path, num in zip(files_to_rename, number_list):
-            num_str = str(num).zfill(zero_padding) if zero_padding > 0 else str(num)
-            # Use provided file_extension if specified; otherwise, preserve the original extension.
-            if use_original_ext:
-                new_name = f"{prefix}{num_str}{old_path.suffix}"
-            else:
-                new_name = f"{prefix}{num_str}.{file_extension}"
-            new_path = old_path.with_name(new_name)
-
-            if dry_run:
-                logging.info(f"[DRY RUN] {old_path.name} -> {new_name}")
-            else:
-                old_times = (0.0, 0.0)
-                if preserve_timestamps:
-                    stat_info = old_path.stat()
-                    old_times = (stat_info.st_atime, stat_info.st_mtime)
-                try:
-                    old_path.rename(new_path)
-                    logging.info(f"Renamed: {old_path.name} -> {new_name}")
-                    if preserve_timestamps:
-                        os.utime(new_path, (old_times[0], old_times[1]))
-                    self._history.append((new_path, old_path, old_times))
-                except Exception as e:
-                    logging.error(f"Error renaming {old_path.name} to {new_name}: {e}")
+            effective_limit = upper_limit
+        return random.sample(range(1, effective_limit + 1), count)
 
-        logging.info("Mass rename complete.")
+    def _begin_session(self, operation: str, **info) -> JournalSession:
+        return JournalSession(self.journal, "rename", operation=operation, **info)
+
+    def _rename_tree(self, plan: Plan, batches: Iterator[List[Tuple[Path, str]]], dry_run: bool,
+                     preserve_timestamps: bool, recursive: bool):
+        """
+        Last stage of the rename pipeline: walk_files() -> filter -> name
+        computation (the 'batches' generator, one folder at a time) -> this.
+        Each folder's (path, new name) pairs are previewed, or renamed as one
+        collision-safe batch, as soon as they arrive, so only one folder is in
+        memory at a time. A dry run still collects everything in 'plan' for
+        apply(). In recursive mode the renames are not collected and, with a
+        journal, not kept in memory for undo either: undo() reads them back
+        from the journal, where the whole run is one session.
+        """
+        operation = plan.options.get("operation", "rename")
+        self._stats = RunStats(operation)
+        session = self._begin_session(operation, folder=plan.source)
+        keep_history = not recursive or self.journal is None
+        if not dry_run and not keep_history:
+            self._history = []  # Makes undo() fall back to the journal's latest session, this run.
+        if self.progress:
+            self.progress.start("previewing" if dry_run else "renaming")
+        counts: Counter = Counter()
+        # Listing, filtering and name computation happen in the generator, one folder per batch. All batches share one
+        # scheduler, so its worker threads and per-device concurrency carry over from folder to folder.
+        with IOScheduler() as scheduler:
+            for pairs in self._stats.timed(batches, "walk"):
+                if self._cancelled():
+                    break
+                if self.progress:
+                    self.progress.add(scanned=len(pairs), total=len(pairs))
+                chunk = Plan("rename", plan.source, options=plan.options)
+                for old_path, new_name in pairs:
+                    chunk.add(old_path, os.path.join(os.path.dirname(old_path), new_name))
+                if dry_run:
+                    self._annotate_plan(chunk)
+                    counts["planned"] += len(chunk)
+                    counts["suffixed"] += sum(1 for note in chunk.note if note)
+                    if item_log.isEnabledFor(logging.INFO):
+                        for src, dst, note in zip(chunk.src, chunk.dst, chunk.note):
+                            item_log.info("[DRY RUN] %s -> %s%s", os.path.basename(src), os.path.basename(dst),
+                                          f" ({note})" if note else "")
+                    plan.extend(chunk)
+                    continue
+                counts.update(self._apply_plan(chunk, preserve_timestamps, revalidate=False, session=session,
+                                               keep_history=keep_history, scheduler=scheduler))
+                if not recursive:
+                    plan.extend(chunk)
+        if self.journal and not dry_run:
+            with self._stats.phase("flush"):
+                self.journal.flush()
+        if self.progress:
+            self.progress.finish()
+        self._finish_stats(counts)
+        self._log_counts(counts, dry_run)
+        if self._cancelled():
+            logging.warning("Rename cancelled; the files renamed so far can be undone.")
+
+    def _finish_stats(self, counts: Counter):
+        for name, value in counts.items():
+            self._stats.count(name, value)
+        self.last_stats = self._stats.finish()
+
+    def _log_counts(self, counts: Counter, dry_run: bool = False):
+        """One summary line per operation, whether or not the per-file lines are logged."""
+        if dry_run:
+            logging.info("[DRY RUN] %d file(s) would be renamed, %d of them with a \"_N\" suffix.",
+                         counts["planned"], counts["suffixed"])
+        else:
+            logging.info("Renamed %d file(s), %d of them with a \"_N\" suffix; %d not renamed.",
+                         counts["renamed"], counts["suffixed"], counts["failed"])
+
+    def _cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
 
+    def _annotate_plan(self, plan: Plan):
+        """Records each source's mtime/size for apply() and plans a "_N" name for targets that are taken."""
+        with self._stats.phase("stat"):
+            for i, src in enumerate(plan.src):
+                try:
+                    st = os.stat(src)
+                    plan.mtime[i] = st.st_mtime
+                    plan.size[i] = st.st_size
+                except OSError:
+                    pass
+        self._stats.count("stat", len(plan))
+        batch = self._resolve_batch(list(zip(plan.src, plan.dst)))
+        for i, target in enumerate(batch.targets):
+            if batch.suffixed[i]:
+                plan.dst[i] = str(target)
+                plan.note[i] = RENAMED
+        if batch.cycles or any(batch.blocked):
+            logging.info(f"[DRY RUN] {sum(batch.blocked)} rename(s) would go through a temporary name first "
+                         f"({batch.cycles} cycle(s)).")
+
+    def _apply_plan(self, plan: Plan, preserve_timestamps: bool, revalidate: bool,
+                    session: Optional[JournalSession] = None, keep_history: bool = True,
+                    scheduler: Optional[IOScheduler] = None) -> Counter:
+        """Renames the plan's files as one batch; returns how many were renamed, suffixed and not renamed."""
+        operation = plan.options.get("operation", "rename")
+        label = "Renamed music" if operation == "music_rename" else "Renamed"
+        own_session = session is None
+        session = session or self._begin_session(operation, folder=plan.source)
+        pairs = []
+        times = []
+        stat_needed = revalidate or preserve_timestamps
+        t0 = time.perf_counter()
+        # Plain strings from the plan's columns: building Paths would cost more than the renames.
+        for old_path, new_path, mtime, size in zip(plan.src, plan.dst, plan.mtime, plan.size):
+            stat_info = None
+            if stat_needed:
+                try:
+                    stat_info = os.stat(old_path)
+                except FileNotFoundError:
+                    logging.warning(f"Skipping {old_path}: it no longer exists.")
+                    continue
+            if (revalidate and operation == "music_rename"
+                    and (stat_info.st_mtime, stat_info.st_size) != (mtime, size)):  # type: ignore
+                # Tags may have been edited since the preview.
+                new_path = str(Path(old_path).with_name(self._music_name(Path(old_path))))
+            pairs.append((old_path, new_path))
+            times.append((stat_info.st_atime, stat_info.st_mtime) if preserve_timestamps else None)  # type: ignore
+        if stat_needed:
+            self._stats.add_time("stat", time.perf_counter() - t0)
+            self._stats.count("stat", len(plan))
+
+        # The whole batch is resolved first, so targets that are taken, or that
+        # are the current name of another file of the batch, never get overwritten.
+        batch = self._resolve_batch(pairs)
+        with self._stats.phase("rename"):
+            ops = batch.run(session, times, scheduler, cancel=self.cancel_token, progress=self.progress,
+                            stats=self._stats)
+        if keep_history:
+            self._history.extend(ops)
+        if self.tag_cache:
+            with self._stats.phase("tag_cache"):
+                self.tag_cache.record_renames(ops)
+                self.tag_cache.flush()
+        counts: Counter = Counter()
+        log_items = item_log.isEnabledFor(logging.INFO)
+        for (old_path, _), final, suffixed in zip(pairs, batch.final, batch.suffixed):
+            if final is None:
+                continue
+            counts["renamed"] += 1
+            counts["suffixed"] += suffixed
+            if log_items:
+                item_log.info("%s: %s -> %s", label, os.path.basename(old_path), os.path.basename(final))
+        counts["failed"] = len(plan) - counts["renamed"]
+
+        if self.journal and own_session:
+            with self._stats.phase("flush"):
+                self.journal.flush()
+        return counts
+
+    def _resolve_batch(self, pairs: List[Tuple[str, str]]) -> BatchRename:
+        # Collision probing: one listing per target folder, then "_N" suffixes and blocked chains.
+        with self._stats.phase("resolve"):
+            batch = BatchRename(pairs)
+        self._stats.count("folders_listed", batch.folders_listed)
+        self._stats.count("collisions", sum(batch.suffixed))
+        self._stats.count("blocked", sum(batch.blocked))
+        return batch
+
+    def apply(self, plan: Plan, preserve_timestamps: bool = False) -> Plan:
+        """
+        Executes a plan returned by a dry run without listing the folder or
+        computing names again. Vanished files are skipped; music files whose
+        mtime or size changed since the preview get their name recomputed.
+        """
+        if plan.kind != "rename":
+            raise ValueError(f"Cannot apply a '{plan.kind}' plan with Renamer")
+        logging.info(f"Applying rename plan: {len(plan)} file(s) in '{plan.source}'")
+        self._stats = RunStats("apply_rename")
+        if self.progress:
+            self.progress.start("renaming", total=len(plan))
+        counts = self._apply_plan(plan, preserve_timestamps, revalidate=True)
+        if self.progress:
+            self.progress.finish()
+        self._finish_stats(counts)
+        self._log_counts(counts)
+        if self._cancelled():
+            logging.warning("Rename cancelled; the files renamed so far can be undone.")
+        else:
+            logging.info("Rename plan applied.")
+        return plan
 
     def _build_new_name(self, prefix: str, counter: int, zero_padding: int, extension: str) -> str:
         if zero_padding > 0:
@@ -137,61 +404,60 @@ class Renamer:
         folder: str,
         extensions: List[str] = None, # type: ignore
         dry_run: bool = False,
-        preserve_timestamps: bool = False
-    ):
+        preserve_timestamps: bool = False,
+        recursive: bool = False,
+    ) -> Optional[Plan]:
         """
-        Simplifies music file names using ID3 tags.
+        Renames music files to "01. Artist - Title (feat. Other).ext" from their
+        tags (mp3, flac, ogg and m4a by default). Tags are read in parallel and
+        cached, so files unchanged since an earlier run are not opened again.
+        With 'recursive', every folder below 'folder' is renamed too.
         """
         if extensions is None:
-            extensions = ["mp3"]
+            extensions = SUPPORTED_EXTENSIONS
 
         target_folder = Path(folder)
         if not target_folder.is_dir():
             logging.error(f"Folder does not exist or is not a directory: {folder}")
             return
 
-        music_files = []
-        for ext in extensions:
-            ext = ext.lstrip('.').lower()
-            music_files.extend(target_folder.glob(f"*.{ext}"))
-
-        if not music_files:
-            logging.info(f"No matching music files found in {folder} for {extensions}.")
-            return
-
         logging.info(
-            f"Music rename in '{folder}', extensions={extensions}, dry_run={dry_run}, preserve_timestamps={preserve_timestamps}"
+            f"Music rename in '{folder}', extensions={extensions}, recursive={recursive}, dry_run={dry_run}, "
+            f"preserve_timestamps={preserve_timestamps}"
         )
 
-        for old_path in music_files:
-            old_times = (0.0, 0.0)
-            if preserve_timestamps:
-                stat_info = old_path.stat()
-                old_times = (stat_info.st_atime, stat_info.st_mtime)
-
-            new_name = None
-
-            # ... Place your ID3 Tag extraction logic here ...
-
-            if not new_name:
-                new_stem = self._cleanup_filename(old_path.stem)
-                new_name = f"{new_stem}{old_path.suffix}"
-
-            new_path = old_path.with_name(new_name)
-            if dry_run:
-                logging.info(f"[DRY RUN] {old_path.name} -> {new_name}")
-                continue
-
-            try:
-                old_path.rename(new_path)
-                logging.info(f"Renamed music: {old_path.name} -> {new_name}")
-                if preserve_timestamps:
-                    os.utime(new_path, (old_times[0], old_times[1]))
-                self._history.append((new_path, old_path, old_times))
-            except Exception as e:
-                logging.error(f"Error renaming {old_path.name} to {new_name}: {e}")
-
+        hits, read = self.tags.cache_hits, self.tags.files_read
+        seen = 0
+
+        def batches() -> Iterator[List[Tuple[Path, str]]]:
+            nonlocal seen
+            for directory, names in walk_files(target_folder, _extension_filter(extensions), recursive):
+                seen += len(names)
+                music_files = [directory / name for name in names]
+                with self._stats.phase("tags"):
+                    tags = self.tags.read(music_files)
+                yield [(old_path, self._music_name(old_path, tags.get(old_path, NO_TAGS))) for old_path in music_files]
+
+        plan = Plan("rename", str(target_folder), options={"operation": "music_rename"})
+        self._rename_tree(plan, batches(), dry_run, preserve_timestamps, recursive)
+        if seen == 0:
+            logging.info(f"No matching music files found in {folder} for {extensions}.")
+            return
+        self._stats.count("tag_cache_hits", self.tags.cache_hits - hits)
+        self._stats.count("tags_read", self.tags.files_read - read)
+        logging.info(f"Tags of {seen} file(s): {self.tags.cache_hits - hits} from cache, "
+                     f"{self.tags.files_read - read} read.")
         logging.info("Music name simplification complete.")
+        return plan
+
+    def _music_name(self, old_path: Path, tags: Optional[TrackTags] = None) -> str:
+        if tags is None:
+            tags = self.tags.read([old_path]).get(old_path)
+        new_stem = tags.file_stem() if tags else ""
+        if not new_stem:
+            # No usable tags: fall back to cleaning up the current name.
+            new_stem = self._cleanup_filename(old_path.stem)
+        return f"{new_stem}{old_path.suffix}"
 
     def _cleanup_filename(self, original_stem: str) -> str:
         name = original_stem.replace('_', ' ')
@@ -205,87 +471,119 @@ class Renamer:
         self,
         folder: str,
         file_extension: str,
-        keyword: str,
-        new_keyword: str,
+        keyword: str = "",
+        new_keyword: str = "",
         preserve_timestamps: bool = False,
-        dry_run: bool = False
-    ):
+        dry_run: bool = False,
+        replacements: Optional[Mapping[str, str]] = None,
+        regex: bool = False,
+        ignore_case: bool = False,
+        recursive: bool = False,
+    ) -> Optional[Plan]:
         """
         Searches for files with the given extension in 'folder' whose names contain
-        'keyword' and replaces the keyword with 'new_keyword'.
+        'keyword' and replaces the keyword with 'new_keyword'. Many keywords can be
+        replaced at once through 'replacements'; the folder is listed once and every
+        name is scanned once for all of them (see replacements.py).
 
         Args:
             folder (str): Target folder with files.
-            file_extension (str): e.g. "mp4"
+            file_extension (str): e.g. "mp4". Use "" or "*" for all files.
             keyword (str): Substring to search for in the file name (without extension).
             new_keyword (str): Replacement substring.
             preserve_timestamps (bool): If True, original timestamps are preserved.
-            dry_run (bool): If True, no changes are made; only logs the planned changes.
+            dry_run (bool): If True, no changes are made; logs and returns the plan for apply().
+            replacements (dict): More keyword -> replacement pairs, applied together with 'keyword'.
+            regex (bool): If True, keywords are regular expressions and replacements may use \\1 etc.
+            ignore_case (bool): If True, keywords match regardless of case.
+            recursive (bool): If True, also rename the files in every folder below 'folder'.
         """
         target_folder = Path(folder)
         if not target_folder.is_dir():
             logging.error(f"Folder does not exist or is not a directory: {folder}")
             return
 
-        file_extension = file_extension.lstrip('.').lower()
-        files_to_rename = list(target_folder.glob(f"*.{file_extension}"))
-        if not files_to_rename:
-            logging.info(f"No '.{file_extension}' files found in {folder}.")
+        rules = dict(replacements or {})
+        if keyword:
+            rules[keyword] = new_keyword
+        try:
+            replacer = KeywordReplacer(rules, regex=regex, ignore_case=ignore_case)
+        except re.error as e:
+            logging.error(f"Invalid keyword pattern: {e}")
+            return
+        if not len(replacer):
+            logging.error("No keyword to replace.")
             return
 
+        file_extension = file_extension.strip().lstrip('.').lower()
+        select = _any_file if not file_extension or file_extension == "*" else _extension_filter([file_extension])
+
         logging.info(
             f"Keyword rename in '{folder}', extension='.{file_extension}', "
-            f"keyword='{keyword}', new_keyword='{new_keyword}', "
+            f"keywords={rules}, regex={regex}, ignore_case={ignore_case}, recursive={recursive}, "
             f"preserve_timestamps={preserve_timestamps}, dry_run={dry_run}"
         )
 
-        for old_path in files_to_rename:
-            if keyword not in old_path.stem:
-                continue  # Skip files that do not include the keyword
-
-            new_stem = old_path.stem.replace(keyword, new_keyword)
-            new_name = f"{new_stem}{old_path.suffix}"
-            new_path = old_path.with_name(new_name)
-
-            if dry_run:
-                logging.info(f"[DRY RUN] {old_path.name} -> {new_name}")
-            else:
-                old_times = (0.0, 0.0)
-                if preserve_timestamps:
-                    stat_info = old_path.stat()
-                    old_times = (stat_info.st_atime, stat_info.st_mtime)
-                try:
-                    old_path.rename(new_path)
-                    logging.info(f"Renamed: {old_path.name} -> {new_name}")
-                    if preserve_timestamps:
-                        os.utime(new_path, (old_times[0], old_times[1]))
-                    self._history.append((new_path, old_path, old_times))
-                except Exception as e:
-                    logging.error(f"Error renaming {old_path.name} to {new_name}: {e}")
-
+        seen = 0
+
+        def batches() -> Iterator[List[Tuple[Path, str]]]:
+            nonlocal seen
+            for directory, names in walk_files(target_folder, select, recursive):
+                seen += len(names)
+                batch = []
+                for name in names:
+                    old_path = directory / name
+                    new_stem = replacer.apply(old_path.stem)
+                    if new_stem == old_path.stem:
+                        continue  # Skip files that do not include any keyword
+                    if not new_stem.strip():
+                        logging.warning(f"Skipping {old_path.name}: nothing would be left of its name.")
+                        continue
+                    batch.append((old_path, f"{new_stem}{old_path.suffix}"))
+                yield batch
+
+        plan = Plan("rename", str(target_folder), options={"operation": "keyword_rename"})
+        self._rename_tree(plan, batches(), dry_run, preserve_timestamps, recursive)
+        if seen == 0:
+            logging.info(f"No '.{file_extension}' files found in {folder}.")
+            return
         logging.info("Keyword-based renaming complete.")
+        return plan
 
     # --------------------------------------------------------------------------
     # 4) Undo
     # --------------------------------------------------------------------------
-    def undo(self):
-        if not self._history:
+    def undo(self, last: Optional[int] = None, session: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Reverts renames in parallel; chained renames are undone newest
+        first (see undo.py). By default this reverts what this object
+        renamed, or the most recent journaled rename run when it has
+        renamed nothing yet (e.g. after a restart). 'last' limits the undo to
+        the N most recent renames and 'session' picks a journaled session.
+        Returns how many operations were reverted and how many were tried;
+        the others stay pending.
+        """
+        if self.journal is None or (self._history and session is None and last is None):
+            # What this object did itself is already in memory; no need to read the journal back.
+            ops = [op for op in self._history if session is None or op.session == session]
+            if last is not None:
+                ops = ops[-last:] if last > 0 else []
+        else:
+            ops = self.journal.pending(kind="rename", sessions=[session] if session else None, last=last)
+        if not ops:
             logging.info("Nothing to undo for renamer.")
-            return
+            return 0, 0
 
         logging.info("Initiating undo operation for renames...")
-        while self._history:
-            current_path, old_path, old_times = self._history.pop()
-            if current_path.exists():
-                try:
-                    old_path.parent.mkdir(parents=True, exist_ok=True)
-                    current_path.rename(old_path)
-                    logging.info(f"Undo rename: {current_path.name} -> {old_path.name}")
-                    if old_times != (0.0, 0.0):
-                        os.utime(old_path, (old_times[0], old_times[1]))
-                except Exception as e:
-                    logging.error(f"Error undoing rename {current_path} -> {old_path}: {e}")
-            else:
-                logging.warning(f"File missing: {current_path}, cannot undo.")
-
-        logging.info("Undo operation finished.")
+        done = undo_operations(ops, self.journal)
+        self.record_undo(done)
+        logging.info("Undo operation finished: %d of %d operation(s) reverted.", len(done), len(ops))
+        return len(done), len(ops)
+
+    def record_undo(self, done: List[JournalOp]):
+        """Updates the tag cache and the history for operations undone by undo_operations()."""
+        if self.tag_cache:
+            self.tag_cache.record_undo(done)
+            self.tag_cache.flush()
+        undone = {(op.session, op.seq) for op in done}
+        self._history = [op for op in self._history if (op.session, op.seq) not in undone]
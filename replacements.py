@@ -0,0 +1,45 @@
+# replacements.py
+import re
+from typing import List, Mapping, Optional
+
+
+class KeywordReplacer:
+    """
+    Applies many keyword -> replacement rules to a name in a single scan.
+
+    All keywords are compiled into one regular expression, an alternation of
+    named groups, so each name is scanned once however many rules there are;
+    the group that matched tells which replacement to insert. Literal keywords
+    are tried longest first, so "[YTS.MX]" wins over "[YTS". With 'regex',
+    keywords are regular expressions and replacements may use their group
+    references (\\1, \\g<name>). Replacements are inserted as-is and never
+    scanned again, so rules cannot feed into each other.
+    """
+
+    def __init__(self, replacements: Mapping[str, str], regex: bool = False, ignore_case: bool = False):
+        keywords = [keyword for keyword in replacements if keyword]
+        if not regex:
+            keywords.sort(key=len, reverse=True)
+        self.replacements: List[str] = [replacements[keyword] for keyword in keywords]
+        flags = re.IGNORECASE if ignore_case else 0
+        # Each regex is also compiled alone, to expand its group references in its own numbering.
+        self._patterns: Optional[List[re.Pattern]] = (
+            [re.compile(keyword, flags) for keyword in keywords] if regex else None)
+        alternatives = [f"(?P<k{i}>{keyword if regex else re.escape(keyword)})" for i, keyword in enumerate(keywords)]
+        self._combined = re.compile("|".join(alternatives), flags) if alternatives else None
+
+    def __len__(self) -> int:
+        return len(self.replacements)
+
+    def apply(self, name: str) -> str:
+        """Returns 'name' with every match replaced (unchanged if nothing matched)."""
+        if self._combined is None:
+            return name
+        return self._combined.sub(lambda match: self._replacement(match, name), name)
+
+    def _replacement(self, match: re.Match, name: str) -> str:
+        i = int(match.lastgroup[1:])  # type: ignore
+        if self._patterns is None:
+            return self.replacements[i]
+        own = self._patterns[i].match(name, match.start())
+        return own.expand(self.replacements[i]) if own else match.group(0)
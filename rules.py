@@ -0,0 +1,155 @@
+# rules.py
+import re
+import time
+import logging
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+DEFAULT_CATEGORY = "Others"
+
+_SECONDS_PER_DAY = 86400
+
+
+class _PredicateRule:
+    __slots__ = ("category", "order", "min_size", "max_size", "min_age", "max_age", "pattern")
+
+    def __init__(self, category: str, order: Tuple[int, int], spec: dict):
+        self.category = category
+        self.order = order
+        self.min_size: Optional[int] = spec.get("min_size")
+        self.max_size: Optional[int] = spec.get("max_size")
+        self.min_age: Optional[float] = None
+        self.max_age: Optional[float] = None
+        if spec.get("min_age_days") is not None:
+            self.min_age = float(spec["min_age_days"]) * _SECONDS_PER_DAY
+        if spec.get("max_age_days") is not None:
+            self.max_age = float(spec["max_age_days"]) * _SECONDS_PER_DAY
+        self.pattern: Optional[Pattern[str]] = None
+        if spec.get("pattern"):
+            self.pattern = re.compile(spec["pattern"])
+
+    def matches(self, name: str, size: Optional[int], mtime: Optional[float], now: float) -> bool:
+        if self.min_size is not None or self.max_size is not None:
+            if size is None:
+                return False
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if self.min_age is not None or self.max_age is not None:
+            if mtime is None:
+                return False
+            age = now - mtime
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        if self.pattern is not None and not self.pattern.search(name):
+            return False
+        return True
+
+
+_PREDICATE_KEYS = ("min_size", "max_size", "min_age_days", "max_age_days", "pattern")
+
+
+def _normalize_ext(ext: str) -> str:
+    return ext.strip().lstrip('.').lower()
+
+
+class RuleEngine:
+    """
+    Classification rules compiled once from the sort config.
+
+    A category maps either to a list of extensions (the classic format) or to
+    a dict with "extensions" plus optional predicates:
+        "min_size"/"max_size" (bytes), "min_age_days"/"max_age_days",
+        "pattern" (regex searched in the file name) and "priority".
+    Predicate rules are checked first, highest priority first (ties keep config
+    order); everything else is a single lookup in the extension index.
+    Extensions may have several parts, e.g. "tar.gz".
+    """
+
+    def __init__(self, sort_rules: Dict[str, Union[List[str], dict]]):
+        self._ext_index: Dict[str, str] = {}
+        self._multi_exts: set = set()
+        self._max_parts = 1
+        by_ext: Dict[str, List[_PredicateRule]] = {}
+        any_ext: List[_PredicateRule] = []
+
+        for position, (category, spec) in enumerate(sort_rules.items()):
+            if isinstance(spec, dict):
+                exts = [_normalize_ext(e) for e in spec.get("extensions", [])]
+                has_predicates = any(spec.get(k) is not None for k in _PREDICATE_KEYS)
+            else:
+                exts = [_normalize_ext(e) for e in spec]
+                has_predicates = False
+
+            for ext in exts:
+                parts = ext.count('.') + 1
+                if parts > 1:
+                    self._multi_exts.add(ext)
+                    self._max_parts = max(self._max_parts, parts)
+
+            if not has_predicates:
+                for ext in exts:
+                    # First category listing an extension wins, as with the old linear scan.
+                    self._ext_index.setdefault(ext, category)
+                continue
+
+            try:
+                rule = _PredicateRule(category, (-int(spec.get("priority", 0)), position), spec)
+            except (re.error, TypeError, ValueError) as e:
+                logging.error(f"Ignoring invalid rule for category '{category}': {e}")
+                continue
+            if exts:
+                for ext in exts:
+                    by_ext.setdefault(ext, []).append(rule)
+            else:
+                any_ext.append(rule)
+
+        any_ext.sort(key=lambda r: r.order)
+        self._any_predicates: List[_PredicateRule] = any_ext
+        # Precompute, per extension, the full ordered list of predicate rules to try.
+        self._predicates: Dict[str, List[_PredicateRule]] = {
+            ext: sorted(rules + any_ext, key=lambda r: r.order) for ext, rules in by_ext.items()
+        }
+
+    def extension_of(self, name: str) -> str:
+        """
+        Returns the lowercased extension of 'name' without the leading dot,
+        preferring the longest configured multi-part extension ("tar.gz").
+        """
+        lower = name.lower()
+        dot = lower.rfind('.')
+        if dot <= 0:
+            return ""
+        ext = lower[dot + 1:]
+        start = dot
+        for _ in range(self._max_parts - 1):
+            start = lower.rfind('.', 0, start)
+            if start <= 0:
+                break
+            candidate = lower[start + 1:]
+            if candidate in self._multi_exts:
+                ext = candidate
+        return ext
+
+    def split_name(self, name: str) -> Tuple[str, str]:
+        """Splits 'name' into (stem, suffix) where suffix keeps its dot, e.g. ("backup", ".tar.gz")."""
+        ext = self.extension_of(name)
+        if not ext:
+            return name, ""
+        cut = len(name) - len(ext) - 1
+        return name[:cut], name[cut:]
+
+    def category_for_extension(self, ext: str) -> str:
+        return self._ext_index.get(ext, DEFAULT_CATEGORY)
+
+    def classify(self, name: str, size: Optional[int] = None, mtime: Optional[float] = None) -> str:
+        ext = self.extension_of(name)
+        predicates = self._predicates.get(ext, self._any_predicates)
+        if predicates:
+            now = time.time()
+            for rule in predicates:
+                if rule.matches(name, size, mtime, now):
+                    return rule.category
+        return self._ext_index.get(ext, DEFAULT_CATEGORY)
@@ -0,0 +1,111 @@
+# scanner.py
+import os
+import stat
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Iterator, List, NamedTuple
+
+
+class ScanEntry(NamedTuple):
+    """
+    Lightweight record for one directory entry, filled from a single stat()
+    so later sorting stages never have to touch the disk again to ask
+    "is this a file?", "how big is it?" or "when was it modified?".
+    """
+    path: Path
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+    dev: int
+    inode: int
+
+    @property
+    def is_file(self) -> bool:
+        return not self.is_dir
+
+    @property
+    def stem(self) -> str:
+        return self.path.stem
+
+    @property
+    def suffix(self) -> str:
+        return self.path.suffix
+
+
+def entry_from_dirent(dirent: os.DirEntry, parent: Path) -> ScanEntry:
+    # DirEntry.stat() caches its result, so this is the only stat per entry.
+    st = dirent.stat()
+    return ScanEntry(
+        path=parent / dirent.name,
+        name=dirent.name,
+        is_dir=stat.S_ISDIR(st.st_mode),
+        size=st.st_size,
+        mtime=st.st_mtime,
+        dev=st.st_dev,
+        inode=st.st_ino,
+    )
+
+
+def entry_from_path(path: Path) -> ScanEntry:
+    st = os.stat(path)
+    return ScanEntry(
+        path=path,
+        name=path.name,
+        is_dir=stat.S_ISDIR(st.st_mode),
+        size=st.st_size,
+        mtime=st.st_mtime,
+        dev=st.st_dev,
+        inode=st.st_ino,
+    )
+
+
+def iter_directory(source_path: Path) -> Iterator[ScanEntry]:
+    """
+    Yields a ScanEntry for every direct child of 'source_path' using os.scandir.
+    Entries that vanish or cannot be stat'ed (e.g. broken symlinks) are skipped.
+    """
+    with os.scandir(source_path) as it:
+        for dirent in it:
+            try:
+                yield entry_from_dirent(dirent, source_path)
+            except OSError as e:
+                logging.warning(f"Skipping unreadable entry {dirent.path}: {e}")
+
+
+def scan_directory(source_path: Path) -> List[ScanEntry]:
+    return list(iter_directory(source_path))
+
+
+def device_of(path: Path) -> int:
+    """st_dev of 'path', or of its nearest existing parent if it does not exist yet."""
+    for candidate in (path, *path.parents):
+        try:
+            return os.stat(candidate).st_dev
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return -1
+
+
+def sample_tree(root: Path, budget: int) -> Iterator[os.DirEntry]:
+    """
+    Breadth-first scandir walk below 'root' that stops after 'budget' entries.
+    Shallow entries come first, so a bounded sample still reflects what the
+    folder mostly contains. Symlinked directories are not followed.
+    """
+    queue = deque([root])
+    remaining = budget
+    while queue and remaining > 0:
+        current = queue.popleft()
+        try:
+            with os.scandir(current) as it:
+                for dirent in it:
+                    yield dirent
+                    remaining -= 1
+                    if remaining <= 0:
+                        return
+                    if dirent.is_dir(follow_symlinks=False):
+                        queue.append(dirent.path)
+        except OSError as e:
+            logging.warning(f"Cannot read {current}: {e}")
@@ -1,25 +1,86 @@
 import os
-import shutil
 import threading
-import re
 import psutil
+from collections import Counter
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional, Union
+import hashlib
 import json
 import logging
+import sqlite3
 import time
-from concurrent.futures import ThreadPoolExecutor
+
+from scanner import ScanEntry, device_of, entry_from_path, sample_tree, scan_directory
+from folder_cache import FolderCache
+from file_index import FileIndex, IndexRow, open_file_index
+from name_index import NameIndex
+from placement import place
+from move_engine import CrossDeviceMover
+from io_scheduler import IOScheduler
+from journal import Journal, JournalOp, JournalSession, open_journal
+from undo import undo_operations
+from rules import RuleEngine
+from title_parser import TitleParser
+from fuzzy_grouping import FuzzyTitleGrouper
+from log_sink import item_log
+from stats import RunStats
+from utils import CancelToken, OperationCancelled, Progress, get_state_dir
+from plan import ESTIMATED, IDENTICAL, RENAMED, Plan, PlanEntry
+from dedup import POLICIES, DuplicateFinder
+
+# Plan phases: series folders are filled first, then everything else is sorted,
+# then series folders created inside the source are sorted themselves.
+_PHASE_GROUP = 0
+_PHASE_CATEGORY = 1
+_PHASE_SERIES_FOLDER = 2
 
 class FileSorter:
     def __init__(self, config_path: str = 'config.json'):
         self.config_path = config_path
         self.sort_rules = self._load_config(config_path)
-        self._history: List[Tuple[Path, Path]] = []
+        self.settings: dict = self.sort_rules.pop("settings", {})
+        self.rules = RuleEngine(self.sort_rules)
+        self.title_parser = TitleParser(self.settings.get("title_blacklist"))
+        self.fuzzy_grouping: bool = bool(self.settings.get("fuzzy_grouping", False))
+        self.fuzzy_grouper = FuzzyTitleGrouper(float(self.settings.get("fuzzy_threshold", 0.75)))
+        self.folder_sample_size: int = int(self.settings.get("folder_sample_size", 50))
+        # Move items an earlier run sorted into a category into new series folders with new arrivals.
+        self.regroup_sorted: bool = bool(self.settings.get("regroup_sorted", False))
+        self.folder_cache: Optional[FolderCache] = self._open_folder_cache()
+        self.journal: Optional[Journal] = self._open_journal()
+        self.file_index: Optional[FileIndex] = self._open_file_index()
+        self._rules_key = self._rules_fingerprint()
+        self._unchanged: Dict[str, IndexRow] = {}
+        self._indexed_names: Set[str] = set()
+        self._subfolder_cache: Dict[str, Set[str]] = {}
+        self._placed: List[Tuple[PlanEntry, Path]] = []
+        self._moved: Counter = Counter()  # Destination folder -> items moved there by the current run.
+        self.mover = CrossDeviceMover(verify=bool(self.settings.get("verify_copies", False)))
+        self.max_same_device_workers: int = int(self.settings.get("max_same_device_workers", 64))
+        self.max_cross_device_workers: int = int(self.settings.get("max_cross_device_workers", 8))
+        self.last_io_stats: List[dict] = []
+        # Phase timers, counters and move latencies of the last sort (see stats.py).
+        self.last_stats: Optional[RunStats] = None
+        self._stats = RunStats("sort")
+        self._thread = threading.local()
+        self._scheduler: Optional[IOScheduler] = None
+        self._dest_dev = -1
+        self._history: List[JournalOp] = []
+        self._session: Optional[JournalSession] = None
         self._lock = threading.Lock()
-        self._grouped_folders: set = set()
+        self._group_dirs: Set[Path] = set()
+        self._made_dirs: Set[Path] = set()
+        self._name_index = NameIndex(self.rules.split_name)
         self.series_mode: bool = False
+        self.dedup_policy: Optional[str] = self._check_dedup_policy(self.settings.get("dedup"))
+        self.quarantine_folder: str = str(self.settings.get("quarantine_folder", "Duplicates"))
+        # Folder names the sorter creates in the destination; never sorted themselves.
+        self.reserved_folders: Set[str] = set(self.sort_rules) | {"Others", "EmptyFolders", self.quarantine_folder}
+        # Set by the GUI's worker thread for the duration of one operation.
+        self.cancel_token: Optional[CancelToken] = None
+        self.progress: Optional[Progress] = None
 
-    def _load_config(self, config_path: str) -> Dict[str, List[str]]:
+    def _load_config(self, config_path: str) -> Dict[str, Union[List[str], dict]]:
         if not os.path.exists(config_path):
             logging.warning(f"Config file {config_path} not found. Using default rules.")
             return {
@@ -27,193 +88,751 @@ class FileSorter:
                 "Documents": ["pdf", "doc", "docx", "txt", "xls", "xlsx"],
                 "Audio": ["mp3", "wav", "ogg"],
                 "Video": ["mp4", "mov", "avi", "mkv"],
-                "Archives": ["zip", "rar", "7z"],
+                "Archives": ["zip", "rar", "7z", "tar.gz", "tar.bz2", "tar.xz"],
             }
         else:
             with open(config_path, 'r', encoding='utf-8') as f:
                 return json.load(f)
 
+    def _open_folder_cache(self) -> Optional[FolderCache]:
+        option = self.settings.get("folder_cache", True)
+        if not option:
+            return None
+        try:
+            db_path = Path(option) if isinstance(option, str) else get_state_dir() / "folder_cache.sqlite"
+            return FolderCache(db_path)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Folder cache disabled: {e}")
+            return None
+
+    def _open_journal(self) -> Optional[Journal]:
+        option = self.settings.get("journal", True)
+        if not option:
+            return None
+        try:
+            return open_journal(Path(option) if isinstance(option, str) else None)
+        except OSError as e:
+            logging.warning(f"Operation journal disabled, undo will not survive a restart: {e}")
+            return None
+
+    def _open_file_index(self) -> Optional[FileIndex]:
+        option = self.settings.get("file_index", True)
+        if not option:
+            return None
+        try:
+            return open_file_index(Path(option) if isinstance(option, str) else None)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"File index disabled, every run will classify all entries: {e}")
+            return None
+
+    def _rules_fingerprint(self) -> str:
+        # Indexed categories and titles are only reused while the rules that produced them are unchanged.
+        rules = json.dumps([self.sort_rules, sorted(self.title_parser.blacklist)], sort_keys=True, default=str)
+        return hashlib.blake2b(rules.encode("utf-8"), digest_size=8).hexdigest()
+
+    def _check_dedup_policy(self, policy) -> Optional[str]:
+        if not policy:
+            return None
+        if policy not in POLICIES:
+            logging.warning(f"Unknown dedup policy {policy!r} (expected one of {', '.join(POLICIES)}); dedup disabled.")
+            return None
+        return policy
+
     def _has_enough_space(self, path: Path, required_bytes: int) -> bool:
         usage = psutil.disk_usage(path.drive)
         return usage.free >= required_bytes
 
     def _extract_title(self, name: str) -> str:
-        name = Path(name).stem.lower()
-        name = re.sub(r"[\[\(\{].*?[\]\)\}]", "", name)
-        name = re.sub(r"[\[\(\{].*", "", name)
-        name = re.sub(r"[.\\/_-]+", " ", name)
-        name = re.sub(r"\s+", " ", name).strip()
-
-        blacklist_tokens = {
-            "season", "episode", "ep", "e", "s", "part", "complete", "final", "finale",
-            "brrip", "webrip", "hdrip", "bluray", "x264", "x265", "1080p", "720p", "galaxytv",
-            "sujaidr", "xvid", "afg", "web", "rip", "brip", "dvdrip", "cam", "hd", "uhd",
-            "yify", "hdtv", "memento", "aac", "hevc", "ac3", "amzn", "dl", "subs", "internal",
-            "10bit", "5.1", "esubs", "mp4", "mkv", "tgx", "nf"
-        }
-
-        tokens = name.split()
-        clean_tokens = []
-        for token in tokens:
-            if token.isdigit():
-                continue
-            if re.fullmatch(r"(19|20)\d{2}", token):
-                continue
-            if re.fullmatch(r"s\d{1,2}e\d{1,2}", token, re.IGNORECASE):
-                continue
-            if re.fullmatch(r"[se]\d{1,2}", token, re.IGNORECASE):
-                continue
-            if re.fullmatch(r"season\s*\d{1,2}", token, re.IGNORECASE):
-                continue
-            if token.lower() in blacklist_tokens:
-                continue
-            clean_tokens.append(token)
+        return self.title_parser.extract(name)
 
-        title = " ".join(clean_tokens).strip()
-        title = re.sub(r"^[\-_.\s]+|[\-_.\s]+$", "", title)
-        return title.title()
-
-    def _group_similar_items(self, items: List[Path], base_dest: Path, dry_run: bool = False, group_files: bool = True) -> List[Path]:
-        groups: Dict[str, List[Path]] = {}
-        for item in items:
-            if item.is_file() and not group_files:
-                continue
-            title = self._extract_title(item.name)
+    def _group_similar_items(self, items: List[ScanEntry], base_dest: Path, plan: Plan,
+                             group_files: bool = True) -> Set[Path]:
+        groups: Dict[str, List[ScanEntry]] = {}
+        if not group_files:
+            items = [e for e in items if e.is_dir]
+        with self._stats.phase("titles"):
+            titles = self._titles_of(items)
+        for entry in items:
+            title = titles[entry.name]
             if not title:
                 continue
-            groups.setdefault(title, []).append(item)
+            groups.setdefault(title, []).append(entry)
 
-        moved = []
+        if self.fuzzy_grouping and len(groups) > 1:
+            representatives = self.fuzzy_grouper.cluster({t: len(g) for t, g in groups.items()})
+            merged: Dict[str, List[ScanEntry]] = {}
+            for title, group_items in groups.items():
+                merged.setdefault(representatives[title], []).extend(group_items)
+            groups = merged
+
+        grouped: Set[Path] = set()
+        singles: Dict[str, List[ScanEntry]] = {}
         for title, group_items in groups.items():
-            if len(group_items) <= 1:
-                continue
+            group_folder = self._existing_group_folder(group_items[0], title, base_dest)
+            if group_folder is None:
+                if len(group_items) <= 1:
+                    singles[title] = group_items
+                    continue
+                group_folder = base_dest / title
+                self._group_dirs.add(group_folder)
+            for entry in group_items:
+                self._plan_move(plan, entry, group_folder, _PHASE_GROUP)
+                grouped.add(entry.path)
+
+        # With 'regroup_sorted', a lone item still forms a group with items of the same title that
+        # earlier runs sorted into a category; the index knows them without walking the destination.
+        for title, found in self._indexed_singles(singles, base_dest).items():
             group_folder = base_dest / title
-            if not dry_run:
-                group_folder.mkdir(parents=True, exist_ok=True)
+            self._group_dirs.add(group_folder)
+            for entry in singles[title] + found:
+                self._plan_move(plan, entry, group_folder, _PHASE_GROUP)
+                grouped.add(entry.path)
+        return grouped
+
+    def _titles_of(self, items: List[ScanEntry]) -> Dict[str, str]:
+        titles = {}
+        unknown = []
+        for entry in items:
+            row = self._unchanged.get(entry.name)
+            if row is not None:
+                titles[entry.name] = row.title
             else:
-                logging.info(f"[DRY RUN] Would create group folder: {group_folder}")
-            for item in group_items:
-                target_path = group_folder / item.name
-                counter = 1
-                while not dry_run and target_path.exists():
-                    target_path = group_folder / f"{item.stem}_{counter}{item.suffix}"
-                    counter += 1
+                unknown.append(entry.name)
+        titles.update(self.title_parser.extract_many(unknown))
+        self._stats.count("titles_parsed", len(unknown))
+        return titles
+
+    def _indexed_singles(self, singles: Dict[str, List[ScanEntry]], base_dest: Path) -> Dict[str, List[ScanEntry]]:
+        if not self.regroup_sorted or self.file_index is None or not singles:
+            return {}
+        dest = os.path.abspath(base_dest)
+        categories = self.reserved_folders
+        found: Dict[str, List[ScanEntry]] = {}
+        for title, rows in self.file_index.with_titles(base_dest, singles).items():
+            for row in rows:
+                if os.path.dirname(row.parent) != dest or os.path.basename(row.parent) not in categories:
+                    continue  # Already in a series folder.
                 try:
-                    with self._lock:
-                        if not dry_run:
-                            if item.drive == target_path.drive:
-                                os.rename(str(item), str(target_path))
-                            else:
-                                shutil.move(str(item), str(target_path))
-                            self._history.append((target_path, item))
-                        else:
-                            logging.info(f"[DRY RUN] Would move {item} -> {target_path}")
-                        self._grouped_folders.add(item)
-                    moved.append(item)
-                except Exception as e:
-                    logging.error(f"Error moving {item} -> {target_path}: {e}")
-        return moved
+                    entry = entry_from_path(Path(row.path))
+                except OSError:
+                    continue  # Moved or deleted since it was indexed.
+                if entry.inode == row.inode and entry.path != singles[title][0].path:
+                    found.setdefault(title, []).append(entry)
+        return found
+
+    def _new_scheduler(self) -> IOScheduler:
+        # Moves run on per-device lanes: wide for same-device renames, narrow for copies.
+        return IOScheduler(same_device=(16, self.max_same_device_workers),
+                           cross_device=(2, self.max_cross_device_workers))
 
-    def _scan_directory(self, source_path: Path) -> List[Path]:
-        return [source_path / p for p in os.listdir(source_path)]
+    def _device_key(self, entry: ScanEntry) -> Tuple[int, int]:
+        return (entry.dev, self._dest_dev)
 
-    def _classify_file(self, file_path: Path) -> str:
-        ext = file_path.suffix.lower().lstrip('.')
-        for category, exts in self.sort_rules.items():
-            if ext in exts:
-                return category
-        return "Others"
+    def _scan_directory(self, source_path: Path) -> List[ScanEntry]:
+        return scan_directory(source_path)
+
+    def _classify_file(self, entry: ScanEntry) -> str:
+        return self.rules.classify(entry.name, entry.size, entry.mtime)
+
+    def _classify_folder(self, entry: ScanEntry) -> Optional[str]:
+        file_extensions_count = self.folder_cache.lookup(entry) if self.folder_cache else None
+        if file_extensions_count is not None:
+            self._stats.count("folder_cache_hits")
+            return self._category_from_histogram(file_extensions_count)
 
-    def _classify_folder(self, folder_path: Path) -> Optional[str]:
         file_extensions_count = {}
-        for i, file in enumerate(folder_path.rglob("*")):
-            if file.is_file():
-                ext = file.suffix.lower().lstrip('.')
-                file_extensions_count[ext] = file_extensions_count.get(ext, 0) + 1
-            if i > 50:
-                break
+        with self._stats.phase("folder_sampling"):
+            for dirent in sample_tree(entry.path, self.folder_sample_size):
+                if dirent.is_file():
+                    ext = self.rules.extension_of(dirent.name)
+                    file_extensions_count[ext] = file_extensions_count.get(ext, 0) + 1
+        self._stats.count("folders_sampled")
+        category = self._category_from_histogram(file_extensions_count)
+        if self.folder_cache:
+            self.folder_cache.store(entry, category, file_extensions_count)
+        return category
+
+    def _category_from_histogram(self, file_extensions_count: Dict[str, int]) -> Optional[str]:
         if not file_extensions_count:
             return None
         most_common_ext = max(file_extensions_count, key=file_extensions_count.get)  # type: ignore
-        for category, exts in self.sort_rules.items():
-            if most_common_ext in exts:
-                return category
-        return "Others"
+        return self.rules.category_for_extension(most_common_ext)
 
-    def _sort_item(self, item_path: Path, base_dest: Path, dry_run: bool = False):
-        if item_path in self._grouped_folders:
-            return
-        if self.series_mode:
-            return
-
-        if item_path.is_dir():
-            category = self._classify_folder(item_path)
+    def _destination_for(self, entry: ScanEntry, base_dest: Path) -> Path:
+        row = self._unchanged.get(entry.name)
+        if row is not None and row.category:
+            return base_dest / row.category
+        if entry.is_dir:
+            category = self._classify_folder(entry)
             if category is None:
                 category = "EmptyFolders"
-            dest_folder = base_dest / category
-            target_path = dest_folder / item_path.name
         else:
-            category = self._classify_file(item_path)
-            dest_folder = base_dest / category
-            target_path = dest_folder / item_path.name
+            category = self._classify_file(entry)
+        return base_dest / category
 
-        if not dry_run:
-            dest_folder.mkdir(parents=True, exist_ok=True)
+    def _plan_move(self, plan: Plan, entry: ScanEntry, dest_folder: Path, phase: int):
+        target = self._name_index.reserve(dest_folder, entry.name)
+        plan.add(entry.path, target, entry.mtime, entry.size, entry.dev, entry.is_dir, phase,
+                 RENAMED if target.name != entry.name else "")
 
-        final_path = target_path
-        counter = 1
-        while not dry_run and final_path.exists():
-            final_path = target_path.parent / f"{target_path.stem}_{counter}{target_path.suffix}"
-            counter += 1
+    def _existing_group_folder(self, entry: ScanEntry, title: str, base_dest: Path) -> Optional[Path]:
+        # A series folder from an earlier run sits either directly in the
+        # destination or, once sorted itself, in the category of its files.
+        if title in self.reserved_folders:
+            return None
+        if title in self._subfolders(base_dest, ""):
+            folder = base_dest / title
+            if not (entry.is_dir and entry.name == title and folder == entry.path):
+                return folder
+        if entry.is_file:
+            category = self._classify_file(entry)
+            if title in self._subfolders(base_dest, category):
+                return base_dest / category / title
+        return None
 
-        try:
-            if not dry_run:
-                if item_path.drive == final_path.drive:
-                    os.rename(str(item_path), str(final_path))
+    def _subfolders(self, base_dest: Path, category: str) -> Set[str]:
+        # Each folder is listed once per run, so checking thousands of titles costs no stat() each.
+        names = self._subfolder_cache.get(category)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(base_dest / category) as it:
+                    names.update(dirent.name for dirent in it if dirent.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+            self._subfolder_cache[category] = names
+        return names
+
+    def _same_folder(self, source: Path, dest: Path) -> bool:
+        return dest.exists() and os.path.samefile(source, dest)
+
+    def _build_plan(self, source: Path, dest: Path, all_items: Optional[List[ScanEntry]] = None,
+                    index_all: bool = False) -> Plan:
+        plan = Plan("sort", str(source), str(dest), {"series_mode": self.series_mode, "fuzzy": self.fuzzy_grouping,
+                                                      "dedup": self.dedup_policy})
+        items = self._plan_items(plan, source, dest, all_items)
+        if self.dedup_policy:
+            with self._stats.phase("dedup"):
+                self._dedup(plan, items, dest)
+            self._check_cancel()
+        if not self.series_mode and self._same_folder(source, dest):
+            self._plan_series_folders(plan, items, dest)
+        if self.file_index is not None:
+            with self._stats.phase("index"):
+                self._index_seen(plan, items, index_all)
+        self._stats.count("planned", len(plan))
+        return plan
+
+    def _plan_series_folders(self, plan: Plan, all_items: List[ScanEntry], dest: Path):
+        # Group folders created inside the source are sorted like any other
+        # folder once they are filled; their category is estimated from the
+        # files planned into them and worked out again on apply.
+        scanned_names = {e.name for e in all_items}
+        members: Dict[str, Dict[str, int]] = {}
+        for src, dst, is_dir in zip(plan.src, plan.dst, plan.is_dir):
+            if not is_dir:
+                ext = self.rules.extension_of(os.path.basename(src))
+                histogram = members.setdefault(os.path.dirname(dst), {})
+                histogram[ext] = histogram.get(ext, 0) + 1
+        for folder in sorted(self._group_dirs):
+            if folder.name in scanned_names:
+                continue
+            category = self._category_from_histogram(members.get(str(folder), {})) or "EmptyFolders"
+            target = self._name_index.reserve(dest / category, folder.name)
+            plan.add(folder, target, None, 0, self._dest_dev, True, _PHASE_SERIES_FOLDER, ESTIMATED)
+
+    def _dedup(self, plan: Plan, items: List[ScanEntry], dest: Path):
+        """
+        Finds planned files whose content already exists, among the other
+        planned files or in the file whose name they would have taken at the
+        destination, and applies the dedup policy to all but the oldest copy:
+        "skip" leaves them in the source, "quarantine" moves them to the
+        quarantine folder instead, "hardlink" turns them into hard links to
+        that copy right before they are placed.
+        """
+        scanned = {str(e.path): e for e in items}
+        files: List[ScanEntry] = []
+        index_of: Dict[Path, int] = {}
+        taken_paths: Set[Path] = set()
+        for i, entry in enumerate(plan.entries()):
+            if entry.is_dir or entry.note == ESTIMATED:
+                continue
+            try:
+                scan = scanned.get(plan.src[i]) or entry_from_path(entry.src)
+            except OSError:
+                continue
+            files.append(scan)
+            index_of[scan.path] = i
+            if entry.note == RENAMED:
+                # The name is taken; if what took it on disk is the same file, this is a re-download.
+                try:
+                    taken = entry_from_path(entry.dst.parent / entry.src.name)
+                except OSError:
+                    continue
+                if not taken.is_dir and taken.path not in taken_paths:
+                    taken_paths.add(taken.path)
+                    files.append(taken)
+
+        finder = DuplicateFinder()
+        drop: Set[int] = set()
+        duplicates = saved = 0
+        for group in finder.groups(files):
+            keeper = min(group, key=lambda e: (e.path in index_of, e.mtime))  # Files already sorted win.
+            for entry in group:
+                i = index_of.get(entry.path)
+                if entry is keeper or i is None or (entry.dev, entry.inode) == (keeper.dev, keeper.inode):
+                    continue  # Hard links to the kept copy take no extra space.
+                duplicates += 1
+                saved += entry.size
+                if self.dedup_policy == "skip":
+                    drop.add(i)
+                    item_log.info("Skipping duplicate %s (same content as %s)", entry.path, keeper.path)
+                elif self.dedup_policy == "quarantine":
+                    plan.dst[i] = str(self._name_index.reserve(dest / self.quarantine_folder, entry.name))
+                    plan.phase[i] = _PHASE_CATEGORY
+                    plan.note[i] = IDENTICAL
                 else:
-                    shutil.move(str(item_path), str(final_path))
-                with self._lock:
-                    self._history.append((final_path, item_path))
-            else:
-                logging.info(f"[DRY RUN] Would move {item_path} -> {final_path}")
+                    plan.options.setdefault("links", {})[plan.src[i]] = [str(keeper.path), keeper.mtime]
+                    plan.note[i] = IDENTICAL
+        plan.drop(drop)
+        if self.dedup_policy != "hardlink":
+            self._dissolve_single_groups(plan, scanned, dest)
+        if finder.bytes_total:
+            logging.info(
+                f"Duplicates: {duplicates} file(s), {saved / 1048576:.1f} MiB ({self.dedup_policy}). "
+                f"Hashed {finder.bytes_hashed / 1048576:.1f} of {finder.bytes_total / 1048576:.1f} MiB."
+            )
+
+    def _dissolve_single_groups(self, plan: Plan, scanned: Dict[str, ScanEntry], dest: Path):
+        # A new series folder that lost all but one member to dedup is not created;
+        # the remaining item is sorted into its category instead.
+        members: Dict[str, List[int]] = {}
+        for i, (dst, phase) in enumerate(zip(plan.dst, plan.phase)):
+            if phase == _PHASE_GROUP:
+                members.setdefault(os.path.dirname(dst), []).append(i)
+        for folder, indices in members.items():
+            if len(indices) != 1 or Path(folder) not in self._group_dirs:
+                continue
+            i = indices[0]
+            entry = scanned.get(plan.src[i])
+            if entry is None:
+                continue
+            self._group_dirs.discard(Path(folder))
+            plan.dst[i] = str(self._name_index.reserve(self._destination_for(entry, dest), entry.name))
+            plan.phase[i] = _PHASE_CATEGORY
+
+    def _link_duplicates(self, plan: Plan):
+        # Each duplicate is replaced by a hard link to its kept copy before the
+        # moves start, while the kept copy is still where it was planned.
+        planned = {src: (mtime, size) for src, mtime, size in zip(plan.src, plan.mtime, plan.size)}
+        for src, (keeper, keeper_mtime) in plan.options.get("links", {}).items():
+            if src not in planned:
+                continue
+            try:
+                current, kept = os.stat(src), os.stat(keeper)
+            except OSError:
+                continue
+            if (current.st_mtime, current.st_size) != planned[src] or kept.st_mtime != keeper_mtime \
+                    or kept.st_size != current.st_size:
+                logging.warning(f"Not linking {src}: it or {keeper} changed since the duplicate check.")
+                continue
+            temp = os.path.join(os.path.dirname(src), f".{os.path.basename(src)}.kplink")
+            try:
+                os.link(keeper, temp)
+                os.replace(temp, src)
+            except OSError as e:
+                logging.warning(f"Could not hard-link duplicate {src} to {keeper}: {e}")
+                try:
+                    os.unlink(temp)
+                except OSError:
+                    pass
+                continue
+            # Journaled so that undo turns the link back into a separate file.
+            op = self._session.record("hardlink", Path(src), Path(keeper),  # type: ignore
+                                      (current.st_atime, current.st_mtime))
+            with self._lock:
+                self._history.append(op)
+            item_log.info("Hard-linked duplicate %s to %s", src, keeper)
+
+    def _index_seen(self, plan: Plan, items: List[ScanEntry], index_all: bool):
+        # Entries that stay where they are (left out of a series-mode sort, or all of them on a
+        # dry run) are indexed in place, so the next run does not classify or parse them again.
+        planned: Dict[str, Optional[str]] = {}
+        for src, dst, phase in zip(plan.src, plan.dst, plan.phase):
+            planned[src] = os.path.basename(os.path.dirname(dst)) if phase == _PHASE_CATEGORY else None
+        for entry in items:
+            if entry.name in self._unchanged:
+                continue
+            src = str(entry.path)
+            if src in planned and not index_all:
+                continue
+            self.file_index.record_entry(entry, planned.get(src), self._extract_title(entry.name),  # type: ignore
+                                         self._rules_key)
+
+    def _plan_items(self, plan: Plan, source: Path, dest: Path, all_items: Optional[List[ScanEntry]]) -> List[ScanEntry]:
+        # Items given by the caller (new arrivals) are sorted on their own. Any item may join
+        # a series folder that an earlier run created; items already sorted stay where they are.
+        if all_items is None:
+            if self.progress:
+                self.progress.start("scanning")
+            with self._stats.phase("scan"):
+                all_items = self._scan_directory(source)
+            if self.progress:
+                self.progress.add(scanned=len(all_items))
+        self._stats.count("scanned", len(all_items))
+        self._check_cancel()
+        if self._same_folder(source, dest):
+            # Category folders of an earlier in-place sort are results, not input.
+            all_items = [e for e in all_items if not (e.is_dir and e.name in self.reserved_folders)]
+        if self.file_index is not None:
+            # Entries indexed by an earlier run and unchanged since keep their title and category.
+            with self._stats.phase("index_lookup"):
+                known = self.file_index.folder(source)
+            for entry in all_items:
+                row = known.get(entry.name)
+                if row is not None and row.matches(entry, self._rules_key):
+                    self._unchanged[entry.name] = row
+            if self._unchanged:
+                logging.info(f"{len(self._unchanged)} of {len(all_items)} entries unchanged since they were indexed.")
+        # One scan serves both stages: grouped entries are simply filtered out.
+        with self._stats.phase("group"):
+            grouped_items = self._group_similar_items(all_items, dest, plan, group_files=True)
+        if self.series_mode:
+            return all_items
+
+        remaining_items = [e for e in all_items if e.path not in grouped_items]
+        with self._stats.phase("classify"):
+            # Folders are classified by sampling their contents, which is I/O, so that part runs on the lanes.
+            folder_futures = {
+                e.path: self._scheduler.submit(self._device_key(e), self._destination_for, e, dest)  # type: ignore
+                for e in remaining_items if e.is_dir
+            }
+            for entry in remaining_items:
+                self._check_cancel()
+                try:
+                    folder = folder_futures[entry.path].result() if entry.is_dir else self._destination_for(entry, dest)
+                except Exception as e:
+                    logging.error(f"Error classifying {entry.path}: {e}")
+                    continue
+                self._plan_move(plan, entry, folder, _PHASE_CATEGORY)
+
+        return all_items
+
+    def _check_cancel(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def _apply_entry(self, entry: PlanEntry, base_dest: Path, revalidate: bool):
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            return  # Not started; everything moved so far is journaled.
+        dest_folder, name = entry.dst.parent, entry.dst.name
+        if revalidate or entry.mtime is None:
+            self._stats.count("stat")
+            try:
+                current = entry_from_path(entry.src)
+            except FileNotFoundError:
+                logging.warning(f"Skipping {entry.src}: it no longer exists.")
+                return
+            changed = entry.mtime is None or current.mtime != entry.mtime or current.size != entry.size
+            if changed and entry.phase != _PHASE_GROUP:
+                # Only entries that changed since planning are classified again.
+                dest_folder, name = self._destination_for(current, base_dest), current.name
+        try:
+            self._ensure_folder(dest_folder)
+            final_path = self._move_item(entry.src, dest_folder, name)
         except Exception as e:
-            logging.error(f"Error moving {item_path} to {final_path}: {e}")
+            self._stats.count("failed")
+            logging.error(f"Error moving {entry.src} to {dest_folder}: {e}")
+            return
+        if final_path.name != entry.src.name:
+            self._stats.count("collisions")  # Planned with a "_N" suffix, or given one on a clash.
+        if not entry.is_dir:
+            self._stats.count("bytes_moved", entry.size)
+        if self.progress:
+            self.progress.add(done=1, nbytes=0 if entry.is_dir else entry.size)
+        if self.file_index is not None:
+            self._placed.append((entry, final_path))  # Indexed after this phase's moves, off the workers.
+
+    def _index_placed(self, entry: PlanEntry, final_path: Path):
+        if entry.phase == _PHASE_SERIES_FOLDER or entry.is_dir:
+            self.file_index.move(entry.src, final_path)  # type: ignore
+            if entry.phase == _PHASE_SERIES_FOLDER:
+                return  # Series folders are containers; their items are indexed.
+        elif entry.phase == _PHASE_GROUP or entry.src.name in self._indexed_names:
+            # Group members may come from the destination (indexed singles joining their series).
+            self.file_index.forget(entry.src)  # type: ignore
+        self._stats.count("stat")
+        try:
+            st = os.lstat(final_path)
+        except OSError:
+            return
+        if entry.phase == _PHASE_CATEGORY:
+            category: Optional[str] = final_path.parent.name
+        else:
+            category = None if entry.is_dir else self.rules.classify(final_path.name, st.st_size, st.st_mtime)
+        title = self._extract_title(entry.src.name)
+        self.file_index.record(final_path, st, category, title, self._rules_key)  # type: ignore
+
+    def _move_item(self, item_path: Path, dest_folder: Path, name: Optional[str] = None) -> Path:
+        # Atomic, never-overwriting rename; a clash just moves on to the next "_N" name.
+        self._thread.copied = False
+        t0 = time.perf_counter()
+        final_path = place(item_path, dest_folder, name or item_path.name, self._name_index,
+                           cross_device=self._copy_across, on_collision=self._on_collision)
+        elapsed = time.perf_counter() - t0
+        if self._thread.copied:
+            self._stats.observe("copy_seconds", elapsed)
+        else:
+            self._stats.observe("rename_seconds", elapsed, phase="same_device_rename")
+        op = self._session.record("move", item_path, final_path)  # type: ignore
+        with self._lock:
+            self._history.append(op)
+            self._moved[final_path.parent] += 1
+        return final_path
+
+    def _copy_across(self, src: Path, dst: Path):
+        # Called by place() when the rename fails with EXDEV.
+        self._thread.copied = True
+        with self._stats.phase("cross_device_copy"):
+            self.mover.move(src, dst)
+        self._stats.count("cross_device_copies")
+
+    def _on_collision(self, target: Path):
+        self._stats.count("collision_retries")
+
+    def _ensure_folder(self, folder: Path):
+        if folder in self._made_dirs:
+            return
+        missing = []
+        current = folder
+        while not current.exists():
+            missing.append(current)
+            current = current.parent
+        for path in reversed(missing):
+            try:
+                with self._stats.phase("mkdir"):
+                    path.mkdir()
+            except FileExistsError:
+                if not path.is_dir():
+                    raise
+                continue  # Created by another worker, which journals it.
+            self._stats.count("mkdir")
+            # Journaled so that undo removes exactly the folders this sort created.
+            op = self._session.record("mkdir", path, path)  # type: ignore
+            with self._lock:
+                self._history.append(op)
+        self._made_dirs.add(folder)
+        self._name_index.mark_taken(folder)
+
+    def _begin(self, dest: Path, operation: str = "sort"):
+        self._stats = RunStats(operation)
+        self._group_dirs = set()
+        self._made_dirs = set()
+        self._unchanged = {}
+        self._subfolder_cache = {}
+        self._name_index = NameIndex(self.rules.split_name)
+        self._dest_dev = device_of(dest)
+        self._scheduler = self._new_scheduler()
+
+    def _finish(self, moved: bool):
+        self._scheduler.shutdown(wait=True)  # type: ignore
+        self.last_io_stats = self._scheduler.stats()  # type: ignore
+        self._scheduler = None
+
+        with self._stats.phase("flush"):
+            # Sources of cross-device copies are deleted only once the copies are durable.
+            self.mover.flush()
+            if self.folder_cache:
+                self.folder_cache.flush()
+            if self.file_index:
+                self.file_index.flush()
+            if self.journal:
+                self.journal.flush()  # Last: raises if records were lost and the run cannot be fully undone.
+        self.last_stats = self._stats.finish()
+
+        if moved:
+            for lane in self.last_io_stats:
+                logging.info(
+                    f"Device {lane['source_device']} -> {lane['destination_device']}: {lane['completed']} items, "
+                    f"{lane['ops_per_sec']:.1f} items/s, {lane['bytes_per_sec'] / 1048576:.1f} MiB/s, "
+                    f"avg latency {lane['avg_latency_ms']:.2f} ms, final concurrency {lane['concurrency']}"
+                )
+
+    def _run_plan(self, plan: Plan, revalidate: bool):
+        dest = Path(plan.dest)
+        # Planned names were reserved in a separate index; start from what is on disk now.
+        self._name_index = NameIndex(self.rules.split_name)
+        self._session = JournalSession(self.journal, "sort", source=plan.source, dest=plan.dest)
+        self._moved = Counter()
+        if plan.options.get("links"):
+            with self._stats.phase("link"):
+                self._link_duplicates(plan)
+        if self.file_index is not None:
+            # Rows of items moved out of the source are dropped; items nobody indexed need no lookup.
+            self._indexed_names = set(self.file_index.folder(Path(plan.source)))
+        if self.progress:
+            self.progress.start("moving", total=len(plan),
+                                total_bytes=sum(size for size, is_dir in zip(plan.size, plan.is_dir) if not is_dir))
+        for phase in plan.phases():
+            with self._stats.phase("move"):
+                futures = [
+                    self._scheduler.submit((entry.dev if entry.dev >= 0 else self._dest_dev, self._dest_dev),  # type: ignore
+                                           self._apply_entry, entry, dest, revalidate,
+                                           nbytes=0 if entry.is_dir else entry.size)
+                    for entry in plan.entries(phase)
+                ]
+                for future in futures:
+                    future.result()
+            if self.file_index is not None:
+                # Indexed before the next phase moves the series folders these items went
+                # into; file_index.move() then carries their rows along.
+                placed, self._placed = self._placed, []
+                with self._stats.phase("index"):
+                    for entry, final_path in placed:
+                        self._index_placed(entry, final_path)
+        if self.progress:
+            self.progress.finish()
+        self._stats.count("moved", sum(self._moved.values()))
+        logging.info("Moved %d of %d item(s)%s.", sum(self._moved.values()), len(plan),
+                     self._by_category(self._moved, dest))
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            logging.warning("Sort cancelled; the items moved so far can be undone.")
+
+    def _by_category(self, folders: Counter, dest: Path) -> str:
+        """Item counts per destination folder, summed per top-level folder: ": Videos 120, Music 30"."""
+        categories: Counter = Counter()
+        for folder, count in folders.items():
+            try:
+                categories[Path(folder).relative_to(dest).parts[0]] += count
+            except (ValueError, IndexError):
+                categories[str(folder)] += count
+        return ": " + ", ".join(f"{name} {count}" for name, count in categories.most_common()) if categories else ""
 
-    def sort_directory(self, source_path: str, destination_path: str, dry_run: bool = False, series_mode: bool = False):
+    def _log_plan(self, plan: Plan):
+        if item_log.isEnabledFor(logging.INFO):
+            announced: Set[str] = set()
+            for src, dst, phase, note in zip(plan.src, plan.dst, plan.phase, plan.note):
+                folder = os.path.dirname(dst)
+                if phase == _PHASE_GROUP and folder not in announced:
+                    announced.add(folder)
+                    item_log.info("[DRY RUN] Would create group folder: %s", folder)
+                item_log.info("[DRY RUN] Would move %s -> %s%s", src, dst, f" ({note})" if note else "")
+        folders = Counter(os.path.dirname(dst) for dst in plan.dst)
+        logging.info("[DRY RUN] Would move %d item(s)%s; %d conflict(s).", len(plan),
+                     self._by_category(folders, Path(plan.dest)), sum(1 for note in plan.note if note))
+
+    def sort_directory(self, source_path: str, destination_path: str, dry_run: bool = False, series_mode: bool = False,
+                       fuzzy: Optional[bool] = None, dedup: Optional[str] = None) -> Optional[Plan]:
+        """
+        Sorts the items of 'source_path' into category and series folders
+        under 'destination_path'. Returns the Plan that was carried out; a
+        dry run changes nothing and returns the Plan for apply() to execute
+        later without scanning or classifying again. 'fuzzy' and 'dedup'
+        override the configured title matching and duplicate policy ("" turns
+        dedup off).
+        """
         source = Path(source_path)
         dest = Path(destination_path)
         if not source.exists():
             logging.error(f"Source path does not exist: {source_path}")
-            return
+            return None
 
         self.series_mode = series_mode
+        if fuzzy is not None:
+            self.fuzzy_grouping = fuzzy
+        if dedup is not None:
+            self.dedup_policy = self._check_dedup_policy(dedup)
 
         logging.info(f"Sorting from {source} to {dest} (dry_run={dry_run})")
         t0 = time.time()
-        all_items = self._scan_directory(source)
-
-        grouped_items = self._group_similar_items(all_items, dest, dry_run, group_files=True)
-        all_items = self._scan_directory(source)
-        remaining_items = [i for i in all_items if i not in grouped_items]
+        self._begin(dest)
+        try:
+            plan = self._build_plan(source, dest, index_all=dry_run)
+            if dry_run:
+                self._log_plan(plan)
+            else:
+                self._run_plan(plan, revalidate=False)
+        except OperationCancelled:
+            logging.warning("Sort cancelled before anything was moved.")
+            return None
+        finally:
+            self._finish(moved=not dry_run)
+        logging.info(f"Sorting complete in {time.time() - t0:.2f} seconds.")
+        return plan
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [executor.submit(self._sort_item, item, dest, dry_run) for item in remaining_items]
-            for future in futures:
-                future.result()
+    def sort_entries(self, entries: List[ScanEntry], destination_path: str, dry_run: bool = False) -> Plan:
+        """
+        Sorts only 'entries', all from the same folder, into
+        'destination_path' without scanning that folder. Used by watch mode
+        for batches of new arrivals. An item whose title matches a series
+        folder that already exists in the destination is moved into it.
+        A dry run only logs and returns the Plan.
+        """
+        dest = Path(destination_path)
+        source = entries[0].path.parent if entries else dest
+        if not entries:
+            return Plan("sort", str(source), str(dest))
+        t0 = time.time()
+        self._begin(dest, "sort_entries")
+        try:
+            plan = self._build_plan(source, dest, entries, index_all=dry_run)
+            if dry_run:
+                self._log_plan(plan)
+            else:
+                self._run_plan(plan, revalidate=False)
+        finally:
+            self._finish(moved=not dry_run)
+        if not dry_run:
+            logging.info(f"Sorted {len(plan)} new item(s) in {time.time() - t0:.2f} seconds.")
+        return plan
 
-        logging.info(f"Sorting complete in {time.time() - t0:.2f} seconds.")
+    def apply(self, plan: Plan) -> Plan:
+        """
+        Executes a plan returned by a dry run. Each source is stat'ed once;
+        only entries whose mtime or size changed since planning are
+        classified again, and vanished sources are skipped.
+        """
+        if plan.kind != "sort":
+            raise ValueError(f"Cannot apply a '{plan.kind}' plan with FileSorter")
+        logging.info(f"Applying plan: {len(plan)} moves from {plan.source} to {plan.dest}")
+        t0 = time.time()
+        self._begin(Path(plan.dest), "apply_sort")
+        try:
+            self._run_plan(plan, revalidate=True)
+        finally:
+            self._finish(moved=True)
+        logging.info(f"Plan applied in {time.time() - t0:.2f} seconds.")
+        return plan
 
-    def undo(self):
+    def undo(self, last: Optional[int] = None, session: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Moves sorted items back on the per-device lanes (see undo.py) and
+        removes the folders the sort created. By default this reverts what
+        this object sorted, or the most recent journaled sort when it has
+        sorted nothing yet (e.g. after a restart). 'last' limits the undo to
+        the N most recent moves and 'session' picks a journaled session.
+        Returns how many operations were reverted and how many were tried;
+        the others stay pending.
+        """
         logging.info("Initiating undo operation for sort...")
-        while self._history:
-            moved_path, original_path = self._history.pop()
-            if moved_path.exists():
-                try:
-                    original_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.move(str(moved_path), str(original_path))
-                    logging.info(f"Undo move: {moved_path} -> {original_path}")
-                except Exception as e:
-                    logging.error(f"Error undoing move {moved_path} -> {original_path}: {e}")
-            else:
-                logging.warning(f"File/folder missing: {moved_path}, cannot undo.")
-        logging.info("Undo operation finished.")
+        if self.journal is None or (self._history and session is None and last is None):
+            # What this object did itself is already in memory; no need to read the journal back.
+            ops = [op for op in self._history if session is None or op.session == session]
+            if last is not None:
+                ops = ops[-last:] if last > 0 else []
+        else:
+            ops = self.journal.pending(kind="sort", sessions=[session] if session else None, last=last)
+        with self._new_scheduler() as scheduler:
+            done = undo_operations(ops, self.journal, scheduler, self.mover)
+        self.record_undo(done)
+        logging.info("Undo operation finished: %d of %d operation(s) reverted.", len(done), len(ops))
+        return len(done), len(ops)
+
+    def record_undo(self, done: List[JournalOp]):
+        """Updates the file index and the history for operations undone by undo_operations()."""
+        if self.file_index:
+            self.file_index.record_undo(done)
+            self.file_index.flush()
+        undone = {(op.session, op.seq) for op in done}
+        with self._lock:
+            self._history = [op for op in self._history if (op.session, op.seq) not in undone]
@@ -0,0 +1,224 @@
+# stats.py
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Upper bounds (seconds) of the latency histogram buckets, as in Prometheus' defaults
+# extended down to 50 us: a same-disk rename takes tens of microseconds.
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets; quantiles are estimated from the bucket bounds."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last one is +Inf.
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the maximum for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"count": self.count, "sum": self.sum, "max": self.max, "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95), "p99": self.quantile(0.99), "buckets": buckets}
+
+
+class RunStats:
+    """
+    Instrumentation of one sort or rename run: wall time per phase, counters
+    and latency histograms, updated from any worker thread.
+
+    - phase("scan") is a context manager adding the time spent inside it to
+      that phase (phases may nest, e.g. "folder_sampling" inside "classify").
+    - count("collisions") / count("bytes_moved", n) add to a counter.
+    - observe("rename_seconds", dt) records one latency in a histogram.
+
+    FileSorter and Renamer keep the stats of their last run in 'last_stats';
+    to_dict() is what `main.py --stats json` prints; write_prometheus()
+    exports the runs for node_exporter's textfile collector.
+
+    Phases that run on worker threads ("mkdir", "same_device_rename", ...)
+    add up the time of every worker, so they can exceed the wall time.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.elapsed = 0.0
+        self.phases: Dict[str, float] = {}
+        self.phase_calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def timed(self, items: Iterable[T], name: str) -> Iterator[T]:
+        """Yields from 'items', adding the time spent producing each item (not consuming it) to phase 'name'."""
+        iterator = iter(items)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(name, time.perf_counter() - t0)
+            yield item
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float, phase: Optional[str] = None):
+        """Records one latency in histogram 'name' and, if given, adds it to 'phase' too."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            if phase is not None:
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+                self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+    def finish(self) -> "RunStats":
+        self.elapsed = time.perf_counter() - self._t0
+        return self
+
+    # ------------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------------
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "operation": self.operation,
+                "started": self.started,
+                "elapsed_s": self.elapsed or time.perf_counter() - self._t0,
+                "phases": {name: {"seconds": seconds, "calls": self.phase_calls[name]}
+                           for name, seconds in self.phases.items()},
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def summary(self) -> str:
+        """One line for the log: elapsed time, the phases by time spent, and the counters."""
+        data = self.to_dict()
+        phases = ", ".join(f"{name} {info['seconds']:.3f}s" for name, info in
+                           sorted(data["phases"].items(), key=lambda item: -item[1]["seconds"]))
+        counters = ", ".join(f"{name}={value}" for name, value in sorted(data["counters"].items()))
+        return f"{self.operation}: {data['elapsed_s']:.3f}s [{phases}] {counters}"
+
+    def to_prometheus(self, prefix: str = "kp_file_manager") -> str:
+        """The stats in the Prometheus text exposition format, labelled with the operation."""
+        return prometheus_text([self], prefix)
+
+
+def prometheus_text(runs: List[RunStats], prefix: str = "kp_file_manager") -> str:
+    """
+    Several runs (e.g. a sort and a rename) in one exposition: each metric is
+    described once, with one sample per run told apart by the "operation" label.
+    Of several runs of the same operation only the latest is exported, since
+    two samples with the same labels would make the whole file invalid.
+    """
+    metrics: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def add(metric: str, kind: str, help_text: str, sample: str):
+        metrics.setdefault(metric, (kind, help_text, []))[2].append(sample)
+
+    latest: Dict[str, RunStats] = {}
+    for run in runs:
+        if run.operation not in latest or run.started >= latest[run.operation].started:
+            latest[run.operation] = run
+    for run in latest.values():
+        data = run.to_dict()
+        label = f'operation="{run.operation}"'
+        add(f"{prefix}_run_seconds", "gauge", "Wall time of the last run.",
+            f"{prefix}_run_seconds{{{label}}} {data['elapsed_s']:.6f}")
+        add(f"{prefix}_run_timestamp_seconds", "gauge", "When the last run started.",
+            f"{prefix}_run_timestamp_seconds{{{label}}} {run.started:.3f}")
+        for name, info in sorted(data["phases"].items()):
+            add(f"{prefix}_phase_seconds", "gauge", "Time spent per phase in the last run, summed over threads.",
+                f'{prefix}_phase_seconds{{{label},phase="{name}"}} {info["seconds"]:.6f}')
+        for name, value in sorted(data["counters"].items()):
+            add(f"{prefix}_events", "gauge", "Counters of the last run (items, syscalls, collisions, bytes).",
+                f'{prefix}_events{{{label},counter="{name}"}} {value}')
+        for name, histogram in sorted(data["histograms"].items()):
+            metric = f"{prefix}_{name}"
+            samples = [f'{metric}_bucket{{{label},le="{bound:g}"}} {count}' for bound, count in histogram["buckets"]]
+            samples += [f'{metric}_bucket{{{label},le="+Inf"}} {histogram["count"]}',
+                        f"{metric}_sum{{{label}}} {histogram['sum']:.6f}",
+                        f"{metric}_count{{{label}}} {histogram['count']}"]
+            for sample in samples:
+                add(metric, "histogram", "Latency histogram of the last run.", sample)
+
+    lines: List[str] = []
+    for metric, (kind, help_text, samples) in metrics.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"] + samples
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str, runs: List[RunStats], prefix: str = "kp_file_manager"):
+    """
+    Writes prometheus_text() to 'path' (e.g. .../textfile_collector/kp_file_manager.prom)
+    atomically, so node_exporter's textfile collector never reads a half-written file.
+    The file is made world-readable: the collector usually runs as another user.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=folder, prefix=".kp-stats-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text(runs, prefix))
+        os.chmod(temp, 0o644)  # mkstemp() creates it readable by its owner only.
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,276 @@
+# tags.py
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from journal import JournalOp
+from utils import get_state_dir
+
+try:
+    from mutagen import MutagenError
+    from mutagen.easyid3 import EasyID3
+    from mutagen.easymp4 import EasyMP4
+    from mutagen.flac import FLAC
+    from mutagen.id3 import ID3NoHeaderError
+    from mutagen.oggvorbis import OggVorbis
+except ImportError:
+    EasyID3 = None
+
+SUPPORTED_EXTENSIONS = ["mp3", "flac", "ogg", "m4a"]
+TAG_CACHE_FILE = "tag_cache.sqlite"
+
+_FEATURING = re.compile(r"\s+(?:feat\.?|ft\.?|featuring)\s+|\s*;\s*", re.IGNORECASE)
+_FEATURING_IN_TITLE = re.compile(r"\((?:feat\.?|ft\.?|featuring)\s", re.IGNORECASE)
+_UNSAFE = str.maketrans({"/": "-", "\\": "-", ":": "-", "*": None, "?": None, '"': None, "<": None, ">": None,
+                         "|": None})
+
+
+class TrackTags(NamedTuple):
+    artists: Tuple[str, ...]
+    title: str
+    track: Optional[int]
+    album: str
+
+    def file_stem(self) -> str:
+        """
+        Builds "01. MainArtist - SongTitle (feat. OtherArtist)" from the tags,
+        leaving out what is missing. Returns "" without a title.
+        """
+        if not self.title:
+            return ""
+        artists: List[str] = []
+        for value in self.artists:
+            for name in _FEATURING.split(value):
+                if name and name not in artists:
+                    artists.append(name)
+        stem = self.title
+        if artists:
+            stem = f"{artists[0]} - {stem}"
+            featured = [name for name in artists[1:] if name not in self.title]
+            if featured and not _FEATURING_IN_TITLE.search(self.title):
+                stem += f" (feat. {', '.join(featured)})"
+        if self.track:
+            stem = f"{self.track:02d}. {stem}"
+        stem = " ".join(stem.translate(_UNSAFE).split())
+        return stem.rstrip(" .")
+
+
+NO_TAGS = TrackTags((), "", None, "")
+
+
+def _first(tags, key: str) -> str:
+    values = tags.get(key) or [""]
+    return str(values[0]).strip()
+
+
+def _load(path: str):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".mp3":
+        try:
+            return EasyID3(path)
+        except ID3NoHeaderError:
+            return {}
+    if suffix == ".flac":
+        return FLAC(path)
+    if suffix == ".ogg":
+        return OggVorbis(path)
+    if suffix in (".m4a", ".mp4"):
+        return EasyMP4(path)
+    return {}
+
+
+def read_tags(path: str) -> Optional[TrackTags]:
+    """
+    Reads the tags of one file, or returns None if it cannot be read. Each
+    format is opened through its tag reader only (ID3 frames, FLAC metadata
+    blocks, the Vorbis comment page, the MP4 'moov' atom), so the audio data
+    is never read. Runs in worker processes.
+    """
+    try:
+        tags = _load(path)
+    except (MutagenError, OSError):
+        return None
+    track = _first(tags, "tracknumber").split("/")[0]
+    return TrackTags(
+        tuple(str(value).strip() for value in tags.get("artist") or () if str(value).strip()),
+        _first(tags, "title"),
+        int(track) if track.isdigit() else None,
+        _first(tags, "album"),
+    )
+
+
+class TagCache:
+    """
+    SQLite cache of parsed tags, keyed by path and only trusted while the
+    file's size and mtime are unchanged. Renames done by Renamer (and their
+    undo) move the rows along, so a renamed library is still cached. Updates
+    are queued and written in one transaction by flush().
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                " path TEXT PRIMARY KEY, parent TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL,"
+                " artists TEXT NOT NULL, title TEXT NOT NULL, track INTEGER, album TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tags_parent ON tags (parent)")
+
+    def folder(self, folder: Path) -> Dict[str, Tuple[int, float, TrackTags]]:
+        """Returns {path: (size, mtime, tags)} for the files cached directly inside 'folder'."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime, artists, title, track, album FROM tags WHERE parent = ?",
+                (os.path.abspath(folder),),
+            ).fetchall()
+        return {path: (size, mtime, TrackTags(tuple(json.loads(artists)), title, track, album))
+                for path, size, mtime, artists, title, track, album in rows}
+
+    def store(self, path: Path, size: int, mtime: float, tags: TrackTags):
+        path_str = os.path.abspath(path)
+        row = (path_str, os.path.dirname(path_str), size, mtime, json.dumps(list(tags.artists)), tags.title,
+               tags.track, tags.album)
+        with self._lock:
+            self._pending.append(("store", row))
+
+    def move(self, old: Path, new: Path):
+        new_str = os.path.abspath(new)
+        with self._lock:
+            self._pending.append(("move", (new_str, os.path.dirname(new_str), os.path.abspath(old))))
+
+    def record_renames(self, ops: Iterable[JournalOp]):
+        """Follows journaled renames, given in the order they were done."""
+        for op in ops:
+            if op.op == "rename":
+                self.move(op.src, op.dst)
+
+    def record_undo(self, ops: Iterable[JournalOp]):
+        """Moves the rows of undone renames back to the original paths."""
+        for op in ops:
+            if op.op == "rename":
+                self.move(op.dst, op.src)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                with self._conn:
+                    for kind, row in pending:
+                        if kind == "store":
+                            self._conn.execute(
+                                "INSERT OR REPLACE INTO tags (path, parent, size, mtime, artists, title, track, album)"
+                                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                        else:
+                            self._conn.execute("DELETE FROM tags WHERE path = ?", row[:1])
+                            self._conn.execute("UPDATE tags SET path = ?, parent = ? WHERE path = ?", row)
+            except (sqlite3.Error, UnicodeEncodeError) as e:
+                logging.warning(f"Could not update tag cache {self.db_path}: {e}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+class TagReader:
+    """
+    Reads the tags of many files at once. Files whose size and mtime match
+    the cache are not opened at all. The rest are read on 'threads' threads,
+    or, from 'process_threshold' files on, in a process pool, since parsing
+    tags is pure Python and holds the GIL.
+    """
+
+    def __init__(self, cache: Optional[TagCache] = None, threads: int = 16, processes: Optional[int] = None,
+                 process_threshold: int = 1000):
+        self.cache = cache
+        self.threads = threads
+        self.processes = processes
+        self.process_threshold = process_threshold
+        self.cache_hits = 0
+        self.files_read = 0
+        self._warned = False
+
+    def read(self, paths: List[Path]) -> Dict[Path, TrackTags]:
+        """Returns {path: tags} for the given files; unreadable files are left out."""
+        if EasyID3 is None:
+            if not self._warned:
+                logging.warning("mutagen is not installed; music files are renamed without reading their tags.")
+                self._warned = True
+            return {}
+        result: Dict[Path, TrackTags] = {}
+        cached: Dict[Path, Dict[str, Tuple[int, float, TrackTags]]] = {}
+        misses: List[Tuple[Path, int, float]] = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                logging.warning(f"Could not read tags of {path}: {e}")
+                continue
+            known = None
+            if self.cache is not None:
+                folder = path.parent
+                if folder not in cached:
+                    cached[folder] = self.cache.folder(folder)
+                known = cached[folder].get(os.path.abspath(path))
+            if known is not None and known[:2] == (st.st_size, st.st_mtime):
+                result[path] = known[2]
+            else:
+                misses.append((path, st.st_size, st.st_mtime))
+        self.cache_hits += len(result)
+
+        for (path, size, mtime), tags in zip(misses, self._read_all([str(path) for path, _, _ in misses])):
+            if tags is None:
+                logging.warning(f"Could not read tags of {path}.")
+                continue
+            result[path] = tags
+            if self.cache is not None:
+                self.cache.store(path, size, mtime, tags)
+        self.files_read += len(misses)
+        if self.cache is not None:
+            self.cache.flush()
+        logging.debug(f"Tags of {len(paths)} file(s): {len(paths) - len(misses)} from cache, {len(misses)} read.")
+        return result
+
+    def _read_all(self, paths: List[str]) -> List[Optional[TrackTags]]:
+        if len(paths) < self.process_threshold:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                return self._map(pool, paths)
+        try:
+            with ProcessPoolExecutor(max_workers=self.processes or os.cpu_count() or 1) as pool:
+                return self._map(pool, paths, chunksize=64)
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            logging.info(f"Reading tags on threads instead of processes: {e}")
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                return self._map(pool, paths)
+
+    def _map(self, pool: Executor, paths: List[str], chunksize: int = 1) -> List[Optional[TrackTags]]:
+        return list(pool.map(read_tags, paths, chunksize=chunksize))
+
+
+_caches: Dict[Path, TagCache] = {}
+_caches_lock = threading.Lock()
+
+
+def open_tag_cache(path: Optional[Path] = None) -> TagCache:
+    """Returns the process-wide TagCache for 'path' (default: the state directory's cache)."""
+    path = Path(path) if path else get_state_dir() / TAG_CACHE_FILE
+    key = path.resolve()
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = TagCache(path)
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,211 @@
+# templates.py
+import logging
+import os
+import string
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from tags import TagReader, TrackTags
+
+# Field -> the metadata it needs: "path" fields are free, the others are fetched per batch.
+FIELDS: Dict[str, str] = {
+    "n": "path", "name": "path", "ext": "path", "parent": "path",
+    "size": "stat", "mtime": "stat", "ctime": "stat", "atime": "stat",
+    "id3.artist": "tags", "id3.title": "tags", "id3.album": "tags", "id3.track": "tags",
+    "img.width": "image", "img.height": "image",
+}
+_DATE_FORMAT = "%Y-%m-%d"
+_DATES = {"mtime", "ctime", "atime"}
+_NUMBERS = {"n", "size", "id3.track", "img.width", "img.height"}
+# A value of each field's type, formatted once per field to check its spec when the template is built.
+_SAMPLE_DATE = datetime(2000, 1, 2, 3, 4, 5)
+_UNSAFE = str.maketrans({"/": "-", "\\": "-", ":": "-", "*": None, "?": None, '"': None, "<": None, ">": None,
+                         "|": None, "\0": None})
+
+
+class NameTemplate:
+    """
+    A file name template such as "{mtime:%Y-%m-%d}_{n:04}_{parent}{ext}" or
+    "{id3.artist} - {id3.title}{ext}", compiled once.
+
+    Fields (see FIELDS) take a format spec after ':' as in str.format();
+    dates default to "%Y-%m-%d". Rendering a batch only gathers the metadata
+    the template references: one stat() per file for size and dates, tags
+    through a TagReader (parallel and cached), and image dimensions from the
+    first bytes of each file, on threads. A file without the tags or image
+    size the template uses gets no name (""), so it is left alone rather than
+    renamed to " - .mp3". Characters that are not allowed in file names are
+    removed from field values.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts: List[Tuple[str, Optional[str], str]] = []  # (literal text, field, format spec)
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError(f"Invalid name template '{template}': {e}") from None
+        for literal, field, spec, conversion in parsed:
+            if "/" in literal or os.sep in literal:
+                raise ValueError(f"Name template '{template}' must not contain path separators")
+            if field is None:
+                self._parts.append((literal, None, ""))
+                continue
+            if field not in FIELDS:
+                raise ValueError(f"Unknown field '{{{field}}}' in name template; known fields: {', '.join(FIELDS)}")
+            if conversion or "{" in (spec or ""):
+                raise ValueError(f"Unsupported field '{{{field}}}' in name template: no conversions or nested fields")
+            if not spec and field in _DATES:
+                spec = _DATE_FORMAT
+            self._check_spec(field, spec or "")
+            self._parts.append((literal, field, spec or ""))
+        self.needs: Set[str] = {FIELDS[field] for _, field, _ in self._parts if field is not None} - {"path"}
+
+    def _check_spec(self, field: str, spec: str):
+        # Otherwise a bad spec would only fail halfway through a rename, or, for dates,
+        # silently give every file the same name ("{mtime:04}" is just "04").
+        if field in _DATES:
+            if "%" not in spec:
+                raise ValueError(f"Invalid format '{spec}' for '{{{field}}}' in name template: "
+                                 f"dates need strftime directives such as %Y")
+            sample: object = _SAMPLE_DATE
+        else:
+            sample = 1 if field in _NUMBERS else "x"
+        try:
+            format(sample, spec)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid format '{spec}' for '{{{field}}}' in name template: {e}") from None
+
+    def render(self, values: Dict[str, object]) -> str:
+        """Formats one name from {field: value}; missing or None values render as ""."""
+        pieces = []
+        for literal, field, spec in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                value = values.get(field)
+                if value is not None and value != "":
+                    pieces.append(format(value, spec).translate(_UNSAFE))
+        return "".join(pieces).strip()
+
+    def render_batch(self, paths: Sequence[Path], numbers: Sequence[int],
+                     tag_reader: Optional[TagReader] = None, threads: int = 16) -> List[str]:
+        """Returns the new name of each of 'paths', numbered with 'numbers' ("" where metadata is missing)."""
+        stats: List[Optional[os.stat_result]] = [None] * len(paths)
+        if "stat" in self.needs:
+            for i, path in enumerate(paths):
+                try:
+                    stats[i] = os.stat(path)
+                except OSError as e:
+                    logging.warning(f"Could not stat {path}: {e}")
+        tags: Dict[Path, TrackTags] = {}
+        if "tags" in self.needs and tag_reader is not None:
+            tags = tag_reader.read(list(paths))
+        sizes: List[Optional[Tuple[int, int]]] = [None] * len(paths)
+        if "image" in self.needs:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                sizes = list(pool.map(image_size, paths))
+
+        names = []
+        for i, (path, number) in enumerate(zip(paths, numbers)):
+            values: Dict[str, object] = {"n": number, "name": path.stem, "ext": path.suffix,
+                                         "parent": path.parent.name}
+            st = stats[i]
+            if st is not None:
+                values.update(size=st.st_size, mtime=datetime.fromtimestamp(st.st_mtime),
+                              ctime=datetime.fromtimestamp(st.st_ctime), atime=datetime.fromtimestamp(st.st_atime))
+            track = tags.get(path)
+            if "tags" in self.needs and (track is None or not track.title):
+                names.append("")
+                continue
+            if "image" in self.needs and sizes[i] is None:
+                names.append("")
+                continue
+            if track is not None:
+                values.update({"id3.artist": track.artists[0] if track.artists else "", "id3.title": track.title,
+                               "id3.album": track.album, "id3.track": track.track})
+            if sizes[i] is not None:
+                values["img.width"], values["img.height"] = sizes[i]  # type: ignore
+            names.append(self.render(values))
+        return names
+
+
+# ----------------------------------------------------------------------
+# Image dimensions from the file header (PNG, GIF, BMP, WebP, JPEG)
+# ----------------------------------------------------------------------
+def image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """Returns (width, height) read from the image header, or None if it is not a known image format."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            for reader in _HEADER_READERS:
+                size = reader(head, f)
+                if size is not None:
+                    return size
+    except (OSError, struct.error, IndexError):
+        pass  # Unreadable or truncated.
+    return None
+
+
+def _png_size(head: bytes, f) -> Optional[Tuple[int, int]]:
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    return None
+
+
+def _gif_size(head: bytes, f) -> Optional[Tuple[int, int]]:
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+    return None
+
+
+def _bmp_size(head: bytes, f) -> Optional[Tuple[int, int]]:
+    if head[:2] == b"BM" and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return width, abs(height)
+    return None
+
+
+def _webp_size(head: bytes, f) -> Optional[Tuple[int, int]]:
+    if head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return None
+
+
+def _jpeg_size(head: bytes, f) -> Optional[Tuple[int, int]]:
+    if head[:2] != b"\xff\xd8":
+        return None
+    # Walk the segments up to the first start-of-frame marker; its header holds the size.
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:  # Fill bytes.
+            marker = marker[1:] + f.read(1)
+        code = marker[1]
+        if code in (0xD9, 0xDA):
+            return None  # End of image, or image data, before any frame header.
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue  # Markers without a length.
+        length = struct.unpack(">H", f.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+_HEADER_READERS: List[Callable[[bytes, object], Optional[Tuple[int, int]]]] = [
+    _png_size, _gif_size, _bmp_size, _webp_size, _jpeg_size,
+]
@@ -0,0 +1,59 @@
+# title_parser.py
+import os
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional
+
+DEFAULT_BLACKLIST: FrozenSet[str] = frozenset({
+    "season", "episode", "ep", "e", "s", "part", "complete", "final", "finale",
+    "brrip", "webrip", "hdrip", "bluray", "x264", "x265", "1080p", "720p", "galaxytv",
+    "sujaidr", "xvid", "afg", "web", "rip", "brip", "dvdrip", "cam", "hd", "uhd",
+    "yify", "hdtv", "memento", "aac", "hevc", "ac3", "amzn", "dl", "subs", "internal",
+    "10bit", "5.1", "esubs", "mp4", "mkv", "tgx", "nf"
+})
+
+# Bracketed groups ("[720p]", "(2019)") and any unclosed bracket up to the end of the name.
+_BRACKETS_RE = re.compile(r"[\[\(\{].*?[\]\)\}]|[\[\(\{].*")
+# One tokenizer: words are runs of anything that is not whitespace or a separator.
+_TOKEN_RE = re.compile(r"[^\s.\\/_-]+")
+# Numbers, years, S01E02 / S01 / E02 markers and "season1".
+_NOISE_TOKEN_RE = re.compile(r"\d+|(?:19|20)\d{2}|s\d{1,2}e\d{1,2}|[se]\d{1,2}|season\d{1,2}", re.IGNORECASE)
+
+
+class TitleParser:
+    """
+    Extracts a series/movie title from a file or folder name, e.g.
+    "Show.Name.S01E02.720p.WEBRip.mkv" -> "Show Name".
+
+    Results are memoized per stem, so the thousands of episodes of one show
+    only pay for the regex work once per distinct stem.
+    """
+
+    def __init__(self, extra_blacklist: Optional[Iterable[str]] = None, cache_size: int = 65536):
+        blacklist = set(DEFAULT_BLACKLIST)
+        if extra_blacklist:
+            blacklist.update(token.lower() for token in extra_blacklist)
+        self.blacklist: FrozenSet[str] = frozenset(blacklist)
+        self._parse_stem = lru_cache(maxsize=cache_size)(self._parse_stem_uncached)
+
+    def _parse_stem_uncached(self, stem: str) -> str:
+        name = _BRACKETS_RE.sub("", stem.lower())
+        blacklist = self.blacklist
+        noise = _NOISE_TOKEN_RE.fullmatch
+        tokens = [t for t in _TOKEN_RE.findall(name) if t not in blacklist and not noise(t)]
+        return " ".join(tokens).title()
+
+    def extract(self, name: str) -> str:
+        return self._parse_stem(os.path.splitext(name)[0])
+
+    def extract_many(self, names: Iterable[str]) -> Dict[str, str]:
+        """
+        Parses a whole directory listing at once and returns {name: title}.
+        Each distinct stem is parsed only once.
+        """
+        parse = self._parse_stem
+        splitext = os.path.splitext
+        return {name: parse(splitext(name)[0]) for name in names}
+
+    def clear_cache(self):
+        self._parse_stem.cache_clear()
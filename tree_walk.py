@@ -0,0 +1,79 @@
+# tree_walk.py
+import hashlib
+import logging
+import os
+import secrets
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+def walk_files(root: Path, select: Callable[[str], bool], recursive: bool = True) -> Iterator[Tuple[Path, List[str]]]:
+    """
+    Yields (folder, names) for 'root' and, if 'recursive', every folder below
+    it, depth first, with the names of the files 'select' accepts, sorted.
+    Only one folder's names are held at a time, plus the paths of the folders
+    still to visit, so memory does not grow with the size of the tree.
+    Symlinked folders are not followed; unreadable folders are logged and
+    skipped.
+    """
+    pending = [str(root)]
+    while pending:
+        folder = pending.pop()
+        names: List[str] = []
+        subfolders: List[str] = []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                        elif entry.is_file() and select(entry.name):
+                            names.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"Skipping folder {folder}: {e}")
+            continue
+        pending.extend(sorted(subfolders, reverse=True))
+        if names:
+            names.sort()
+            yield Path(folder), names
+
+
+class RandomPermutation:
+    """
+    A random order of range(n) that is computed, not stored: perm(i) gives
+    the i-th number, and distinct i give distinct numbers. It is a small
+    Feistel network over the smallest even-bit domain that holds n, with
+    cycle-walking for values that fall outside range(n), so scrambled
+    numbering of millions of files needs no list of numbers in memory.
+    """
+
+    _ROUNDS = 4
+
+    def __init__(self, n: int, seed: Optional[bytes] = None):
+        if n <= 0:
+            raise ValueError("RandomPermutation needs n > 0")
+        self.n = n
+        half_bits = max(1, ((n - 1).bit_length() + 1) // 2)
+        self._half_bits = half_bits
+        self._mask = (1 << half_bits) - 1
+        seed = seed if seed is not None else secrets.token_bytes(16)
+        self._keys = [int.from_bytes(hashlib.blake2b(seed + bytes([r]), digest_size=8).digest(), "big")
+                      for r in range(self._ROUNDS)]
+
+    def __call__(self, i: int) -> int:
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        value = self._encrypt(i)
+        while value >= self.n:
+            value = self._encrypt(value)
+        return value
+
+    def _encrypt(self, value: int) -> int:
+        mask, bits = self._mask, self._half_bits
+        left, right = value >> bits, value & mask
+        for key in self._keys:
+            mixed = ((right ^ key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+            left, right = right, left ^ ((mixed ^ (mixed >> 29)) & mask)
+        return (left << bits) | right
@@ -0,0 +1,234 @@
+# undo.py
+import errno
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from io_scheduler import IOScheduler
+from journal import Journal, JournalOp
+from log_sink import item_log
+from move_engine import CrossDeviceMover
+from placement import rename_noreplace
+from scanner import device_of
+
+
+def _dependencies(moves: List[JournalOp]) -> List[Set[int]]:
+    """
+    For 'moves' in undo order (newest first), returns for each one the
+    indices of the moves that have to be undone before it: every newer move
+    that touched the same path, a folder above it, or anything inside it.
+    This covers chained renames (a -> b then b -> c), names that were reused
+    (a -> b then c -> a), and folders that must be put back before their
+    contents (or emptied before they are moved back). Independent moves
+    share no edge and can run in parallel.
+    """
+    pairs = [(str(op.src), str(op.dst)) for op in moves]
+    # Items share a handful of parent folders, so each folder's chain of
+    # ancestors is computed once.
+    chains: Dict[str, Tuple[str, ...]] = {}
+
+    def ancestors(path: str) -> Tuple[str, ...]:
+        head, sep, _ = path.rpartition(os.sep)
+        parent = head or sep
+        chain = chains.get(parent)
+        if chain is None:
+            chain = () if parent == path else (parent,) + ancestors(parent)
+            chains[parent] = chain
+        return chain
+
+    last_touch: Dict[str, int] = {}
+    under: Dict[str, List[int]] = {}
+    deps: List[Set[int]] = []
+    for k, (src, dst) in enumerate(pairs):
+        paths = (src,) if src == dst else (src, dst)
+        wait: Set[int] = set()
+        for p in paths:
+            if p in last_touch:
+                wait.add(last_touch[p])
+            if p in under:
+                wait.update(under.pop(p))  # Whatever was below 'p' is reached through 'k' from now on.
+            for a in ancestors(p):
+                if a in last_touch:
+                    wait.add(last_touch[a])
+                under.setdefault(a, []).append(k)
+            last_touch[p] = k
+        deps.append(wait)
+    return deps
+
+
+def _separate(op: JournalOp) -> bool:
+    """
+    Undoes a "hardlink" op: 'op.src' was a duplicate of 'op.dst' that dedup
+    replaced with a hard link to it. Once the link is back at 'op.src', it
+    becomes a file of its own again, with the same content and the times
+    the duplicate had.
+    """
+    temp = op.src.with_name(f".{op.src.name}.kpcopy")
+    try:
+        if os.lstat(op.src).st_nlink > 1:
+            shutil.copy2(op.src, temp)
+            if op.times:
+                os.utime(temp, op.times)
+            os.replace(temp, op.src)
+    except OSError as e:
+        logging.error(f"Cannot undo the hard link of {op.src}: {e}")
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        return False
+    item_log.info("Undo hard link: %s", op.src)
+    return True
+
+
+def _revert(op: JournalOp, mover: CrossDeviceMover) -> bool:
+    if op.op == "hardlink":
+        return _separate(op)
+    try:
+        try:
+            rename_noreplace(op.dst, op.src)
+        except FileNotFoundError:
+            if not os.path.lexists(op.dst):
+                logging.warning(f"File/folder missing: {op.dst}, cannot undo.")
+                return False
+            op.src.parent.mkdir(parents=True, exist_ok=True)
+            rename_noreplace(op.dst, op.src)
+    except FileExistsError:
+        logging.error(f"Cannot undo {op.op} {op.dst} -> {op.src}: the original path is taken.")
+        return False
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            logging.error(f"Error undoing {op.op} {op.dst} -> {op.src}: {e}")
+            return False
+        try:
+            mover.move(op.dst, op.src)
+        except Exception as e:
+            logging.error(f"Error undoing {op.op} {op.dst} -> {op.src}: {e}")
+            return False
+    if op.times:
+        try:
+            os.utime(op.src, op.times)
+        except OSError as e:
+            logging.warning(f"Could not restore timestamps of {op.src}: {e}")
+    if op.op == "rename":
+        item_log.info("Undo rename: %s -> %s", op.dst.name, op.src.name)
+    else:
+        item_log.info("Undo move: %s -> %s", op.dst, op.src)
+    return True
+
+
+def _prune_created_dirs(made_dirs: List[JournalOp]) -> List[JournalOp]:
+    """
+    Single bottom-up pass removing the folders a session created, if they
+    ended up empty. Returns the ops of the folders that are gone; a folder
+    that is kept stays pending, so a later undo can still remove it.
+    """
+    removed = []
+    for op in sorted(made_dirs, key=lambda op: len(op.dst.parts), reverse=True):
+        try:
+            os.rmdir(op.dst)
+            item_log.info("Removed empty folder: %s", op.dst)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                item_log.info("Kept folder %s: it is not empty.", op.dst)
+            else:
+                logging.warning(f"Could not remove {op.dst}: {e}")
+            continue
+        removed.append(op)
+    return removed
+
+
+def undo_operations(ops: List[JournalOp], journal: Optional[Journal] = None, scheduler: Optional[IOScheduler] = None,
+                    mover: Optional[CrossDeviceMover] = None) -> List[JournalOp]:
+    """
+    Reverts 'ops' (given oldest first) and returns the ones that were undone.
+
+    Moves and renames run on 'scheduler', the same per-device lanes used to
+    perform them, in dependency order rather than one at a time: a move
+    starts as soon as every newer move it depends on has been reverted.
+    Nothing is overwritten; an original path that is taken again is logged
+    and skipped, and so is everything that depends on a move that could not
+    be reverted. Folders the session created are removed afterwards, in one
+    bottom-up pass, if they are empty. Undone operations are marked in
+    'journal' so they are not reverted twice; skipped ones and kept folders
+    stay pending.
+    """
+    moves = [op for op in reversed(ops) if op.op != "mkdir"]
+    made_dirs = [op for op in ops if op.op == "mkdir"]
+    deps = _dependencies(moves)
+    dependents: List[List[int]] = [[] for _ in moves]
+    for k, wait in enumerate(deps):
+        for j in wait:
+            dependents[j].append(k)
+    remaining = [len(wait) for wait in deps]
+    results: List[bool] = [False] * len(moves)
+    blocked: List[bool] = [False] * len(moves)  # A move it depends on failed or was skipped.
+
+    own_scheduler = scheduler is None
+    scheduler = scheduler or IOScheduler()
+    mover = mover or CrossDeviceMover()
+    lock = threading.Lock()
+    finished = threading.Event()
+    outstanding = len(moves)
+    devices: Dict[Path, int] = {}
+
+    def device(folder: Path) -> int:
+        dev = devices.get(folder)
+        if dev is None:
+            dev = devices[folder] = device_of(folder)
+        return dev
+
+    def submit(k: int):
+        op = moves[k]
+        future = scheduler.submit((device(op.dst.parent), device(op.src.parent)), _revert, op, mover)  # type: ignore
+        future.add_done_callback(lambda f: complete(k, f))
+
+    def complete(k: int, future: Future):
+        nonlocal outstanding
+        ok = future.exception() is None and bool(future.result())
+        ready = []
+        settled = [(k, ok)]
+        with lock:
+            while settled:
+                k, ok = settled.pop()
+                results[k] = ok
+                for j in dependents[k]:
+                    remaining[j] -= 1
+                    blocked[j] = blocked[j] or not ok
+                    if remaining[j] == 0:
+                        if blocked[j]:
+                            settled.append((j, False))  # Left pending, and so is everything that waits for it.
+                        else:
+                            ready.append(j)
+                outstanding -= 1
+            if outstanding == 0:
+                finished.set()
+        for j in ready:
+            submit(j)
+
+    try:
+        if moves:
+            for k in [k for k, count in enumerate(remaining) if count == 0]:
+                submit(k)
+            finished.wait()
+    finally:
+        if own_scheduler:
+            scheduler.shutdown(wait=True)
+    mover.flush()
+    skipped = sum(blocked)
+    if skipped:
+        logging.warning(f"Skipped {skipped} operation(s) that depend on one that could not be undone; "
+                        f"they stay pending.")
+    removed = _prune_created_dirs(made_dirs)
+
+    done = [op for op, ok in zip(moves, results) if ok] + removed
+    if journal is not None and done:
+        journal.mark_undone(done)
+        journal.flush()
+    return done
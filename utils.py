@@ -1,6 +1,21 @@
 import functools
 import logging
+import os
+import threading
 import time
+from pathlib import Path
+from typing import Callable, Optional
+
+STATE_DIR_ENV = "KP_FILE_MANAGER_HOME"
+
+def get_state_dir() -> Path:
+    """
+    Directory for caches, indexes and journals that must survive restarts.
+    Defaults to ~/.kp_file_manager and can be moved with $KP_FILE_MANAGER_HOME.
+    """
+    state_dir = Path(os.environ.get(STATE_DIR_ENV) or Path.home() / ".kp_file_manager")
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return state_dir
 
 def cache_result(func):
     """
@@ -43,3 +58,92 @@ def retry_on_exception(retries=3, delay=1):
             raise
         return wrapper
     return decorator
+
+class OperationCancelled(Exception):
+    """Raised where a cancelled operation stops before its next item."""
+
+class CancelToken:
+    """
+    Cooperative cancellation shared between the UI and a running operation.
+    FileSorter and Renamer check it between items and stop starting new ones;
+    items already in flight finish and are journaled, so a cancelled run
+    leaves a consistent state that undo can revert.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """Raises OperationCancelled once cancel() was called."""
+        if self._event.is_set():
+            raise OperationCancelled()
+
+class Progress:
+    """
+    Progress counters of one operation (items scanned, items moved or renamed,
+    bytes moved), updated from any worker thread. 'callback' gets a snapshot
+    at most every 'interval' seconds, so a million tiny moves do not flood the
+    UI with updates; finish() always sends the last one.
+    """
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None, interval: float = 0.1):
+        self.callback = callback
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_emit = 0.0
+        self.phase = ""
+        self.scanned = 0
+        self.done = 0
+        self.total = 0
+        self.bytes = 0
+        self.total_bytes = 0
+
+    def start(self, phase: str, total: int = 0, total_bytes: int = 0):
+        """Begins a phase ("scanning", "moving", ...); the ETA is measured from here."""
+        with self._lock:
+            self.phase = phase
+            self.done = 0
+            self.bytes = 0
+            self.total = total
+            self.total_bytes = total_bytes
+            self._started = time.monotonic()
+        self._emit(force=True)
+
+    def add(self, scanned: int = 0, done: int = 0, nbytes: int = 0, total: int = 0):
+        with self._lock:
+            self.scanned += scanned
+            self.done += done
+            self.bytes += nbytes
+            self.total += total
+        self._emit()
+
+    def finish(self):
+        self._emit(force=True)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            eta = None
+            if self.total_bytes and self.bytes:
+                eta = elapsed * (self.total_bytes - self.bytes) / self.bytes
+            elif self.total and self.done:
+                eta = elapsed * (self.total - self.done) / self.done
+            return {"phase": self.phase, "scanned": self.scanned, "done": self.done, "total": self.total,
+                    "bytes": self.bytes, "total_bytes": self.total_bytes, "elapsed": elapsed,
+                    "eta": max(eta, 0.0) if eta is not None else None}
+
+    def _emit(self, force: bool = False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_emit < self.interval:
+                return
+            self._last_emit = now
+        self.callback(self.snapshot())
@@ -0,0 +1,291 @@
+# watch.py
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from plan import Plan
+from scanner import ScanEntry, entry_from_path
+
+# inotify(7) constants.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+               | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Events, as reported by both event sources.
+CREATED = "created"      # A new name appeared; its content may still be written.
+WRITTEN = "written"      # A writer closed it: complete.
+MOVED_IN = "moved_in"    # Renamed into the folder: complete.
+REMOVED = "removed"      # Deleted or moved away.
+OVERFLOW = "overflow"    # Events were lost; the folder has to be scanned again.
+GONE = "gone"            # The watched folder itself was deleted or moved.
+
+# Names used by browsers and downloaders while a file is still incomplete.
+TEMP_SUFFIXES = (".part", ".partial", ".crdownload", ".download", ".tmp", ".!qb", ".opdownload")
+
+Event = Tuple[str, str]
+
+
+class _InotifySource:
+    """Events for one folder from Linux inotify, read straight from the kernel via ctypes."""
+
+    def __init__(self, folder: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        if libc.inotify_add_watch(self._fd, os.fsencode(str(folder)), _WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, os.strerror(err), str(folder))
+
+    def read(self, timeout: float) -> List[Event]:
+        readable, _, _ = select.select([self._fd], [], [], max(timeout, 0.0))
+        if not readable:
+            return []
+        events: List[Event] = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    events.append((OVERFLOW, ""))
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    events.append((GONE, ""))
+                elif mask & IN_CLOSE_WRITE:
+                    events.append((WRITTEN, name))
+                elif mask & IN_MOVED_TO:
+                    events.append((MOVED_IN, name))
+                elif mask & IN_CREATE:
+                    events.append((CREATED, name))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append((REMOVED, name))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingSource:
+    """
+    Fallback for systems without inotify. Only the folder itself is stat'ed
+    on every tick; it is listed again only when its mtime changed (or changed
+    so recently that a coarse timestamp could hide a second change).
+    """
+
+    def __init__(self, folder: Path, interval: float):
+        self.folder = folder
+        self.interval = interval
+        self._mtime_ns = os.stat(folder).st_mtime_ns
+        self._names: Set[str] = set(os.listdir(folder))
+
+    def read(self, timeout: float) -> List[Event]:
+        time.sleep(max(min(timeout, self.interval), 0.0))
+        try:
+            mtime_ns = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return [(GONE, "")]
+        if mtime_ns == self._mtime_ns and time.time() - mtime_ns / 1e9 > 2.0:
+            return []
+        self._mtime_ns = mtime_ns
+        names = set(os.listdir(self.folder))
+        events = [(CREATED, name) for name in names - self._names]
+        events += [(REMOVED, name) for name in self._names - names]
+        self._names = names
+        return events
+
+    def close(self):
+        pass
+
+
+class FolderWatcher:
+    """
+    Keeps 'source_path' sorted: after one initial sort, every new arrival is
+    classified and moved into 'destination_path' as it comes in, without
+    scanning the folder again.
+
+    A file counts as complete when its writer closes it, when it is renamed
+    into the folder, or, for other arrivals (e.g. folders copied in, or with
+    the polling fallback), once its size and mtime have not changed for
+    'settle' seconds. Temporary download names are left alone until they are
+    renamed. Complete arrivals are collected for 'batch_window' seconds and
+    sorted together in one micro-sort, each with its own undoable session.
+    With 'dry_run' every sort is only planned and logged; nothing is moved.
+    """
+
+    def __init__(self, sorter, source_path: str, destination_path: str, settle: float = 0.5,
+                 batch_window: float = 0.2, poll_interval: float = 0.5, use_inotify: bool = True,
+                 dry_run: bool = False):
+        self.sorter = sorter
+        self.source = Path(source_path)
+        self.dest = Path(destination_path)
+        self.settle = settle
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.dry_run = dry_run
+        self.sorted_count = 0
+        self._pending: Dict[str, Tuple[int, int, float]] = {}   # name -> (size, mtime_ns, last change)
+        self._ready: Dict[str, None] = {}                       # names in arrival order
+        self._batch_deadline: Optional[float] = None
+        self._own: Set[str] = set()
+        self._in_place = False
+
+    def run(self, stop: Optional[threading.Event] = None):
+        """Watches until 'stop' is set (or forever) or the source folder disappears."""
+        stop = stop or threading.Event()
+        if not self.dry_run:
+            self.dest.mkdir(parents=True, exist_ok=True)
+        self._in_place = self.dest.exists() and os.path.samefile(self.source, self.dest)
+        source = self._open_source()
+        try:
+            self._full_sort()
+            logging.info(f"Watching {self.source} for new files (sorting into {self.dest})...")
+            while not stop.is_set():
+                for kind, name in source.read(self._timeout()):
+                    if kind == GONE:
+                        logging.error(f"Stopped watching: {self.source} was removed or moved.")
+                        return
+                    if kind == OVERFLOW:
+                        logging.warning("Too many changes at once; sorting the whole folder again.")
+                        self._pending.clear()
+                        self._ready.clear()
+                        self._full_sort()
+                        continue
+                    self._on_event(kind, name)
+                self._check_pending()
+                if self._ready and time.monotonic() >= self._batch_deadline:  # type: ignore
+                    self._sort_ready()
+        finally:
+            source.close()
+
+    def _open_source(self):
+        if self.use_inotify:
+            try:
+                return _InotifySource(self.source)
+            except (AttributeError, OSError) as e:
+                logging.info(f"inotify unavailable ({e}); polling {self.source} every {self.poll_interval}s instead.")
+        return _PollingSource(self.source, self.poll_interval)
+
+    def _timeout(self) -> float:
+        now = time.monotonic()
+        deadlines = [self.poll_interval]
+        if self._ready:
+            deadlines.append(self._batch_deadline - now)  # type: ignore
+        if self._pending:
+            deadlines.append(min(changed for _, _, changed in self._pending.values()) + self.settle - now)
+        return max(min(deadlines), 0.0)
+
+    def _ignored(self, name: str) -> bool:
+        if name.lower().endswith(TEMP_SUFFIXES):
+            return True
+        # When sorting in place, the category and series folders live next to the arrivals.
+        return self._in_place and (name in self.sorter.reserved_folders or name in self._own)
+
+    def _on_event(self, kind: str, name: str):
+        if kind == REMOVED:
+            self._pending.pop(name, None)
+            self._ready.pop(name, None)
+            self._own.discard(name)
+            return
+        if self._ignored(name):
+            return
+        if kind == CREATED:
+            if name not in self._ready:
+                self._pending[name] = (-1, -1, time.monotonic())
+        else:
+            self._pending.pop(name, None)
+            self._mark_ready(name)
+
+    def _mark_ready(self, name: str):
+        if not self._ready:
+            self._batch_deadline = time.monotonic() + self.batch_window
+        self._ready[name] = None
+
+    def _check_pending(self):
+        # Only the arrivals still being written are stat'ed, never the whole folder.
+        now = time.monotonic()
+        for name, (size, mtime_ns, changed) in list(self._pending.items()):
+            try:
+                st = os.stat(self.source / name)
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[name] = (st.st_size, st.st_mtime_ns, now)
+            elif now - changed >= self.settle:
+                del self._pending[name]
+                self._mark_ready(name)
+
+    def _sort_ready(self):
+        names, self._ready = list(self._ready), {}
+        entries: List[ScanEntry] = []
+        for name in names:
+            try:
+                entries.append(entry_from_path(self.source / name))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.warning(f"Skipping {name}: {e}")
+        if not entries:
+            return
+        try:
+            plan = self.sorter.sort_entries(entries, str(self.dest), dry_run=self.dry_run)
+        except Exception as e:
+            logging.error(f"Error sorting {len(entries)} new item(s): {e}")
+            return
+        self.sorted_count += len(plan)
+        self._remember_own(plan)
+
+    def _full_sort(self):
+        plan = self.sorter.sort_directory(str(self.source), str(self.dest), dry_run=self.dry_run)
+        if plan is not None:
+            self._remember_own(plan)
+
+    def _remember_own(self, plan: Plan):
+        # Folders the sort created inside the source must not be taken for arrivals.
+        if not self._in_place or self.dry_run:
+            return
+        for dst in plan.dst:
+            folder = os.path.dirname(dst)
+            if os.path.dirname(folder) == str(self.dest):
+                self._own.add(os.path.basename(folder))
+            elif folder == str(self.dest):
+                self._own.add(os.path.basename(dst))
+
+
+def watch_directory(sorter, source_path: str, destination_path: str, stop: Optional[threading.Event] = None,
+                    **options) -> FolderWatcher:
+    """Runs a FolderWatcher until 'stop' is set or Ctrl+C is pressed, and returns it."""
+    watcher = FolderWatcher(sorter, source_path, destination_path, **options)
+    try:
+        watcher.run(stop)
+    except KeyboardInterrupt:
+        pass
+    done = "planned" if watcher.dry_run else "sorted"
+    logging.info(f"Stopped watching {source_path}: {watcher.sorted_count} new item(s) {done}.")
+    return watcher